@@ -38,6 +38,7 @@
           'views/delivery_views.xml',
           'views/stock_views.xml',
           'views/account_payment_mode_views.xml',
+          'views/magento_api_stat_views.xml',
           'wizards/magento_binding_backend_read.xml',
           ],
  'installable': True,
@@ -2,14 +2,24 @@
 # Copyright 2017 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
+import hashlib
 import socket
 import logging
+import tempfile
+import threading
+import time
 import xmlrpclib
 
+from collections import namedtuple
+from contextlib import contextmanager
+
+import psycopg2
+import requests
+
+import odoo
 from odoo.addons.component.core import AbstractComponent
 from odoo.addons.queue_job.exception import RetryableJobError
 from odoo.addons.connector.exception import NetworkRetryableError
-from datetime import datetime
 
 _logger = logging.getLogger(__name__)
 
@@ -21,6 +31,14 @@ except ImportError:
 
 MAGENTO_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
 
+# fault code returned by the Magento API when the session id is no
+# longer valid, a new login is required
+MAGENTO_SESSION_EXPIRED = 5
+
+# returned by the adapter's ``_call`` while the call is queued in a
+# batch, the result is known once the batch has been sent
+MAGENTO_PENDING_CALL = object()
+
 
 class MagentoLocation(object):
 
@@ -35,6 +53,21 @@ class MagentoLocation(object):
         self.auth_basic_username = None
         self.auth_basic_password = None
 
+        self.use_session_pool = False
+        self.session_pool_size = 1
+        self.session_idle_timeout = 0
+
+        # :class:`MagentoThrottle` limiting the calls
+        self.throttle = None
+
+    @property
+    def pool_key(self):
+        """ Key identifying the Magento sessions that can be shared """
+        return (self.location,
+                self.username,
+                self.password,
+                self.use_custom_api_path)
+
     @property
     def location(self):
         location = self._location
@@ -47,6 +80,388 @@ class MagentoLocation(object):
         return location
 
 
+class MagentoSessionPool(object):
+    """ Keep logged in Magento API clients between the sync sessions
+
+    Logging in on Magento costs a full round trip (and a TCP/TLS
+    handshake) before any useful call can be done.  The clients released
+    in the pool keep their session id and their HTTP connection open
+    (``xmlrpclib`` uses keep-alive connections), so the next job working
+    on the same Magento can reuse them.
+
+    The pool is shared by all the threads of the process, the clients
+    are grouped by :attr:`MagentoLocation.pool_key`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # pool_key -> list of (release time, magentolib.API)
+        self._clients = {}
+
+    def acquire(self, location):
+        """ Return an idle client for the location or None
+
+        Clients which stayed idle longer than
+        ``location.session_idle_timeout`` are closed.
+        """
+        timeout = location.session_idle_timeout
+        expired = []
+        client = None
+        with self._lock:
+            clients = self._clients.get(location.pool_key, [])
+            while clients:
+                released_at, api = clients.pop()
+                if timeout and time.time() - released_at > timeout:
+                    expired.append(api)
+                    continue
+                client = api
+                break
+        for api in expired:
+            self._close(api)
+        return client
+
+    def release(self, location, api):
+        """ Give back a client to the pool
+
+        The client is closed if the pool is full.
+        """
+        with self._lock:
+            clients = self._clients.setdefault(location.pool_key, [])
+            if len(clients) < location.session_pool_size:
+                clients.append((time.time(), api))
+                return
+        self._close(api)
+
+    def clear(self):
+        """ Close all the idle clients """
+        with self._lock:
+            clients = [api for pool in self._clients.itervalues()
+                       for __, api in pool]
+            self._clients = {}
+        for api in clients:
+            self._close(api)
+
+    @staticmethod
+    def _close(api):
+        try:
+            api.__exit__(None, None, None)
+        except Exception:
+            # the session may already be expired on Magento, the
+            # connection be closed, ... we don't mind
+            _logger.debug('Could not end the Magento session', exc_info=True)
+
+
+magento_session_pool = MagentoSessionPool()
+
+
+class MagentoThrottle(object):
+    """ Limit the rate and the concurrency of the calls to a Magento
+
+    The limits are shared by all the workers of all the Odoo processes:
+
+    * each call leases one of the ``max_concurrency`` rows of the
+      ``magento_backend_throttle_slot`` table while it runs
+    * the rate is limited by a token bucket stored in the
+      ``magento_backend_throttle`` table
+
+    The rate adapts to the health of Magento: it is halved after a
+    server or network error, lowered when a call is slower than
+    ``target_latency`` and slowly raised back on the fast calls.
+
+    The state is read and updated with one statement before and one
+    statement after the call, on a separate connection in autocommit,
+    so it does not depend on the transactions of the jobs. The
+    connection is given back to the pool during the call.
+    """
+
+    # lowest part of the rate kept by the adaptive backoff
+    min_rate_factor = 0.1
+    # seconds waited for a free slot before retrying the job later
+    slot_timeout = 300
+    # seconds after which the slot of a call is freed if the call never
+    # released it (worker killed, ...)
+    slot_lease = 600
+
+    # (dbname, backend_id, max_concurrency) of the states created in
+    # the database by this process
+    _created = set()
+
+    def __init__(self, dbname, backend_id, rate_limit=0, max_concurrency=0,
+                 target_latency=0):
+        self.dbname = dbname
+        self.backend_id = backend_id
+        self.rate_limit = rate_limit
+        self.max_concurrency = min(max_concurrency, 1000)
+        self.target_latency = target_latency
+
+    @contextmanager
+    def call(self):
+        """ Wait until a call is allowed, then record its outcome """
+        slot = self._acquire()
+        start = time.time()
+        failed = False
+        try:
+            yield
+        except (socket.error, xmlrpclib.ProtocolError) as err:
+            failed = (not isinstance(err, xmlrpclib.ProtocolError) or
+                      err.errcode >= 500)
+            raise
+        finally:
+            self._release(slot, time.time() - start, failed)
+
+    @contextmanager
+    def _cursor(self):
+        """ Short-lived cursor in autocommit on a pooled connection """
+        cr = odoo.sql_db.db_connect(self.dbname).cursor()
+        cr.autocommit(True)
+        try:
+            yield cr
+        finally:
+            cr.close()
+
+    def _create_state(self, cr):
+        """ Create the row and the slots of the backend when missing """
+        key = (self.dbname, self.backend_id, self.max_concurrency)
+        if key in self._created:
+            return
+        params = {'backend_id': self.backend_id,
+                  'rate': self.rate_limit,
+                  'slots': self.max_concurrency}
+        try:
+            cr.execute("INSERT INTO magento_backend_throttle "
+                       "(backend_id, tokens, updated_at, rate_factor, "
+                       " call_count, error_count, total_time, last_latency) "
+                       "SELECT %(backend_id)s, %(rate)s, "
+                       "       clock_timestamp() AT TIME ZONE 'UTC', "
+                       "       1, 0, 0, 0, 0 "
+                       "WHERE NOT EXISTS ("
+                       "    SELECT 1 FROM magento_backend_throttle "
+                       "    WHERE backend_id = %(backend_id)s)",
+                       params)
+        except psycopg2.IntegrityError:
+            pass  # created by another worker meanwhile
+        try:
+            cr.execute("INSERT INTO magento_backend_throttle_slot "
+                       "(backend_id, slot) "
+                       "SELECT %(backend_id)s, g.slot "
+                       "FROM generate_series(0, %(slots)s - 1) g(slot) "
+                       "WHERE NOT EXISTS ("
+                       "    SELECT 1 FROM magento_backend_throttle_slot "
+                       "    WHERE backend_id = %(backend_id)s "
+                       "    AND slot = g.slot)",
+                       params)
+        except psycopg2.IntegrityError:
+            pass  # created by another worker meanwhile
+        self._created.add(key)
+
+    def _acquire(self):
+        """ Lease a slot and consume a token, wait when none is free
+
+        The free slot is locked with ``SKIP LOCKED`` so only one row is
+        locked and leased by each call; the token is consumed in the
+        same statement, only when a slot has been leased.
+
+        The tokens are consumed in advance: the bucket can become
+        negative and each call waits for its own token to be refilled.
+        """
+        params = {
+            'backend_id': self.backend_id,
+            'slots': max(self.max_concurrency, 0),
+            'lease': self.slot_lease,
+            'burst': max(self.rate_limit, 1),
+            'rate': max(self.rate_limit, 0),
+        }
+        deadline = time.time() + self.slot_timeout
+        while True:
+            with self._cursor() as cr:
+                self._create_state(cr)
+                cr.execute(
+                    "WITH leased AS ("
+                    "    UPDATE magento_backend_throttle_slot "
+                    "    SET leased_until = "
+                    "        clock_timestamp() AT TIME ZONE 'UTC' + "
+                    "        %(lease)s * INTERVAL '1 second' "
+                    "    WHERE id = ("
+                    "        SELECT id FROM magento_backend_throttle_slot "
+                    "        WHERE backend_id = %(backend_id)s "
+                    "        AND slot < %(slots)s "
+                    "        AND (leased_until IS NULL OR leased_until < "
+                    "             clock_timestamp() AT TIME ZONE 'UTC') "
+                    "        ORDER BY slot "
+                    "        LIMIT 1 "
+                    "        FOR UPDATE SKIP LOCKED) "
+                    "    RETURNING slot "
+                    "), bucket AS ("
+                    "    UPDATE magento_backend_throttle "
+                    "    SET tokens = LEAST(%(burst)s, "
+                    "        tokens + %(rate)s * rate_factor * "
+                    "        EXTRACT(EPOCH FROM "
+                    "                clock_timestamp() AT TIME ZONE 'UTC' "
+                    "                - updated_at)) - 1, "
+                    "        updated_at = clock_timestamp() AT TIME ZONE 'UTC'"
+                    "    WHERE backend_id = %(backend_id)s "
+                    "    AND %(rate)s > 0 "
+                    "    AND (%(slots)s = 0 OR EXISTS (SELECT 1 FROM leased))"
+                    "    RETURNING tokens, rate_factor "
+                    ") "
+                    "SELECT (SELECT slot FROM leased), "
+                    "       (SELECT tokens FROM bucket), "
+                    "       (SELECT rate_factor FROM bucket)",
+                    params
+                )
+                slot, tokens, rate_factor = cr.fetchone()
+            if not self.max_concurrency > 0 or slot is not None:
+                break
+            if time.time() > deadline:
+                raise RetryableJobError(
+                    'Too many concurrent calls to Magento, '
+                    'the job will be retried later.',
+                    ignore_retry=True,
+                )
+            time.sleep(0.1)
+        if tokens is not None and tokens < 0:
+            time.sleep(-tokens / (self.rate_limit * rate_factor))
+        return slot
+
+    def _release(self, slot, duration, failed):
+        """ Free the slot, update the statistics and adapt the rate """
+        slow = bool(self.target_latency) and duration > self.target_latency
+        with self._cursor() as cr:
+            cr.execute(
+                "WITH released AS ("
+                "    UPDATE magento_backend_throttle_slot "
+                "    SET leased_until = NULL "
+                "    WHERE backend_id = %(backend_id)s "
+                "    AND slot = %(slot)s "
+                ") "
+                "UPDATE magento_backend_throttle "
+                "SET call_count = call_count + 1, "
+                "    error_count = error_count + %(error)s, "
+                "    total_time = total_time + %(duration)s, "
+                "    last_latency = %(duration)s, "
+                "    rate_factor = CASE "
+                "        WHEN %(failed)s "
+                "            THEN GREATEST(%(min)s, rate_factor / 2) "
+                "        WHEN %(slow)s "
+                "            THEN GREATEST(%(min)s, rate_factor * 0.9) "
+                "        ELSE LEAST(1, rate_factor + 0.05) "
+                "    END "
+                "WHERE backend_id = %(backend_id)s",
+                {'backend_id': self.backend_id, 'slot': slot,
+                 'error': int(failed), 'duration': duration,
+                 'failed': failed, 'slow': slow,
+                 'min': self.min_rate_factor},
+            )
+
+
+class MagentoCallStats(object):
+    """ Statistics of the calls done by a :class:`MagentoAPI`
+
+    The calls are aggregated by Magento method, with a histogram of
+    their durations in milliseconds.
+    """
+
+    # upper bounds of the buckets of the histograms, in milliseconds,
+    # the last bucket counts the slower calls
+    buckets = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self):
+        self.methods = {}
+
+    def _method_stats(self, method):
+        if method not in self.methods:
+            self.methods[method] = {
+                'count': 0,
+                'time': 0.,
+                'max_time': 0.,
+                'request_size': 0,
+                'response_size': 0,
+                'retries': 0,
+                'histogram': [0] * (len(self.buckets) + 1),
+                'faults': {},
+            }
+        return self.methods[method]
+
+    def record(self, method, duration, request_size=0, response_size=0,
+               retries=0, fault=None):
+        """ Record a call
+
+        :param duration: duration of the call in milliseconds
+        :param fault: fault code of a failed call
+        """
+        stats = self._method_stats(method)
+        stats['count'] += 1
+        stats['time'] += duration
+        stats['max_time'] = max(stats['max_time'], duration)
+        stats['request_size'] += request_size
+        stats['response_size'] += response_size
+        stats['retries'] += retries
+        bucket = len(self.buckets)
+        for index, bound in enumerate(self.buckets):
+            if duration <= bound:
+                bucket = index
+                break
+        stats['histogram'][bucket] += 1
+        if fault is not None:
+            self.record_fault(method, fault)
+
+    def record_fault(self, method, fault):
+        """ Record a fault, also used for the failed calls of a batch """
+        faults = self._method_stats(method)['faults']
+        faults[str(fault)] = faults.get(str(fault), 0) + 1
+
+
+class MagentoTransportMixin:
+    """ Count the bytes sent and received by a XML-RPC transport
+
+    The sizes are the ones of the HTTP bodies, as they are sent on the
+    network, so the payloads are not serialized again to measure them.
+
+    The transports of ``xmlrpclib`` are old-style classes, so the
+    mixin is one too and calls them explicitly.
+    """
+
+    request_size = 0
+    response_size = 0
+
+    def send_content(self, connection, request_body):
+        self.request_size += len(request_body)
+        return xmlrpclib.Transport.send_content(
+            self, connection, request_body
+        )
+
+    def parse_response(self, response):
+        response = MagentoCountingResponse(response)
+        try:
+            return xmlrpclib.Transport.parse_response(self, response)
+        finally:
+            self.response_size += response.size
+
+
+class MagentoCountingResponse(object):
+    """ Wrap a HTTP response and count the bytes read from it """
+
+    def __init__(self, response):
+        self._response = response
+        self.size = 0
+
+    def read(self, *args):
+        data = self._response.read(*args)
+        self.size += len(data)
+        return data
+
+    def getheader(self, *args):
+        return self._response.getheader(*args)
+
+
+class MagentoTransport(MagentoTransportMixin, xmlrpclib.Transport):
+    pass
+
+
+class MagentoSafeTransport(MagentoTransportMixin, xmlrpclib.SafeTransport):
+    pass
+
+
 class MagentoAPI(object):
 
     def __init__(self, location):
@@ -56,18 +471,38 @@ class MagentoAPI(object):
         """
         self._location = location
         self._api = None
+        # set when a network error occurred, the client is then not
+        # given back to the session pool
+        self._broken = False
+        # :class:`MagentoCallStats` collecting the statistics of the calls
+        self.stats = None
+        # number of logins done again after an expired session
+        self._retries = 0
+        # total duration of the calls in milliseconds
+        self.call_time = 0.
 
     @property
     def api(self):
         if self._api is None:
-            custom_url = self._location.use_custom_api_path
-            api = magentolib.API(
-                self._location.location,
-                self._location.username,
-                self._location.password,
-                full_url=custom_url
-            )
-            api.__enter__()
+            api = None
+            if self._location.use_session_pool:
+                api = magento_session_pool.acquire(self._location)
+                # forget the bytes counted by the previous sessions
+                self._pop_transferred(api)
+            if api is None:
+                custom_url = self._location.use_custom_api_path
+                if self._location.location.startswith('https'):
+                    transport = MagentoSafeTransport()
+                else:
+                    transport = MagentoTransport()
+                api = magentolib.API(
+                    self._location.location,
+                    self._location.username,
+                    self._location.password,
+                    full_url=custom_url,
+                    transport=transport,
+                )
+                api.__enter__()
             self._api = api
         return self._api
 
@@ -77,34 +512,53 @@ class MagentoAPI(object):
 
     def __exit__(self, type, value, traceback):
         if self._api is not None:
-            self._api.__exit__(type, value, traceback)
+            if self._location.use_session_pool and not self._broken:
+                magento_session_pool.release(self._location, self._api)
+            else:
+                self._api.__exit__(type, value, traceback)
+            self._api = None
 
-    def call(self, method, arguments):
+    def _api_call(self, method, arguments):
+        """ Call the API, login again if the session has expired """
+        throttle = self._location.throttle
+        if throttle is None:
+            return self._api_call_session(method, arguments)
+        with throttle.call():
+            return self._api_call_session(method, arguments)
+
+    def _api_call_session(self, method, arguments):
         try:
-            # When Magento is installed on PHP 5.4+, the API
-            # may return garble data if the arguments contain
-            # trailing None.
-            if isinstance(arguments, list):
-                while arguments and arguments[-1] is None:
-                    arguments.pop()
-            start = datetime.now()
-            try:
-                result = self.api.call(method, arguments)
-            except:
-                _logger.error("api.call('%s', %s) failed", method, arguments)
+            return getattr(self.api, method)(*arguments)
+        except xmlrpclib.Fault as err:
+            if err.faultCode != MAGENTO_SESSION_EXPIRED:
                 raise
-            else:
-                _logger.debug("api.call('%s', %s) returned %s in %s seconds",
-                              method, arguments, result,
-                              (datetime.now() - start).seconds)
-            # Uncomment to record requests/responses in ``recorder``
-            # record(method, arguments, result)
-            return result
+            _logger.debug('Magento session expired, login again')
+            self._retries += 1
+            self.api.__enter__()
+            return getattr(self.api, method)(*arguments)
+
+    @staticmethod
+    def _clean_arguments(arguments):
+        # When Magento is installed on PHP 5.4+, the API
+        # may return garble data if the arguments contain
+        # trailing None.
+        if isinstance(arguments, list):
+            while arguments and arguments[-1] is None:
+                arguments.pop()
+        return arguments
+
+    @contextmanager
+    def _handle_errors(self):
+        """ Convert the network errors to retryable errors """
+        try:
+            yield
         except (socket.gaierror, socket.error, socket.timeout) as err:
+            self._broken = True
             raise NetworkRetryableError(
                 'A network error caused the failure of the job: '
                 '%s' % err)
         except xmlrpclib.ProtocolError as err:
+            self._broken = True
             if err.errcode in [502,   # Bad gateway
                                503,   # Service unavailable
                                504]:  # Gateway timeout
@@ -118,6 +572,308 @@ class MagentoAPI(object):
             else:
                 raise
 
+    @contextmanager
+    def _measure(self, method, arguments):
+        """ Record the statistics of a call
+
+        Yield a dict in which the caller puts the ``result`` of the call.
+        """
+        call = {}
+        if self.stats is None:
+            yield call
+            return
+        retries = self._retries
+        # forget the bytes of the previous calls not measured
+        self._pop_transferred(self._api)
+        start = time.time()
+        fault = None
+        try:
+            yield call
+        except xmlrpclib.Fault as err:
+            fault = err.faultCode
+            raise
+        except xmlrpclib.ProtocolError as err:
+            fault = 'HTTP %s' % err.errcode
+            raise
+        except (socket.error, socket.timeout):
+            fault = 'network'
+            raise
+        finally:
+            duration = (time.time() - start) * 1000
+            request_size, response_size = self._pop_transferred(self._api)
+            self.stats.record(
+                method,
+                duration,
+                request_size=request_size,
+                response_size=response_size,
+                retries=self._retries - retries,
+                fault=fault,
+            )
+
+    @staticmethod
+    def _pop_transferred(api):
+        """ Bytes sent and received by the transport of a client
+
+        The counters of the transport are reset.
+        """
+        transport = getattr(api, 'transport', None)
+        if not isinstance(transport, MagentoTransportMixin):
+            return 0, 0
+        sizes = transport.request_size, transport.response_size
+        transport.request_size = transport.response_size = 0
+        return sizes
+
+    def call(self, method, arguments):
+        with self._handle_errors():
+            arguments = self._clean_arguments(arguments)
+            start = time.time()
+            try:
+                with self._measure(method, arguments) as call:
+                    result = self._api_call('call', [method, arguments])
+                    call['result'] = result
+            except:
+                _logger.error("api.call('%s', %s) failed", method, arguments)
+                raise
+            finally:
+                self.call_time += (time.time() - start) * 1000
+            _logger.debug("api.call('%s', %s) returned %s in %d ms",
+                          method, arguments, result,
+                          (time.time() - start) * 1000)
+            # Uncomment to record requests/responses in ``recorder``
+            # record(method, arguments, result)
+            return result
+
+    def multi_call(self, calls):
+        """ Execute several calls in one request
+
+        :param calls: list of ``(method, arguments)``
+        :returns: list with the result of each call, in the same order,
+                  a failed call returns a dict with ``isFault``,
+                  ``faultCode`` and ``faultMessage`` keys
+        """
+        with self._handle_errors():
+            calls = [[method, self._clean_arguments(arguments)]
+                     for method, arguments in calls]
+            start = time.time()
+            try:
+                with self._measure('multiCall', calls) as call:
+                    result = self._api_call('multiCall', [calls])
+                    call['result'] = result
+            except (xmlrpclib.Error, socket.error):
+                _logger.error("api.multiCall(%s) failed", calls)
+                raise
+            finally:
+                self.call_time += (time.time() - start) * 1000
+            _logger.debug("api.multiCall(%s) returned %s in %d ms",
+                          calls, result, (time.time() - start) * 1000)
+            if self.stats is not None:
+                for (method, __), item in zip(calls, result):
+                    if isinstance(item, dict) and item.get('isFault'):
+                        self.stats.record_fault(method, item.get('faultCode'))
+            return result
+
+
+class MagentoCallFuture(object):
+    """ Result of a call queued in a :class:`MagentoCallBatch`
+
+    The result is available once the batch has been sent.
+    """
+
+    def __init__(self, method, arguments):
+        self.method = method
+        self.arguments = arguments
+        self.done = False
+        self._result = None
+        self._fault = None
+
+    def set_result(self, result):
+        if isinstance(result, dict) and result.get('isFault'):
+            self._fault = xmlrpclib.Fault(int(result.get('faultCode') or 0),
+                                          result.get('faultMessage'))
+        else:
+            self._result = result
+        self.done = True
+
+    def result(self):
+        """ Return the result of the call
+
+        Raise the :class:`xmlrpclib.Fault` if the call failed on Magento.
+        """
+        if not self.done:
+            raise RuntimeError('The call %s has not been sent yet.' %
+                               self.method)
+        if self._fault is not None:
+            raise self._fault
+        return self._result
+
+
+class MagentoCallBatch(object):
+    """ Queue of calls sent to Magento with ``multiCall``
+
+    A failing call does not make the other calls of the batch fail,
+    the fault is given back by the :class:`MagentoCallFuture` of the call.
+    """
+
+    def __init__(self, magento_api, size=100):
+        """
+        :param magento_api: Magento client
+        :type magento_api: :class:`MagentoAPI`
+        :param size: maximum number of calls sent in one request
+        """
+        self._magento_api = magento_api
+        self.size = size
+        self._futures = []
+
+    def add(self, method, arguments):
+        future = MagentoCallFuture(method, arguments)
+        self._futures.append(future)
+        return future
+
+    def flush(self):
+        """ Send the pending calls """
+        futures, self._futures = self._futures, []
+        for index in xrange(0, len(futures), self.size):
+            chunk = futures[index:index + self.size]
+            results = self._magento_api.multi_call(
+                [(future.method, future.arguments) for future in chunk]
+            )
+            for future, result in zip(chunk, results):
+                future.set_result(result)
+
+
+class MagentoDeferredResult(object):
+    """ Result of an adapter's method queued with
+    :meth:`MagentoCRUDAdapter.defer`
+    """
+
+    def __init__(self, adapter, future, method, args, kwargs):
+        self._adapter = adapter
+        self._future = future
+        self._method = method
+        self._args = args
+        self._kwargs = kwargs
+
+    def result(self):
+        """ Return what the adapter's method would have returned
+
+        The exceptions are the same than the ones raised by the method
+        (e.g. ``IDMissingInBackend``).
+        """
+        adapter = self._adapter
+        adapter._replay_future = self._future
+        try:
+            result = getattr(adapter, self._method)(*self._args,
+                                                    **self._kwargs)
+        finally:
+            adapter._replay_future = None
+        assert result is not MAGENTO_PENDING_CALL, (
+            'The call %s has not been sent yet.' % self._future.method)
+        return result
+
+
+# image downloaded by :class:`MagentoImageDownloader`, ``file`` is a
+# temporary file with the content of the image and ``sha1`` its hash,
+# both are None when the server answered that the image is not modified
+MagentoImage = namedtuple('MagentoImage', 'file sha1 etag last_modified')
+
+
+class MagentoImageDownloader(object):
+    """ Download the images of the products
+
+    A downloader is shared by the synchronizations of the process (see
+    :meth:`shared`), so the connections to the server are kept alive
+    between the jobs. A download fails after ``timeout`` seconds without
+    response, the images larger than ``max_size`` bytes are skipped.
+
+    The images are written in temporary files while they are downloaded,
+    only the ones larger than ``spool_size`` bytes go to the disk.
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, auth=None, pool_size=4, timeout=30,
+                 max_size=10 * 1024 * 1024, spool_size=1024 * 1024):
+        self.auth = auth
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_size = max_size
+        self.spool_size = spool_size
+        self._session = None
+
+    @classmethod
+    def shared(cls, auth=None):
+        """ Return the downloader of the process for these credentials """
+        with cls._shared_lock:
+            if auth not in cls._shared:
+                cls._shared[auth] = cls(auth=auth)
+            return cls._shared[auth]
+
+    @property
+    def session(self):
+        if self._session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=self.pool_size,
+                pool_maxsize=self.pool_size,
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.auth = self.auth
+            self._session = session
+        return self._session
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def download(self, url, headers=None):
+        """ Download an image
+
+        The caller has to close the file of the image.
+
+        :param headers: additional headers of the request, like the
+                        ``If-None-Match`` and ``If-Modified-Since``
+                        headers of a conditional request
+        :returns: :class:`MagentoImage`, None when the image is missing
+                  or too large
+        :raises: :class:`requests.HTTPError` for the other HTTP errors
+        """
+        response = self.session.get(url, stream=True, timeout=self.timeout,
+                                    headers=headers)
+        try:
+            if response.status_code == 404:
+                # the image is just missing, we skip it
+                return None
+            response.raise_for_status()
+            etag = response.headers.get('etag')
+            last_modified = response.headers.get('last-modified')
+            if response.status_code == 304:
+                return MagentoImage(None, None, etag, last_modified)
+            length = response.headers.get('content-length')
+            if length and int(length) > self.max_size:
+                _logger.warning('Image %s skipped, its size of %s bytes '
+                                'exceeds the limit', url, length)
+                return None
+            content = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+            sha1 = hashlib.sha1()
+            size = 0
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > self.max_size:
+                    content.close()
+                    _logger.warning('Image %s skipped, its size exceeds '
+                                    'the limit', url)
+                    return None
+                sha1.update(chunk)
+                content.write(chunk)
+            content.seek(0)
+            return MagentoImage(content, sha1.hexdigest(), etag,
+                                last_modified)
+        finally:
+            response.close()
+
 
 class MagentoCRUDAdapter(AbstractComponent):
     """ External Records Adapter for Magento """
@@ -152,17 +908,106 @@ class MagentoCRUDAdapter(AbstractComponent):
         """ Delete a record on the external system """
         raise NotImplementedError
 
-    def _call(self, method, arguments):
+    def __init__(self, work_context):
+        super(MagentoCRUDAdapter, self).__init__(work_context)
+        self._batch = None
+        self._defer_future = None
+        self._replay_future = None
+
+    def _get_magento_api(self):
         try:
-            magento_api = getattr(self.work, 'magento_api')
+            return getattr(self.work, 'magento_api')
         except AttributeError:
             raise AttributeError(
                 'You must provide a magento_api attribute with a '
                 'MagentoAPI instance to be able to use the '
                 'Backend Adapter.'
             )
+
+    def _call(self, method, arguments):
+        if self._replay_future is not None:
+            return self._replay_future.result()
+        if self._defer_future is not None:
+            raise AssertionError('A deferred method can only do one call.')
+        if self._batch is not None:
+            self._defer_future = self._batch.add(method, arguments)
+            return MAGENTO_PENDING_CALL
+        magento_api = self._get_magento_api()
         return magento_api.call(method, arguments)
 
+    @contextmanager
+    def call_batch(self, size=100):
+        """ Send the calls deferred in the block in ``multiCall`` requests
+
+        Usage::
+
+            with adapter.call_batch():
+                results = [adapter.defer('read', id) for id in ids]
+            records = [result.result() for result in results]
+
+        """
+        batch = MagentoCallBatch(self._get_magento_api(), size=size)
+        previous, self._batch = self._batch, batch
+        try:
+            yield batch
+        finally:
+            self._batch = previous
+        batch.flush()
+
+    def defer(self, method, *args, **kwargs):
+        """ Queue a call of a method of the adapter in the current batch
+
+        The method must do exactly one call to :meth:`_call` and return
+        its result unchanged, like :meth:`read` or :meth:`write`.  It is
+        called a first time to queue the API call, then a second time by
+        :meth:`MagentoDeferredResult.result` with the result of the API
+        call, so the exceptions raised by the method apply as usual.
+        While the call is queued, :meth:`_call` returns the
+        ``MAGENTO_PENDING_CALL`` sentinel, the post-processing must be
+        done on the value returned by :meth:`MagentoDeferredResult.result`.
+
+        :returns: :class:`MagentoDeferredResult`
+        """
+        assert self._batch is not None, (
+            'defer() must be used in a call_batch() block')
+        try:
+            result = getattr(self, method)(*args, **kwargs)
+            future = self._defer_future
+        finally:
+            self._defer_future = None
+        assert future is not None, (
+            'The method %s did not call the Magento API' % method)
+        if result is not MAGENTO_PENDING_CALL:
+            raise TypeError('The method %s does not return the result of '
+                            'the Magento call unchanged, it cannot be '
+                            'deferred.' % method)
+        return MagentoDeferredResult(self, future, method, args, kwargs)
+
+    def read_many(self, ids, *args, **kwargs):
+        """ Read several records in one request
+
+        The arguments are the same than :meth:`read`.
+
+        :returns: list of :class:`MagentoDeferredResult` in the same
+                  order than ``ids``
+        """
+        with self.call_batch():
+            results = [self.defer('read', id, *args, **kwargs)
+                       for id in ids]
+        return results
+
+    def write_many(self, records, *args, **kwargs):
+        """ Update several records in one request
+
+        :param records: list of ``(id, data)``
+        :returns: list of :class:`MagentoDeferredResult` in the same
+                  order than ``records``
+        """
+        with self.call_batch():
+            results = [self.defer('write', id, data, *args, **kwargs)
+                       for id, data in records]
+        return results
+
 
 class GenericAdapter(AbstractComponent):
 
@@ -171,6 +1016,12 @@ class GenericAdapter(AbstractComponent):
 
     _magento_model = None
     _admin_path = None
+    # name of the Magento field used to search the records by ranges
+    # of ids, the batch imports are paginated only when it is defined;
+    # ``search`` must return the values of this field, as the next page
+    # starts after the last id found (not the case of the sales orders,
+    # searched by increment id)
+    _search_id_field = None
 
     def search(self, filters=None):
         """ Search records according to some criterias
@@ -3,9 +3,61 @@
 # © 2016 Sodexis
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+from collections import OrderedDict
+
+from odoo import models, tools
 from odoo.addons.component.core import Component
 
 
+class MagentoBinderCache(object):
+    """ Correspondence between the Magento IDs and the bindings
+
+    A cache is created for each synchronization session by
+    ``magento.backend.work_on`` and shared by all the binders of the
+    session.
+
+    The bindings of the small models are loaded all at once in
+    ``loaded``, the lookups of the other models are kept in a LRU cache
+    of ``size`` entries per model.
+    """
+
+    def __init__(self, size=1000):
+        self.size = size
+        # {model name: ({external id: binding id},
+        #               {odoo id: [external ids]})}
+        self.loaded = {}
+        # {model name: OrderedDict({external id: binding id})}
+        self.recent = {}
+
+    def get(self, model_name, external_id):
+        """ Return the binding id of a recent lookup or None """
+        recent = self.recent.get(model_name)
+        if not recent or external_id not in recent:
+            return None
+        # move the entry at the end, the first one is the least used
+        binding_id = recent.pop(external_id)
+        recent[external_id] = binding_id
+        return binding_id
+
+    def put(self, model_name, external_id, binding_id):
+        """ Keep the binding id of a lookup """
+        recent = self.recent.setdefault(model_name, OrderedDict())
+        recent.pop(external_id, None)
+        recent[external_id] = binding_id
+        if len(recent) > self.size:
+            recent.popitem(last=False)
+
+    def invalidate(self, model_name):
+        """ Forget the bindings of a model """
+        self.loaded.pop(model_name, None)
+        self.recent.pop(model_name, None)
+
+    def clear(self):
+        """ Forget all the bindings, for instance after a rollback """
+        self.loaded.clear()
+        self.recent.clear()
+
+
 class MagentoModelBinder(Component):
     """ Bind records and give odoo/magento ids correspondence
 
@@ -14,6 +66,10 @@ class MagentoModelBinder(Component):
     They are ``_inherits`` of the normal models and contains
     the Magento ID, the ID of the Magento Backend and the additional
     fields belonging to the Magento instance.
+
+    The correspondences are kept in the :class:`MagentoBinderCache` of
+    the work context, so the repeated lookups of a synchronization
+    session do not query the database.
     """
     _name = 'magento.binder'
     _inherit = ['base.binder', 'base.magento.connector']
@@ -31,3 +87,175 @@ class MagentoModelBinder(Component):
         'magento.sale.order.line',
         'magento.account.invoice',
     ]
+
+    # the bindings of these models are all loaded on the first lookup
+    _preload_models = [
+        'magento.website',
+        'magento.store',
+        'magento.storeview',
+        'magento.res.partner.category',
+        'magento.product.category',
+    ]
+
+    def _binder_cache(self):
+        return getattr(self.work, 'magento_binder_cache', None)
+
+    def _load_bindings(self, cache):
+        """ Load all the bindings of the backend in the cache """
+        # the websites, stores and storeviews do not wrap an Odoo model
+        wrapping = self._odoo_field in self.model._fields
+        read_fields = [self._external_field]
+        if wrapping:
+            read_fields.append(self._odoo_field)
+        bindings = self.model.with_context(active_test=False).search_read(
+            [(self._backend_field, '=', self.backend_record.id)],
+            read_fields,
+        )
+        by_external = {}
+        by_odoo = {}
+        for binding in bindings:
+            external_id = binding[self._external_field]
+            if external_id:
+                by_external[external_id] = binding['id']
+            if wrapping and binding[self._odoo_field]:
+                odoo_id = binding[self._odoo_field][0]
+                by_odoo.setdefault(odoo_id, []).append(external_id)
+        cache.loaded[self.model._name] = (by_external, by_odoo)
+        return by_external, by_odoo
+
+    def _cached_maps(self, cache):
+        if self.model._name not in self._preload_models:
+            return None
+        maps = cache.loaded.get(self.model._name)
+        if maps is None:
+            maps = self._load_bindings(cache)
+        return maps
+
+    def to_internal(self, external_id, unwrap=False):
+        """ Give the Odoo recordset for an external ID, see
+        :meth:`odoo.addons.connector.components.binder.Binder.to_internal`
+        """
+        cache = self._binder_cache()
+        if cache is None:
+            return super(MagentoModelBinder, self).to_internal(
+                external_id, unwrap=unwrap
+            )
+        external_id = tools.ustr(external_id)
+        maps = self._cached_maps(cache)
+        if maps is not None:
+            binding_id = maps[0].get(external_id)
+        else:
+            binding_id = cache.get(self.model._name, external_id)
+            if binding_id is None:
+                binding = super(MagentoModelBinder, self).to_internal(
+                    external_id
+                )
+                if binding:
+                    cache.put(self.model._name, external_id, binding.id)
+                binding_id = binding.id
+        binding = self.model.with_context(active_test=False).browse(
+            binding_id or []
+        )
+        if unwrap:
+            return binding[self._odoo_field]
+        return binding
+
+    def to_internal_many(self, external_ids, unwrap=False):
+        """ Give the Odoo recordsets for several external IDs
+
+        The bindings which are not in the cache of the session are
+        searched in one query.
+
+        :returns: dict ``{external id: recordset}``, the external ids
+                  are unicode strings and the recordset is empty when
+                  the record is not bound
+        """
+        external_ids = [tools.ustr(external_id)
+                        for external_id in external_ids]
+        cache = self._binder_cache()
+        maps = self._cached_maps(cache) if cache is not None else None
+        binding_ids = {}
+        missing = []
+        for external_id in external_ids:
+            if maps is not None:
+                binding_id = maps[0].get(external_id)
+            elif cache is not None:
+                binding_id = cache.get(self.model._name, external_id)
+            else:
+                binding_id = None
+            if binding_id is None and maps is None:
+                missing.append(external_id)
+            else:
+                binding_ids[external_id] = binding_id
+        model = self.model.with_context(active_test=False)
+        if missing:
+            rows = model.search_read(
+                [(self._backend_field, '=', self.backend_record.id),
+                 (self._external_field, 'in', missing)],
+                [self._external_field],
+            )
+            for row in rows:
+                external_id = row[self._external_field]
+                binding_ids[external_id] = row['id']
+                if cache is not None:
+                    cache.put(self.model._name, external_id, row['id'])
+        result = {}
+        for external_id in external_ids:
+            binding = model.browse(binding_ids.get(external_id) or [])
+            if unwrap:
+                binding = binding[self._odoo_field]
+            result[external_id] = binding
+        return result
+
+    def to_external(self, binding, wrap=False):
+        """ Give the external ID for an Odoo binding ID, see
+        :meth:`odoo.addons.connector.components.binder.Binder.to_external`
+        """
+        cache = self._binder_cache()
+        maps = self._cached_maps(cache) if wrap and cache else None
+        if maps is not None:
+            odoo_id = binding
+            if isinstance(binding, models.BaseModel):
+                binding.ensure_one()
+                odoo_id = binding.id
+            external_ids = maps[1].get(odoo_id, [])
+            if len(external_ids) == 1:
+                return external_ids[0]
+            if not external_ids:
+                return None
+        return super(MagentoModelBinder, self).to_external(binding,
+                                                           wrap=wrap)
+
+    def bind(self, external_id, binding):
+        """ Create the link between an external ID and an Odoo ID, see
+        :meth:`odoo.addons.connector.components.binder.Binder.bind`
+
+        The binding is updated in the cache rather than reloading all
+        the bindings of the model on the next lookup, which would make
+        the imports of many records quadratic.
+        """
+        if not isinstance(binding, models.BaseModel):
+            binding = self.model.browse(binding)
+        previous_id = binding[self._external_field]
+        super(MagentoModelBinder, self).bind(external_id, binding)
+        cache = self._binder_cache()
+        if cache is None:
+            return
+        external_id = tools.ustr(external_id)
+        maps = cache.loaded.get(self.model._name)
+        if maps is None:
+            if previous_id:
+                cache.put(self.model._name, previous_id, None)
+            cache.put(self.model._name, external_id, binding.id)
+            return
+        by_external, by_odoo = maps
+        odoo_id = None
+        if self._odoo_field in self.model._fields:
+            odoo_id = binding[self._odoo_field].id
+        if previous_id:
+            by_external.pop(previous_id, None)
+            if previous_id in by_odoo.get(odoo_id, []):
+                by_odoo[odoo_id].remove(previous_id)
+        by_external[external_id] = binding.id
+        if odoo_id:
+            by_odoo.setdefault(odoo_id, []).append(external_id)
@@ -2,9 +2,116 @@
 # Copyright 2017 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
 from odoo.addons.component.core import AbstractComponent
 
 
+class MagentoTimedCursor(object):
+    """ Wrapper of a psycopg2 cursor adding the duration of the queries
+    to a :class:`MagentoProfiler`
+    """
+
+    def __init__(self, cursor, profiler):
+        self._cursor = cursor
+        self.magento_profiler = profiler
+
+    def execute(self, *args, **kwargs):
+        start = time.time()
+        try:
+            return self._cursor.execute(*args, **kwargs)
+        finally:
+            self.magento_profiler.sql_time += (time.time() - start) * 1000
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class MagentoProfiler(object):
+    """ Measure the phases of the synchronizations of a session
+
+    For each binding model and phase, the profiler accumulates the wall
+    time, the number and the duration of the SQL queries and the
+    duration of the calls to the Magento API. The phases can be nested
+    (the dependencies of an import contain the import of the
+    dependencies), their measures include the nested phases.
+
+    The durations are in milliseconds.
+
+    Only one profiler measures a cursor: the sessions opened inside a
+    profiled session reuse its profiler (see :meth:`active`).
+    """
+
+    def __init__(self, cr, magento_api=None):
+        self.cr = cr
+        self.magento_apis = []
+        if magento_api is not None:
+            self.magento_apis.append(magento_api)
+        self.phases = OrderedDict()
+        self.sql_time = 0.
+
+    @staticmethod
+    def active(cr):
+        """ Return the profiler measuring the queries of a cursor """
+        cursor = getattr(cr, '_obj', None)
+        if isinstance(cursor, MagentoTimedCursor):
+            return cursor.magento_profiler
+        return None
+
+    def add_api(self, magento_api):
+        """ Measure the calls of the client of a nested session """
+        if magento_api not in self.magento_apis:
+            self.magento_apis.append(magento_api)
+
+    @contextmanager
+    def time_queries(self):
+        """ Measure the duration of the SQL queries done in the block
+
+        The psycopg2 cursor of the Odoo cursor is wrapped in a
+        :class:`MagentoTimedCursor` until the end of the block.
+        """
+        cr = self.cr
+        cursor = cr._obj
+        cr._obj = MagentoTimedCursor(cursor, self)
+        try:
+            yield
+        finally:
+            cr._obj = cursor
+
+    def _snapshot(self):
+        api_time = sum(api.call_time for api in self.magento_apis)
+        return (time.time() * 1000,
+                self.cr.sql_log_count,
+                self.sql_time,
+                api_time)
+
+    @contextmanager
+    def measure(self, model_name, phase):
+        """ Measure a phase of the synchronization of a model """
+        before = self._snapshot()
+        try:
+            yield
+        finally:
+            after = self._snapshot()
+            key = (model_name, phase)
+            if key not in self.phases:
+                self.phases[key] = {'count': 0,
+                                    'time': 0.,
+                                    'sql_count': 0,
+                                    'sql_time': 0.,
+                                    'api_time': 0.,
+                                    }
+            values = self.phases[key]
+            values['count'] += 1
+            values['time'] += after[0] - before[0]
+            values['sql_count'] += after[1] - before[1]
+            values['sql_time'] += after[2] - before[2]
+            values['api_time'] += after[3] - before[3]
+
+
 class BaseMagentoConnectorComponent(AbstractComponent):
     """ Base Magento Connector Component
 
@@ -14,3 +121,16 @@ class BaseMagentoConnectorComponent(AbstractComponent):
     _name = 'base.magento.connector'
     _inherit = 'base.connector'
     _collection = 'magento.backend'
+
+    @contextmanager
+    def _profile(self, phase):
+        """ Measure a phase of the synchronization
+
+        Does nothing unless the profiling is activated on the backend.
+        """
+        profiler = getattr(self.work, 'magento_profiler', None)
+        if profiler is None:
+            yield
+            return
+        with profiler.measure(self.model._name, phase):
+            yield
@@ -15,6 +15,7 @@ from odoo import _
 from odoo.addons.component.core import AbstractComponent
 from odoo.addons.connector.exception import (IDMissingInBackend,
                                              RetryableJobError)
+from odoo.addons.queue_job.job import identity_exact
 from .backend_adapter import MAGENTO_DATETIME_FORMAT
 
 _logger = logging.getLogger(__name__)
@@ -54,9 +55,9 @@ class MagentoBaseExporter(AbstractComponent):
         # force is True because the sync_date will be more recent
         # so the import would be skipped
         assert self.external_id
-        self.binding.with_delay().import_record(self.backend_record,
-                                                self.external_id,
-                                                force=True)
+        delayable = self.binding.with_delay(identity_key=identity_exact)
+        delayable.import_record(self.backend_record, self.external_id,
+                                force=True)
 
     def _should_import(self):
         """ Before the export, compare the update date
@@ -89,7 +90,8 @@ class MagentoBaseExporter(AbstractComponent):
 
         self.external_id = self.binder.to_external(self.binding)
         try:
-            should_import = self._should_import()
+            with self._profile('should_import'):
+                should_import = self._should_import()
         except IDMissingInBackend:
             self.external_id = None
             should_import = False
@@ -98,7 +100,8 @@ class MagentoBaseExporter(AbstractComponent):
 
         result = self._run(*args, **kwargs)
 
-        self.binder.bind(self.external_id, self.binding)
+        with self._profile('bind'):
+            self.binder.bind(self.external_id, self.binding)
         # Commit so we keep the external ID when there are several
         # exports (due to dependencies) and one of them fails.
         # The commit will also release the lock acquired on the binding
@@ -106,7 +109,8 @@ class MagentoBaseExporter(AbstractComponent):
         if not odoo.tools.config['test_enable']:
             self.env.cr.commit()  # noqa
 
-        self._after_export()
+        with self._profile('after_export'):
+            self._after_export()
         return result
 
     def _run(self):
@@ -349,22 +353,29 @@ class MagentoExporter(AbstractComponent):
             return
 
         # export the missing linked resources
-        self._export_dependencies()
+        with self._profile('dependencies'):
+            self._export_dependencies()
 
         # prevent other jobs to export the same record
         # will be released on commit (or rollback)
-        self._lock()
+        with self._profile('lock'):
+            self._lock()
 
-        map_record = self._map_data()
+        with self._profile('mapping'):
+            map_record = self._map_data()
 
         if self.external_id:
-            record = self._update_data(map_record, fields=fields)
+            with self._profile('update'):
+                record = self._update_data(map_record, fields=fields)
+                if record:
+                    self._update(record)
             if not record:
                 return _('Nothing to export.')
-            self._update(record)
         else:
-            record = self._create_data(map_record, fields=fields)
+            with self._profile('create'):
+                record = self._create_data(map_record, fields=fields)
+                if record:
+                    self.external_id = self._create(record)
             if not record:
                 return _('Nothing to export.')
-            self.external_id = self._create(record)
         return _('Record exported with ID %s on Magento.') % self.external_id
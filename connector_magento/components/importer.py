@@ -15,11 +15,17 @@ are already bound, to update the last sync date.
 
 """
 
+import copy
 import logging
-from odoo import fields, _
+
+from collections import OrderedDict
+
+from odoo import fields, tools, _
 from odoo.addons.component.core import AbstractComponent, Component
 from odoo.addons.connector.exception import IDMissingInBackend
 from odoo.addons.queue_job.exception import NothingToDoJob
+from odoo.addons.queue_job.job import (Job, identity_exact,
+                                       ENQUEUED, PENDING)
 
 _logger = logging.getLogger(__name__)
 
@@ -35,9 +41,12 @@ class MagentoImporter(AbstractComponent):
         super(MagentoImporter, self).__init__(work_context)
         self.external_id = None
         self.magento_record = None
+        self._read_data = None
 
     def _get_magento_data(self):
         """ Return the raw Magento data for ``self.external_id`` """
+        if self._read_data is not None:
+            return self._read_data
         return self.backend_adapter.read(self.external_id)
 
     def _before_import(self):
@@ -48,7 +57,14 @@ class MagentoImporter(AbstractComponent):
         """Return True if the import should be skipped because
         it is already up-to-date in OpenERP"""
         assert self.magento_record
-        if not self.magento_record.get('updated_at'):
+        return self._is_synchronized_since(
+            binding, self.magento_record.get('updated_at')
+        )
+
+    def _is_synchronized_since(self, binding, updated_at):
+        """Return True if the binding has been synchronized after
+        ``updated_at``, the last update of the record on Magento"""
+        if not updated_at:
             return  # no update date on Magento, always import it.
         if not binding:
             return  # it does not exist so it should not be skipped
@@ -57,7 +73,7 @@ class MagentoImporter(AbstractComponent):
             return
         from_string = fields.Datetime.from_string
         sync_date = from_string(sync)
-        magento_date = from_string(self.magento_record['updated_at'])
+        magento_date = from_string(updated_at)
         # if the last synchronization date is greater than the last
         # update in magento, we skip the import.
         # Important: at the beginning of the exporters flows, we have to
@@ -101,6 +117,71 @@ class MagentoImporter(AbstractComponent):
                     binding_model._name, external_id
                 )
 
+    def _import_dependency_many(self, external_ids, binding_model,
+                                usage='record.importer'):
+        """ Import the missing dependencies among several records
+
+        Like :meth:`_import_dependency` for records which are imported
+        only when they do not exist yet, but the existing bindings are
+        searched in one query and the missing records are read from
+        Magento in one request.
+
+        :param external_ids: ids of the related bindings to import
+        :param binding_model: name of the binding model for the relation
+        :param usage: usage of the importer component
+        """
+        external_ids = [tools.ustr(external_id) for external_id
+                        in OrderedDict.fromkeys(external_ids)
+                        if external_id]
+        binder = self.binder_for(binding_model)
+        bindings = binder.to_internal_many(external_ids)
+        missing = [external_id for external_id in external_ids
+                   if not bindings[external_id]]
+        if not missing:
+            return
+        adapter = self.component(usage='backend.adapter',
+                                 model_name=binding_model)
+        results = adapter.read_many(missing)
+        for external_id, result in zip(missing, results):
+            try:
+                data = result.result()
+            except IDMissingInBackend:
+                _logger.info('Dependency %s(%s) does no longer exist in '
+                             'Magento.', binding_model, external_id)
+                continue
+            importer = self.component(usage=usage, model_name=binding_model)
+            try:
+                importer.run(external_id, data=data)
+            except NothingToDoJob:
+                _logger.info(
+                    'Dependency import of %s(%s) has been ignored.',
+                    binding_model, external_id
+                )
+        # the binds emptied the cache of the binder, fill it again for
+        # the mappers looking for the records
+        binder.to_internal_many(external_ids)
+
+    def _import_translations(self, binding, mapper=None):
+        """ Import the translations of the record
+
+        They are imported in a job with a lower priority when the
+        backend is configured so.
+        """
+        if self.backend_record.import_translations_delayed:
+            description = _('Import translations of %s %s') % (
+                self.model._description, self.external_id
+            )
+            binding.with_delay(
+                priority=20,
+                description=description,
+                identity_key=identity_exact,
+            ).import_translations(mapper=mapper)
+            return
+        translation_importer = self.component(usage='translation.importer')
+        with self._profile('translations'):
+            translation_importer.run(self.external_id, binding,
+                                     mapper=mapper)
+
     def _import_dependencies(self):
         """ Import the dependencies for the record
 
@@ -170,12 +251,19 @@ class MagentoImporter(AbstractComponent):
         """ Hook called at the end of the import """
         return
 
-    def run(self, external_id, force=False):
+    def run(self, external_id, force=False, data=None, updated_at=None):
         """ Run the synchronization
 
         :param external_id: identifier of the record on Magento
+        :param data: raw Magento data of the record when it has already
+                     been read, for instance with ``read_many``
+        :param updated_at: last update of the record on Magento when it
+                           is known before reading it, for instance from
+                           the result of a search; the record is not
+                           read when the binding is already up-to-date
         """
         self.external_id = external_id
+        self._read_data = data
         lock_name = 'import({}, {}, {}, {})'.format(
             self.backend_record._name,
             self.backend_record.id,
@@ -183,41 +271,59 @@ class MagentoImporter(AbstractComponent):
             external_id,
         )
 
+        if updated_at and not force:
+            with self._profile('binding'):
+                binding = self._get_binding()
+                uptodate = self._is_synchronized_since(binding, updated_at)
+            if uptodate:
+                return _('Already up-to-date.')
+
         try:
-            self.magento_record = self._get_magento_data()
+            with self._profile('read'):
+                self.magento_record = self._get_magento_data()
         except IDMissingInBackend:
             return _('Record does no longer exist in Magento')
 
-        skip = self._must_skip()
+        with self._profile('skip'):
+            skip = self._must_skip()
         if skip:
             return skip
 
-        binding = self._get_binding()
-
-        if not force and self._is_uptodate(binding):
+        with self._profile('binding'):
+            binding = self._get_binding()
+            uptodate = not force and self._is_uptodate(binding)
+        if uptodate:
             return _('Already up-to-date.')
 
         # Keep a lock on this import until the transaction is committed
         # The lock is kept since we have detected that the informations
         # will be updated into Odoo
-        self.advisory_lock_or_retry(lock_name)
-        self._before_import()
+        with self._profile('lock'):
+            self.advisory_lock_or_retry(lock_name)
+        with self._profile('before_import'):
+            self._before_import()
 
         # import the missing linked resources
-        self._import_dependencies()
+        with self._profile('dependencies'):
+            self._import_dependencies()
 
-        map_record = self._map_data()
+        with self._profile('mapping'):
+            map_record = self._map_data()
 
         if binding:
-            record = self._update_data(map_record)
-            self._update(binding, record)
+            with self._profile('update'):
+                record = self._update_data(map_record)
+                self._update(binding, record)
         else:
-            record = self._create_data(map_record)
-            binding = self._create(record)
+            with self._profile('create'):
+                record = self._create_data(map_record)
+                binding = self._create(record)
 
-        self.binder.bind(self.external_id, binding)
+        with self._profile('bind'):
+            self.binder.bind(self.external_id, binding)
 
-        self._after_import(binding)
+        with self._profile('after_import'):
+            self._after_import(binding)
 
 
 class BatchImporter(AbstractComponent):
@@ -230,11 +336,88 @@ class BatchImporter(AbstractComponent):
     _inherit = ['base.importer', 'base.magento.connector']
     _usage = 'batch.importer'
 
+    # the ids of the Magento entities are unsigned 32-bit integers, the
+    # pages are searched up to this id
+    _max_id = 2 ** 32 - 1
+    # import each page of records in a new job, otherwise all the pages
+    # are imported in the current one
+    _delay_pages = True
+
     def run(self, filters=None):
-        """ Run the synchronization """
-        record_ids = self.backend_adapter.search(filters)
-        for record_id in record_ids:
-            self._import_record(record_id)
+        """ Run the synchronization
+
+        When the backend has an import page size and the adapter can
+        search by ranges of ids, the records are imported page by page.
+        When the pages are delayed, only one page of records is
+        imported, then the import of the next page is started with a
+        ``page_from_id`` key in the filters.
+        """
+        if filters is None:
+            filters = {}
+        page_size = self.backend_record.import_page_size
+        if page_size <= 0 or not self.backend_adapter._search_id_field:
+            record_ids = self._search(filters)
+            self._import_records(record_ids)
+            return
+        from_id = filters.pop('page_from_id', 0)
+        while from_id is not None:
+            record_ids, from_id = self._search_page(filters, from_id,
+                                                    page_size)
+            self._import_records(record_ids)
+            if from_id is not None and self._delay_pages:
+                self._import_next_page(filters, from_id)
+                return
+
+    def _search(self, filters):
+        """ Search the ids of the records to import """
+        return self.backend_adapter.search(filters)
+
+    def _import_kwargs(self, external_id):
+        """ Keyword arguments of the import of a record
+
+        The searches which return the last update of the records give
+        it to the imports (``updated_at``), so the records not modified
+        since their last import are not read again.
+        """
+        return {}
+
+    def _search_page(self, filters, from_id, page_size):
+        """ Search the ids of the records in the next non-empty page
+
+        After an empty page, the range of ids of the next search is
+        doubled, so the gaps in the ids are skipped in a few searches.
+        At most ``page_size`` records are returned, the next page starts
+        after the last one.
+
+        Return the ids and the id from where to search the next page,
+        which is ``None`` when all the records have been found.
+        """
+        id_field = self.backend_adapter._search_id_field
+        size = page_size
+        while from_id < self._max_id:
+            to_id = min(from_id + size, self._max_id)
+            page_filters = copy.deepcopy(filters)
+            page_filters[id_field] = {'from': from_id + 1, 'to': to_id}
+            record_ids = self._search(page_filters)
+            if record_ids:
+                if len(record_ids) > page_size:
+                    record_ids = sorted(record_ids, key=int)[:page_size]
+                    to_id = int(record_ids[-1])
+                return record_ids, to_id if to_id < self._max_id else None
+            from_id = to_id
+            size *= 2
+        return [], None
+
+    def _import_next_page(self, filters, from_id):
+        """ Delay the import of the page starting after ``from_id`` """
+        filters = dict(filters, page_from_id=from_id)
+        self.model.with_delay().import_batch(self.backend_record,
+                                             filters=filters)
+
+    def _import_records(self, external_ids):
+        """ Import the records found by the search """
+        for external_id in external_ids:
+            self._import_record(external_id)
 
     def _import_record(self, external_id):
         """ Import a record directly or delay the import of the record.
@@ -250,9 +433,12 @@ class DirectBatchImporter(AbstractComponent):
     _name = 'magento.direct.batch.importer'
     _inherit = 'magento.batch.importer'
 
+    _delay_pages = False
+
     def _import_record(self, external_id):
         """ Import the record directly """
-        self.model.import_record(self.backend_record, external_id)
+        self.model.import_record(self.backend_record, external_id,
+                                 **self._import_kwargs(external_id))
 
 
 class DelayedBatchImporter(AbstractComponent):
@@ -261,11 +447,61 @@ class DelayedBatchImporter(AbstractComponent):
     _name = 'magento.delayed.batch.importer'
     _inherit = 'magento.batch.importer'
 
+    # number of jobs created in the same transaction
+    _enqueue_chunk_size = 500
+
+    def _job_options(self, external_id):
+        """ Options of the import job of a record (priority, ...) """
+        return {}
+
     def _import_record(self, external_id, job_options=None, **kwargs):
         """ Delay the import of the records"""
-        delayable = self.model.with_delay(**job_options or {})
+        if job_options is None:
+            job_options = self._job_options(external_id)
+        delayable = self.model.with_delay(identity_key=identity_exact,
+                                          **job_options)
+        kwargs = dict(self._import_kwargs(external_id), **kwargs)
         delayable.import_record(self.backend_record, external_id, **kwargs)
 
+    def _import_records(self, external_ids):
+        """ Delay the import of the records by chunks
+
+        The transaction is committed after each chunk, so the jobs of
+        the chunks already created are kept if the batch fails. A job
+        is not created when the same import is already pending, which
+        happens when a failed batch is retried.
+        """
+        size = self._enqueue_chunk_size
+        for start in xrange(0, len(external_ids), size):
+            self._enqueue_chunk(external_ids[start:start + size])
+            self._commit()
+
+    def _enqueue_chunk(self, external_ids):
+        """ Create the import jobs of a chunk of records """
+        jobs = {}
+        for external_id in external_ids:
+            new_job = Job(self.model.import_record,
+                          args=(self.backend_record, external_id),
+                          kwargs=self._import_kwargs(external_id),
+                          identity_key=identity_exact,
+                          **self._job_options(external_id))
+            jobs.setdefault(new_job.identity_key, new_job)
+        existing = self.env['queue.job'].sudo().search([
+            ('identity_key', 'in', jobs.keys()),
+            ('state', 'in', [PENDING, ENQUEUED]),
+        ])
+        for identity_key in set(jobs) - set(existing.mapped('identity_key')):
+            jobs[identity_key].store()
+
+    def _commit(self):
+        """ Commit the jobs created so far
+
+        The tests and the benchmarks, which roll back their transaction,
+        disable it with ``magento_commit_chunks=False`` in the context.
+        """
+        if self.env.context.get('magento_commit_chunks', True):
+            self.env.cr.commit()  # noqa
+
 
 class SimpleRecordImporter(Component):
     """ Import one Magento Website """
@@ -292,34 +528,55 @@ class TranslationImporter(Component):
         """ Return the raw Magento data for ``self.external_id`` """
         return self.backend_adapter.read(self.external_id, storeview_id)
 
+    def _get_magento_data_many(self, storeview_ids):
+        """ Return the raw Magento data for ``self.external_id`` in
+        several storeviews, read in one request
+        """
+        adapter = self.backend_adapter
+        with adapter.call_batch():
+            results = [adapter.defer('read', self.external_id, storeview_id)
+                       for storeview_id in storeview_ids]
+        return [result.result() for result in results]
+
     def run(self, external_id, binding, mapper=None):
         self.external_id = external_id
         storeviews = self.env['magento.storeview'].search(
             [('backend_id', '=', self.backend_record.id)]
         )
         default_lang = self.backend_record.default_lang_id
-        lang_storeviews = [sv for sv in storeviews
-                           if sv.lang_id and sv.lang_id != default_lang]
+        # the translations of the last storeview of a language are
+        # written, do not read the other ones
+        lang_storeviews = OrderedDict()
+        for storeview in storeviews:
+            if storeview.lang_id and storeview.lang_id != default_lang:
+                lang_storeviews.pop(storeview.lang_id, None)
+                lang_storeviews[storeview.lang_id] = storeview
         if not lang_storeviews:
             return
 
-        # find the translatable fields of the model
-        fields = self.model.fields_get()
-        translatable_fields = [field for field, attrs in fields.iteritems()
-                               if attrs.get('translate')]
+        translatable_fields = self.model._get_translatable_fields()
 
         if mapper is None:
             mapper = self.mapper
         else:
             mapper = self.component_by_name(mapper)
 
-        for storeview in lang_storeviews:
-            lang_record = self._get_magento_data(storeview.external_id)
+        lang_records = self._get_magento_data_many(
+            [storeview.external_id for storeview in lang_storeviews.values()]
+        )
+        for lang, lang_record in zip(lang_storeviews, lang_records):
             map_record = mapper.map_record(lang_record)
             record = map_record.values()
 
             data = dict((field, value) for field, value in record.iteritems()
                         if field in translatable_fields)
-
-            binding.with_context(connector_no_export=True,
-                                 lang=storeview.lang_id.code).write(data)
+            if not data:
+                continue
+            lang_binding = binding.with_context(connector_no_export=True,
+                                                lang=lang.code)
+            # write only the translations which changed
+            current = lang_binding.read(list(data))[0]
+            data = dict((field, value) for field, value in data.iteritems()
+                        if (current[field] or False) != (value or False))
+            if data:
+                lang_binding.write(data)
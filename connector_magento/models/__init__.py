@@ -4,7 +4,9 @@ from . import magento_binding  # should be loaded first for inheritance
 from . import account_invoice
 from . import account_payment_mode
 from . import delivery
+from . import magento_api_stat
 from . import magento_backend
+from . import magento_job_profile
 from . import magento_store
 from . import magento_storeview
 from . import magento_website
@@ -14,4 +16,5 @@ from . import product
 from . import product_category
 from . import queue_job
 from . import sale_order
+from . import stock_move
 from . import stock_picking
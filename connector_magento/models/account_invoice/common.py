@@ -7,7 +7,7 @@ import logging
 import xmlrpclib
 from odoo import api, models, fields
 from odoo.addons.component.core import Component
-from odoo.addons.queue_job.job import job, related_action
+from odoo.addons.queue_job.job import job, related_action, identity_exact
 from odoo.addons.connector.exception import IDMissingInBackend
 
 _logger = logging.getLogger(__name__)
@@ -105,7 +105,7 @@ class MagentoBindingInvoiceListener(Component):
     _apply_on = ['magento.account.invoice']
 
     def on_record_create(self, record, fields=None):
-        record.with_delay().export_record()
+        record.with_delay(identity_key=identity_exact).export_record()
 
 
 class MagentoInvoiceListener(Component):
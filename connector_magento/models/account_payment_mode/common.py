@@ -3,7 +3,7 @@
 # © 2016 Sodexis
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import models, fields
+from odoo import api, fields, models, tools
 
 
 class AccountPaymentMode(models.Model):
@@ -18,3 +18,37 @@ class AccountPaymentMode(models.Model):
              "If nothing is set, the option falls back to the same option "
              "on the Magento store related to the sales order.",
     )
+
+    @api.model
+    def _magento_search_by_name(self, name):
+        """ Return the payment mode of a Magento payment method
+
+        The lookups are cached, the cache is cleared when the payment
+        modes are modified.
+        """
+        return self.browse(self._magento_mode_id_by_name(name))
+
+    # the company of the user restricts the payment modes found
+    @tools.ormcache_context('self._uid', 'self.env.user.company_id.id',
+                            'name', keys=('lang',))
+    def _magento_mode_id_by_name(self, name):
+        return self.search([('name', '=', name)], limit=1).id
+
+    @api.model
+    def create(self, vals):
+        # an archived payment mode is never found
+        if vals.get('active', True):
+            self.clear_caches()
+        return super(AccountPaymentMode, self).create(vals)
+
+    @api.multi
+    def write(self, vals):
+        if {'name', 'active', 'company_id'}.intersection(vals):
+            self.clear_caches()
+        return super(AccountPaymentMode, self).write(vals)
+
+    @api.multi
+    def unlink(self):
+        if any(mode.active for mode in self):
+            self.clear_caches()
+        return super(AccountPaymentMode, self).unlink()
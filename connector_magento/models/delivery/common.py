@@ -3,7 +3,7 @@
 # © 2016 Sodexis
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 
 
 # TODO magento.delivery.carrier & move specific stuff
@@ -55,3 +55,39 @@ class DeliveryCarrier(models.Model):
         for carrier in self:
             if carrier.magento_code:
                 self.magento_carrier_code = carrier.magento_code.split('_')[0]
+
+    @api.model
+    def _magento_search_by_code(self, magento_code):
+        """ Return the carrier of a Magento delivery method
+
+        The lookups are cached, the cache is cleared when the carriers
+        are modified.
+        """
+        return self.browse(self._magento_carrier_id_by_code(magento_code))
+
+    # the company of the user restricts the carriers found
+    @tools.ormcache('self._uid', 'self.env.user.company_id.id',
+                    'magento_code')
+    def _magento_carrier_id_by_code(self, magento_code):
+        return self.search([('magento_code', '=', magento_code)], limit=1).id
+
+    @api.model
+    def create(self, vals):
+        # only the carriers having a Magento code are looked up
+        if vals.get('magento_code') and vals.get('active', True):
+            self.clear_caches()
+        return super(DeliveryCarrier, self).create(vals)
+
+    @api.multi
+    def write(self, vals):
+        if vals.get('magento_code') or any(
+                carrier.magento_code for carrier in self):
+            if {'magento_code', 'active', 'company_id'}.intersection(vals):
+                self.clear_caches()
+        return super(DeliveryCarrier, self).write(vals)
+
+    @api.multi
+    def unlink(self):
+        if any(carrier.magento_code for carrier in self):
+            self.clear_caches()
+        return super(DeliveryCarrier, self).unlink()
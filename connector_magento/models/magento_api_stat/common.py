@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from odoo import api, fields, models
+
+from ...components.backend_adapter import MagentoCallStats
+
+
+class MagentoApiStat(models.Model):
+    """ Statistics of the calls of a synchronization session
+
+    One record is created for each Magento method called during a
+    session (usually a job), when the statistics are activated on the
+    backend.
+    """
+    _name = 'magento.api.stat'
+    _description = 'Magento API Statistics'
+    _order = 'date desc, id desc'
+
+    backend_id = fields.Many2one(
+        comodel_name='magento.backend',
+        string='Magento Backend',
+        required=True,
+        ondelete='cascade',
+        index=True,
+    )
+    date = fields.Datetime(required=True, index=True)
+    job_uuid = fields.Char(string='Job UUID', index=True)
+    method = fields.Char(required=True, index=True)
+    call_count = fields.Integer(string='Calls')
+    fault_count = fields.Integer(string='Faults')
+    retry_count = fields.Integer(string='Retries')
+    total_time = fields.Float(string='Total Time (ms)')
+    max_time = fields.Float(string='Max Time (ms)')
+    average_time = fields.Float(
+        string='Average Time (ms)',
+        compute='_compute_average_time',
+    )
+    request_size = fields.Integer(string='Requests Size (bytes)')
+    response_size = fields.Integer(string='Responses Size (bytes)')
+    # number of calls in each bucket of MagentoCallStats.buckets
+    histogram = fields.Serialized()
+    # {fault code: number of faults}
+    faults = fields.Serialized()
+    fault_codes = fields.Char(compute='_compute_fault_codes')
+
+    @api.depends('call_count', 'total_time')
+    def _compute_average_time(self):
+        for stat in self:
+            if stat.call_count:
+                stat.average_time = stat.total_time / stat.call_count
+
+    @api.depends('faults')
+    def _compute_fault_codes(self):
+        for stat in self:
+            stat.fault_codes = ', '.join(
+                '%s: %d' % (code, count)
+                for code, count in sorted((stat.faults or {}).items())
+            )
+
+    @api.model
+    def _record_stats(self, backend, stats):
+        """ Store the statistics of a session
+
+        A summary is added on the job running the session.
+        """
+        job_uuid = self.env['queue.job']._running_job_uuid()
+        now = fields.Datetime.now()
+        summary = []
+        for method, values in sorted(stats.methods.items()):
+            fault_count = sum(values['faults'].values())
+            self.sudo().create({
+                'backend_id': backend.id,
+                'date': now,
+                'job_uuid': job_uuid,
+                'method': method,
+                'call_count': values['count'],
+                'fault_count': fault_count,
+                'retry_count': values['retries'],
+                'total_time': values['time'],
+                'max_time': values['max_time'],
+                'request_size': values['request_size'],
+                'response_size': values['response_size'],
+                'histogram': values['histogram'],
+                'faults': values['faults'],
+            })
+            summary.append(
+                u'%s: %d calls, %d ms (max %d ms), %d faults, %d retries' %
+                (method, values['count'], values['time'],
+                 values['max_time'], fault_count, values['retries'])
+            )
+        self.env['queue.job']._add_running_job_summary('magento_api_stats',
+                                                       summary)
+
+    @api.model
+    def prometheus_metrics(self, domain=None):
+        """ Return the statistics in the Prometheus text format
+
+        The counters are the sums of the statistics matching ``domain``.
+        """
+        totals = defaultdict(lambda: defaultdict(int))
+        histograms = {}
+        faults = defaultdict(int)
+        for stat in self.search(domain or []):
+            key = (stat.backend_id.id, stat.method)
+            for name in ('call_count', 'retry_count', 'total_time',
+                         'request_size', 'response_size'):
+                totals[key][name] += stat[name]
+            histogram = histograms.setdefault(
+                key, [0] * (len(MagentoCallStats.buckets) + 1)
+            )
+            for index, count in enumerate(stat.histogram or []):
+                histogram[index] += count
+            for code, count in (stat.faults or {}).items():
+                faults[key + (code,)] += count
+
+        def labels(key, **extra):
+            values = [('backend', key[0]), ('method', key[1])]
+            values += sorted(extra.items())
+            return ','.join('%s="%s"' % (name, value)
+                            for name, value in values)
+
+        lines = []
+        counters = [
+            ('magento_api_calls_total', 'call_count',
+             'Number of calls to the Magento API.'),
+            ('magento_api_retries_total', 'retry_count',
+             'Number of logins done again after an expired session.'),
+            ('magento_api_request_bytes_total', 'request_size',
+             'Size of the requests sent to Magento.'),
+            ('magento_api_response_bytes_total', 'response_size',
+             'Size of the responses of Magento.'),
+        ]
+        for metric, name, help_text in counters:
+            lines += ['# HELP %s %s' % (metric, help_text),
+                      '# TYPE %s counter' % metric]
+            for key in sorted(totals):
+                lines.append('%s{%s} %s' % (metric, labels(key),
+                                            totals[key][name]))
+        metric = 'magento_api_faults_total'
+        lines += ['# HELP %s Number of faults returned by Magento.' % metric,
+                  '# TYPE %s counter' % metric]
+        for key in sorted(faults):
+            lines.append('%s{%s} %s' % (metric,
+                                        labels(key[:2], code=key[2]),
+                                        faults[key]))
+        metric = 'magento_api_call_duration_milliseconds'
+        lines += ['# HELP %s Duration of the calls to Magento.' % metric,
+                  '# TYPE %s histogram' % metric]
+        for key in sorted(histograms):
+            cumulative = 0
+            bounds = [str(bound) for bound in MagentoCallStats.buckets]
+            for bound, count in zip(bounds + ['+Inf'], histograms[key]):
+                cumulative += count
+                lines.append('%s_bucket{%s} %d' % (metric,
+                                                   labels(key, le=bound),
+                                                   cumulative))
+            lines.append('%s_sum{%s} %s' % (metric, labels(key),
+                                            totals[key]['total_time']))
+            lines.append('%s_count{%s} %d' % (metric, labels(key),
+                                              cumulative))
+        return '\n'.join(lines) + '\n'
+
+    @api.model
+    def _scheduler_remove_old_stats(self, days=30):
+        """ Remove the statistics older than ``days`` """
+        limit = datetime.now() - timedelta(days=days)
+        self.search(
+            [('date', '<', fields.Datetime.to_string(limit))]
+        ).unlink()
@@ -12,7 +12,13 @@ from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 
 from odoo.addons.connector.checkpoint import checkpoint
-from ...components.backend_adapter import MagentoLocation, MagentoAPI
+from ...components.backend_adapter import (MagentoLocation,
+                                           MagentoAPI,
+                                           MagentoCallStats,
+                                           MagentoImageDownloader,
+                                           MagentoThrottle)
+from ...components.binder import MagentoBinderCache
+from ...components.core import MagentoProfiler
 
 _logger = logging.getLogger(__name__)
 
@@ -78,6 +84,62 @@ class MagentoBackend(models.Model):
         string='Basic Auth. Password',
         help="Basic access authentication web server side password",
     )
+    use_session_pool = fields.Boolean(
+        string='Reuse API Sessions',
+        help="Keep the API sessions open between the jobs. The jobs "
+             "reuse the session and the HTTP connection of a previous "
+             "job instead of logging in again on Magento.",
+    )
+    session_pool_size = fields.Integer(
+        string='Max Idle Sessions',
+        default=4,
+        help="Maximum number of idle sessions kept open by each Odoo "
+             "process for this backend.",
+    )
+    session_idle_timeout = fields.Integer(
+        string='Session Idle Timeout',
+        default=600,
+        help="Number of seconds after which an idle session is closed. "
+             "Use 0 to keep them open indefinitely. Expired sessions "
+             "are transparently renewed.",
+    )
+    api_rate_limit = fields.Float(
+        string='Max Calls per Second',
+        help="Maximum number of API calls per second done by all the "
+             "jobs of this backend. The rate is automatically lowered "
+             "when Magento returns errors or answers slowly. "
+             "Use 0 for no limit.",
+    )
+    api_max_concurrency = fields.Integer(
+        string='Max Concurrent Calls',
+        help="Maximum number of API calls running at the same time for "
+             "this backend, in all the Odoo processes. "
+             "Use 0 for no limit.",
+    )
+    api_target_latency = fields.Float(
+        string='Target Latency',
+        default=2.0,
+        help="Duration of a call, in seconds, above which the rate of the "
+             "calls is lowered.",
+    )
+    api_statistics = fields.Boolean(
+        string='Collect API Statistics',
+        help="Record the number, the duration, the size and the faults "
+             "of the calls to the Magento API. A summary is added "
+             "on the jobs.",
+    )
+    profile_jobs = fields.Boolean(
+        string='Profile the Synchronizations',
+        help="Measure the duration, the SQL queries and the API calls of "
+             "each phase of the imports and exports. A summary is added "
+             "on the jobs.",
+    )
+    api_throttle_ids = fields.One2many(
+        comodel_name='magento.backend.throttle',
+        inverse_name='backend_id',
+        string='API Statistics',
+        readonly=True,
+    )
     sale_prefix = fields.Char(
         string='Sale Prefix',
         help="A prefix put before the name of imported sales orders.\n"
@@ -126,6 +188,46 @@ class MagentoBackend(models.Model):
     import_categories_from_date = fields.Datetime(
         string='Import categories from date',
     )
+    import_categories_tree = fields.Boolean(
+        string='Import Categories as a Tree',
+        help="Import the product categories from the top to the bottom "
+             "of the tree, with one job per subtree, instead of one job "
+             "per category.",
+    )
+    import_partners_bulk = fields.Boolean(
+        string='Import Partners in Bulk',
+        help="Import the partners by chunks, with one job reading the "
+             "customers and their addresses in a few requests, instead "
+             "of one job per partner.",
+    )
+    import_page_size = fields.Integer(
+        string='Import Page Size',
+        help="Split the search of the batch imports (products, partners) "
+             "in pages covering this number of Magento IDs. "
+             "Each page is searched by its own job, so an interrupted "
+             "batch resumes from its last page. 0 searches all the "
+             "records at once.",
+    )
+    order_product_placeholder = fields.Boolean(
+        string='Placeholder Products in Orders',
+        help="When a sales order contains products which are not "
+             "imported yet, create them with their main data only and "
+             "import their translations, images and bundle options in "
+             "a delayed job, so the import of the order does not wait "
+             "for them.",
+    )
+    import_images_delayed = fields.Boolean(
+        string='Import Images in a Job',
+        help="Download the images of the products in a job delayed "
+             "after the import of the product, so a slow image server "
+             "does not hold the import of the products.",
+    )
+    import_translations_delayed = fields.Boolean(
+        string='Import Translations in a Job',
+        help="Import the translations of the products and categories "
+             "in a job delayed with a lower priority, so the main data "
+             "of the records is imported first.",
+    )
     product_stock_field_id = fields.Many2one(
         comodel_name='ir.model.fields',
         string='Stock Field',
@@ -136,6 +238,44 @@ class MagentoBackend(models.Model):
              "stock inventory updates.\nIf empty, Quantity Available "
              "is used.",
     )
+    sql_stock_recompute = fields.Boolean(
+        string='Fast Stock Computation',
+        help="Compute the stock quantities of all the products in one SQL "
+             "query and update only the changed ones. Only used with the "
+             "standard stock fields (Quantity On Hand, Forecast Quantity, "
+             "Incoming, Outgoing) and when the computation of the "
+             "quantity is not customized by an addon.",
+    )
+    bulk_stock_export = fields.Boolean(
+        string='Bulk Stock Export',
+        help="Export the stock quantities computed by the scheduler by "
+             "chunks of products, in one request per chunk, instead of "
+             "one job per product.",
+    )
+    stock_export_chunk_size = fields.Integer(
+        string='Stock Export Chunk Size',
+        default=100,
+        help="Number of products exported by each job when the bulk "
+             "stock export is activated.",
+    )
+    incremental_stock_sync = fields.Boolean(
+        string='Incremental Stock Synchronization',
+        help="The stock scheduler recomputes only the quantities of the "
+             "products having stock moves since its last execution. "
+             "A full synchronization of all the products is still done "
+             "periodically.",
+    )
+    full_stock_sync_interval = fields.Integer(
+        string='Full Stock Sync. Interval (hours)',
+        default=24,
+        help="Number of hours between two full synchronizations of the "
+             "stock quantities when the incremental synchronization is "
+             "activated.",
+    )
+    last_full_stock_sync = fields.Datetime(
+        string='Last Full Stock Synchronization',
+        readonly=True,
+    )
     product_binding_ids = fields.One2many(
         comodel_name='magento.product.product',
         inverse_name='backend_id',
@@ -198,16 +338,74 @@ class MagentoBackend(models.Model):
             magento_location.use_auth_basic = True
             magento_location.auth_basic_username = self.auth_basic_username
             magento_location.auth_basic_password = self.auth_basic_password
+        if self.use_session_pool:
+            magento_location.use_session_pool = True
+            magento_location.session_pool_size = self.session_pool_size
+            magento_location.session_idle_timeout = self.session_idle_timeout
+        if self.api_rate_limit > 0 or self.api_max_concurrency > 0:
+            magento_location.throttle = MagentoThrottle(
+                self.env.cr.dbname,
+                self.id,
+                rate_limit=self.api_rate_limit,
+                max_concurrency=self.api_max_concurrency,
+                target_latency=self.api_target_latency,
+            )
+        # the binders of the session share the same cache
+        kwargs.setdefault('magento_binder_cache', MagentoBinderCache())
+        # the images are downloaded with the connections kept alive by
+        # the downloader of the process
+        if 'magento_image_downloader' not in kwargs:
+            kwargs['magento_image_downloader'] = self._get_image_downloader()
         # We create a Magento Client API here, so we can create the
         # client once (lazily on the first use) and propagate it
         # through all the sync session, instead of recreating a client
         # in each backend adapter usage.
         with MagentoAPI(magento_location) as magento_api:
+            if self.api_statistics:
+                magento_api.stats = MagentoCallStats()
+            profiler = None
+            if self.profile_jobs and 'magento_profiler' not in kwargs:
+                active_profiler = MagentoProfiler.active(self.env.cr)
+                if active_profiler is None:
+                    profiler = MagentoProfiler(self.env.cr, magento_api)
+                    kwargs['magento_profiler'] = profiler
+                else:
+                    # nested session, measured by the profiler of the
+                    # outer session, which records the measures
+                    active_profiler.add_api(magento_api)
+                    kwargs['magento_profiler'] = active_profiler
             _super = super(MagentoBackend, self)
             # from the components we'll be able to do: self.work.magento_api
-            with _super.work_on(
-                    model_name, magento_api=magento_api, **kwargs) as work:
-                yield work
+            with _super.work_on(model_name, magento_api=magento_api,
+                                **kwargs) as work:
+                if profiler is None:
+                    yield work
+                else:
+                    # the queries are timed until the end of the session,
+                    # even when it fails
+                    with profiler.time_queries():
+                        yield work
+            if magento_api.stats is not None:
+                self.env['magento.api.stat']._record_stats(
+                    self, magento_api.stats
+                )
+            if profiler is not None:
+                self.env['magento.job.profile']._record_profile(
+                    self, profiler
+                )
+
+    @api.multi
+    def _get_image_downloader(self):
+        """ Return the :class:`MagentoImageDownloader` of the backend
+
+        The downloader is shared by the backends having the same
+        credentials in the process.
+        """
+        self.ensure_one()
+        auth = None
+        if self.auth_basic_username and self.auth_basic_password:
+            auth = (self.auth_basic_username, self.auth_basic_password)
+        return MagentoImageDownloader.shared(auth=auth)
 
     @api.multi
     def add_checkpoint(self, record):
@@ -216,6 +414,40 @@ class MagentoBackend(models.Model):
         return checkpoint.add_checkpoint(self.env, record._name, record.id,
                                          self._name, self.id)
 
+    @api.multi
+    def add_checkpoints(self, records):
+        """ Add a checkpoint for each record of a recordset
+
+        The model is looked up once and the checkpoints are created
+        without tracking nor creation log. The connector managers are
+        subscribed to all of them at once.
+        """
+        self.ensure_one()
+        if not records:
+            return
+        model = self.env['ir.model'].search(
+            [('model', '=', records._name)], limit=1
+        )
+        assert model, "The model %s does not exist" % records._name
+        checkpoint_model = self.env['connector.checkpoint'].with_context(
+            tracking_disable=True,
+            mail_create_nolog=True,
+        )
+        checkpoints = checkpoint_model.browse()
+        backend = '%s,%s' % (self._name, self.id)
+        for record in records:
+            checkpoints |= checkpoint_model.create({
+                'model_id': model.id,
+                'record_id': record.id,
+                'backend_id': backend,
+            })
+        group = self.env.ref('connector.group_connector_manager')
+        users = self.env['res.users'].search(
+            [('groups_id', '=', group.id)]
+        )
+        checkpoints.message_subscribe_users(user_ids=users.ids)
+        return checkpoints
+
     @api.multi
     def synchronize_metadata(self):
         try:
@@ -308,12 +540,37 @@ class MagentoBackend(models.Model):
             ('no_stock_sync', '=', False),
         ]
 
+    @api.multi
+    def _must_full_sync_stock(self):
+        """ Return True if all the stock quantities must be recomputed """
+        self.ensure_one()
+        if not self.incremental_stock_sync or not self.last_full_stock_sync:
+            return True
+        last_sync = fields.Datetime.from_string(self.last_full_stock_sync)
+        interval = timedelta(hours=self.full_stock_sync_interval)
+        return last_sync + interval <= datetime.now()
+
     @api.multi
     def update_product_stock_qty(self):
         mag_product_obj = self.env['magento.product.product']
-        domain = self._domain_for_update_product_stock_qty()
-        magento_products = mag_product_obj.search(domain)
-        magento_products.recompute_magento_qty()
+        journal = self.env['magento.stock.journal']
+        full_backends = self.filtered(lambda b: b._must_full_sync_stock())
+        if full_backends:
+            # the changes are included in the full synchronization
+            journal.pop_products(full_backends)
+            sync_date = fields.Datetime.now()
+            domain = full_backends._domain_for_update_product_stock_qty()
+            magento_products = mag_product_obj.search(domain)
+            magento_products.recompute_magento_qty()
+            full_backends.write({'last_full_stock_sync': sync_date})
+        for backend in self - full_backends:
+            product_ids = journal.pop_products(backend)
+            if not product_ids:
+                continue
+            domain = backend._domain_for_update_product_stock_qty()
+            domain.append(('odoo_id', 'in', product_ids))
+            magento_products = mag_product_obj.search(domain)
+            magento_products.recompute_magento_qty()
         return True
 
     @api.model
@@ -349,6 +606,80 @@ class MagentoBackend(models.Model):
         self._magento_backend('update_product_stock_qty', domain=domain)
 
 
+class MagentoBackendThrottle(models.Model):
+    """ State of the limits of the API calls of a backend
+
+    The rows are updated in SQL by ``MagentoThrottle`` (in the backend
+    adapters module), outside of the transactions of the jobs.
+    """
+    _name = 'magento.backend.throttle'
+    _description = 'Magento API Throttling'
+    _log_access = False
+
+    backend_id = fields.Many2one(
+        comodel_name='magento.backend',
+        string='Magento Backend',
+        required=True,
+        ondelete='cascade',
+        readonly=True,
+    )
+    tokens = fields.Float(readonly=True)
+    updated_at = fields.Datetime(readonly=True)
+    rate_factor = fields.Float(
+        string='Rate Factor',
+        default=1.0,
+        readonly=True,
+        help="Part of the maximum rate currently allowed, lowered "
+             "when Magento is slow or fails.",
+    )
+    call_count = fields.Integer(string='Calls', readonly=True)
+    error_count = fields.Integer(string='Errors', readonly=True)
+    total_time = fields.Float(string='Total Time (s)', readonly=True)
+    last_latency = fields.Float(string='Last Latency (s)', readonly=True)
+    average_latency = fields.Float(
+        string='Average Latency (s)',
+        compute='_compute_average_latency',
+    )
+
+    _sql_constraints = [
+        ('backend_uniq', 'unique(backend_id)',
+         'A backend can have only one throttling state.'),
+    ]
+
+    @api.depends('call_count', 'total_time')
+    def _compute_average_latency(self):
+        for throttle in self:
+            if throttle.call_count:
+                throttle.average_latency = (throttle.total_time /
+                                            throttle.call_count)
+
+
+class MagentoBackendThrottleSlot(models.Model):
+    """ Slot of concurrent API calls of a backend
+
+    A call leases a free slot until it is done; the lease expires in
+    case the call never releases it.
+    """
+    _name = 'magento.backend.throttle.slot'
+    _description = 'Magento API Concurrent Call Slot'
+    _log_access = False
+
+    backend_id = fields.Many2one(
+        comodel_name='magento.backend',
+        string='Magento Backend',
+        required=True,
+        ondelete='cascade',
+        readonly=True,
+    )
+    slot = fields.Integer(required=True, readonly=True)
+    leased_until = fields.Datetime(string='Leased Until', readonly=True)
+
+    _sql_constraints = [
+        ('backend_slot_uniq', 'unique(backend_id, slot)',
+         'A slot must be unique per backend.'),
+    ]
+
+
 class MagentoConfigSpecializer(models.AbstractModel):
     _name = 'magento.config.specializer'
 
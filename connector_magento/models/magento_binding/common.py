@@ -2,7 +2,7 @@
 # © 2013-2017 Guewen Baconnier,Camptocamp SA,Akretion
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import api, models, fields
+from odoo import api, models, fields, tools
 from odoo.addons.queue_job.job import job, related_action
 
 
@@ -45,11 +45,30 @@ class MagentoBinding(models.AbstractModel):
     @job(default_channel='root.magento')
     @related_action(action='related_action_magento_link')
     @api.model
-    def import_record(self, backend, external_id, force=False):
+    def import_record(self, backend, external_id, force=False,
+                      updated_at=None):
         """ Import a Magento record """
         with backend.work_on(self._name) as work:
             importer = work.component(usage='record.importer')
-            return importer.run(external_id, force=force)
+            return importer.run(external_id, force=force,
+                                updated_at=updated_at)
+
+    @job(default_channel='root.magento')
+    @related_action(action='related_action_unwrap_binding')
+    @api.multi
+    def import_translations(self, mapper=None):
+        """ Import the translations of a record """
+        self.ensure_one()
+        with self.backend_id.work_on(self._name) as work:
+            importer = work.component(usage='translation.importer')
+            return importer.run(self.external_id, self, mapper=mapper)
+
+    @api.model
+    @tools.ormcache('self._name')
+    def _get_translatable_fields(self):
+        """ Return the names of the translatable fields of the model """
+        return tuple(name for name, field in self._fields.iteritems()
+                     if field.translate)
 
     @job(default_channel='root.magento')
     @related_action(action='related_action_unwrap_binding')
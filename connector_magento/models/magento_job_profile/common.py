@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+
+class MagentoJobProfile(models.Model):
+    """ Measures of a phase of the synchronizations of a session
+
+    Created at the end of each synchronization session (usually a job)
+    when the profiling is activated on the backend, the records are
+    meant to be aggregated by binding model and phase.
+    The durations are in milliseconds and include the nested phases.
+    """
+    _name = 'magento.job.profile'
+    _description = 'Magento Synchronization Profile'
+    _order = 'date desc, id'
+
+    backend_id = fields.Many2one(
+        comodel_name='magento.backend',
+        string='Magento Backend',
+        required=True,
+        ondelete='cascade',
+        index=True,
+    )
+    date = fields.Datetime(required=True, index=True)
+    job_uuid = fields.Char(string='Job UUID', index=True)
+    model = fields.Char(string='Binding Model', required=True, index=True)
+    phase = fields.Char(required=True, index=True)
+    count = fields.Integer()
+    wall_time = fields.Float(string='Wall Time (ms)')
+    sql_count = fields.Integer(string='SQL Queries')
+    sql_time = fields.Float(string='SQL Time (ms)')
+    api_time = fields.Float(string='API Time (ms)')
+
+    @api.model
+    def _record_profile(self, backend, profiler):
+        """ Store the measures of a session
+
+        A summary is added on the job running the session.
+        """
+        job_uuid = self.env['queue.job']._running_job_uuid()
+        now = fields.Datetime.now()
+        summary = []
+        for (model, phase), values in profiler.phases.items():
+            self.sudo().create({
+                'backend_id': backend.id,
+                'date': now,
+                'job_uuid': job_uuid,
+                'model': model,
+                'phase': phase,
+                'count': values['count'],
+                'wall_time': values['time'],
+                'sql_count': values['sql_count'],
+                'sql_time': values['sql_time'],
+                'api_time': values['api_time'],
+            })
+            summary.append(
+                u'%s %s: %d ms, %d queries (%d ms), API %d ms' %
+                (model, phase, values['time'], values['sql_count'],
+                 values['sql_time'], values['api_time'])
+            )
+        self.env['queue.job']._add_running_job_summary('magento_profile',
+                                                       summary)
+
+    @api.model
+    def _scheduler_remove_old_profiles(self, days=30):
+        """ Remove the measures older than ``days`` """
+        limit = fields.Datetime.to_string(
+            fields.Datetime.from_string(fields.Datetime.now()) -
+            timedelta(days=days)
+        )
+        self.search([('date', '<', limit)]).unlink()
@@ -5,7 +5,7 @@
 
 import logging
 import xmlrpclib
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 from odoo.addons.queue_job.job import job
 from odoo.addons.component.core import Component
 
@@ -31,6 +31,44 @@ class ResPartner(models.Model):
     birthday = fields.Date(string='Birthday')
     company = fields.Char(string='Company')
 
+    @api.model_cr
+    def init(self):
+        super(ResPartner, self).init()
+        # index for the search of the partners by email when the
+        # customers are imported, see _magento_search_by_email
+        self.env.cr.execute("SELECT indexname FROM pg_indexes "
+                            "WHERE indexname = %s",
+                            ('res_partner_magento_email_index',))
+        if not self.env.cr.fetchone():
+            self.env.cr.execute(
+                "CREATE INDEX res_partner_magento_email_index "
+                "ON res_partner (lower(trim(email)))"
+            )
+
+    @api.model
+    def _magento_search_by_email(self, email):
+        """ Return the customer with an email, which can bind a Magento
+        customer
+
+        :param email: email normalized with
+                      ``magento.res.partner._normalize_email``
+        """
+        # same expression as the index, the ORM cannot search on it
+        self.env.cr.execute("SELECT id FROM res_partner "
+                            "WHERE lower(trim(email)) = %s",
+                            (email,))
+        partner_ids = [row[0] for row in self.env.cr.fetchall()]
+        if not partner_ids:
+            return self.browse()
+        return self.search(
+            [('id', 'in', partner_ids),
+             ('customer', '=', True),
+             '|',
+             ('is_company', '=', True),
+             ('parent_id', '=', False)],
+            limit=1,
+        )
+
     @api.model
     def _address_fields(self):
         """ Returns the list of address fields that are synced from the
@@ -49,6 +87,117 @@ class ResPartner(models.Model):
         return super(ResPartner, self).import_batch(backend, filters=filters)
 
 
+class ResCountry(models.Model):
+    _inherit = 'res.country'
+
+    @api.model
+    def _magento_search_by_code(self, code):
+        """ Return the country of a Magento country code
+
+        The lookups are cached, the cache is cleared when the countries
+        are modified.
+        """
+        code = code.strip().upper()
+        return self.browse(self._magento_country_id_by_code(code))
+
+    @tools.ormcache('self._uid', 'code')
+    def _magento_country_id_by_code(self, code):
+        return self.search([('code', '=', code)], limit=1).id
+
+    @api.model
+    def create(self, vals):
+        self.clear_caches()
+        return super(ResCountry, self).create(vals)
+
+    @api.multi
+    def write(self, vals):
+        if 'code' in vals:
+            self.clear_caches()
+        return super(ResCountry, self).write(vals)
+
+    @api.multi
+    def unlink(self):
+        self.clear_caches()
+        return super(ResCountry, self).unlink()
+
+
+class ResCountryState(models.Model):
+    _inherit = 'res.country.state'
+
+    @api.model
+    def _magento_search_by_region(self, region, country=None):
+        """ Return the state of a Magento region name
+
+        The state is searched in the country when one is given, then in
+        all the countries. The lookups are cached, the cache is cleared
+        when the states are modified.
+        """
+        region = region.strip().lower()
+        state_id = None
+        if country:
+            state_id = self._magento_state_id_by_region(region, country.id)
+        if not state_id:
+            state_id = self._magento_state_id_by_region(region, None)
+        return self.browse(state_id)
+
+    @tools.ormcache('self._uid', 'region', 'country_id')
+    def _magento_state_id_by_region(self, region, country_id):
+        domain = [('name', '=ilike', region)]
+        if country_id:
+            domain.append(('country_id', '=', country_id))
+        return self.search(domain, limit=1).id
+
+    @api.model
+    def create(self, vals):
+        self.clear_caches()
+        return super(ResCountryState, self).create(vals)
+
+    @api.multi
+    def write(self, vals):
+        if {'name', 'country_id'}.intersection(vals):
+            self.clear_caches()
+        return super(ResCountryState, self).write(vals)
+
+    @api.multi
+    def unlink(self):
+        self.clear_caches()
+        return super(ResCountryState, self).unlink()
+
+
+class ResPartnerTitle(models.Model):
+    _inherit = 'res.partner.title'
+
+    @api.model
+    def _magento_search_by_prefix(self, prefix):
+        """ Return the title of a Magento name prefix
+
+        The lookups are cached, the cache is cleared when the titles
+        are modified.
+        """
+        prefix = prefix.strip().lower()
+        return self.browse(self._magento_title_id_by_prefix(prefix))
+
+    @tools.ormcache('self._uid', 'prefix')
+    def _magento_title_id_by_prefix(self, prefix):
+        return self.search([('shortcut', '=ilike', prefix)], limit=1).id
+
+    @api.model
+    def create(self, vals):
+        self.clear_caches()
+        return super(ResPartnerTitle, self).create(vals)
+
+    @api.multi
+    def write(self, vals):
+        if 'shortcut' in vals:
+            self.clear_caches()
+        return super(ResPartnerTitle, self).write(vals)
+
+    @api.multi
+    def unlink(self):
+        self.clear_caches()
+        return super(ResPartnerTitle, self).unlink()
+
+
 class MagentoResPartner(models.Model):
     _name = 'magento.res.partner'
     _inherit = 'magento.binding'
@@ -81,6 +230,10 @@ class MagentoResPartner(models.Model):
     updated_at = fields.Datetime(string='Updated At (on Magento)',
                                  readonly=True)
     emailid = fields.Char(string='E-mail address')
+    email_normalized = fields.Char(
+        string='Normalized E-mail address',
+        readonly=True,
+    )
     taxvat = fields.Char(string='Magento VAT')
     newsletter = fields.Boolean(string='Newsletter')
     guest_customer = fields.Boolean(string='Guest Customer')
@@ -92,6 +245,85 @@ class MagentoResPartner(models.Model):
              "is not merged with the billing address.",
     )
 
+    @api.model_cr
+    def init(self):
+        # fill the normalized emails of the existing customers in one
+        # query rather than recomputing them through the ORM, see
+        # _normalize_email
+        self.env.cr.execute(
+            "UPDATE magento_res_partner "
+            "SET email_normalized = NULLIF(lower(trim(emailid)), '') "
+            "WHERE email_normalized IS NULL AND emailid IS NOT NULL"
+        )
+        # index for the searches of the customers by email in the
+        # imports of the guest orders, see _magento_search_by_emails
+        self.env.cr.execute("SELECT indexname FROM pg_indexes "
+                            "WHERE indexname = %s",
+                            ('magento_res_partner_email_website_index',))
+        if not self.env.cr.fetchone():
+            self.env.cr.execute(
+                "CREATE INDEX magento_res_partner_email_website_index "
+                "ON magento_res_partner (email_normalized, website_id)"
+            )
+
+    @staticmethod
+    def _normalize_email(email):
+        """ Lower-case the email and strip its spaces, like
+        ``lower(trim(email))`` does in the queries and indexes
+        """
+        if not email:
+            return False
+        return email.strip(' ').lower() or False
+
+    @api.model
+    def create(self, vals):
+        if 'emailid' in vals:
+            vals = dict(vals, email_normalized=self._normalize_email(
+                vals['emailid']
+            ))
+        return super(MagentoResPartner, self).create(vals)
+
+    @api.multi
+    def write(self, vals):
+        if 'emailid' in vals:
+            vals = dict(vals, email_normalized=self._normalize_email(
+                vals['emailid']
+            ))
+        return super(MagentoResPartner, self).write(vals)
+
+    @api.model
+    def _magento_search_by_emails(self, emails, website):
+        """ Return the customers of a website with the given emails
+
+        The emails are compared lower-cased and all the customers are
+        searched in one query.
+
+        :param website: ``magento.website`` record
+        :returns: dict ``{email: binding}``, the binding is the first
+                  customer created with the email or an empty recordset
+        """
+        normalized = {email: self._normalize_email(email)
+                      for email in emails}
+        bindings = self.search(
+            [('email_normalized', 'in',
+              [value for value in normalized.itervalues() if value]),
+             ('website_id', '=', website.id)],
+            order='id',
+        )
+        by_email = {}
+        for binding in bindings:
+            by_email.setdefault(binding.email_normalized, binding)
+        return {email: by_email.get(value, self.browse())
+                for email, value in normalized.iteritems()}
+
+    @job(default_channel='root.magento')
+    @api.model
+    def import_bulk(self, backend, external_ids):
+        """ Import a chunk of partners with their addresses """
+        with backend.work_on(self._name) as work:
+            importer = work.component(usage='bulk.importer')
+            return importer.run(external_ids)
+
 
 class MagentoAddress(models.Model):
     _name = 'magento.address'
@@ -149,6 +381,7 @@ class PartnerAdapter(Component):
 
     _magento_model = 'customer'
     _admin_path = '/{model}/edit/id/{id}'
+    _search_id_field = 'entity_id'
 
     def _call(self, method, arguments):
         try:
@@ -4,10 +4,15 @@
 
 import logging
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+
+import psycopg2
+
+from odoo import _
 from odoo.addons.component.core import AbstractComponent, Component
-from odoo.addons.connector.exception import MappingError
+from odoo.addons.connector.exception import IDMissingInBackend, MappingError
 from odoo.addons.connector.components.mapper import mapping, only_create
+from odoo.addons.queue_job.exception import RetryableJobError
 from ...components.mapper import normalize_datetime
 
 _logger = logging.getLogger(__name__)
@@ -17,13 +22,20 @@ class PartnerBatchImporter(Component):
     """ Import the Magento Partners.
 
     For every partner in the list, a delayed job is created.
+
+    When the backend imports the partners in bulk, a job imports a
+    chunk of partners instead.
     """
     _name = 'magento.partner.batch.importer'
     _inherit = 'magento.delayed.batch.importer'
     _apply_on = 'magento.res.partner'
 
-    def run(self, filters=None):
-        """ Run the synchronization """
+    # number of partners imported by a job when the backend imports
+    # the partners in bulk
+    _bulk_size = 100
+
+    def _search(self, filters):
+        """ Search the ids of the partners to import """
         from_date = filters.pop('from_date', None)
         to_date = filters.pop('to_date', None)
         magento_website_ids = [filters.pop('magento_website_id')]
@@ -34,8 +46,82 @@ class PartnerBatchImporter(Component):
             magento_website_ids=magento_website_ids)
         _logger.info('search for magento partners %s returned %s',
                      filters, record_ids)
-        for record_id in record_ids:
-            self._import_record(record_id)
+        return record_ids
+
+    def _import_records(self, external_ids):
+        """ Delay the import of the partners by chunks in bulk mode """
+        if not self.backend_record.import_partners_bulk:
+            return super(PartnerBatchImporter, self)._import_records(
+                external_ids
+            )
+        size = self._bulk_size
+        for start in xrange(0, len(external_ids), size):
+            chunk = external_ids[start:start + size]
+            description = _('Import partners %s to %s') % (chunk[0],
+                                                           chunk[-1])
+            self.model.with_delay(
+                description=description,
+            ).import_bulk(self.backend_record, chunk)
+
+
+class PartnerBulkImporter(Component):
+    """ Import a chunk of partners with their addresses
+
+    The customers are read in one request, then the lists of addresses
+    of all the customers and the addresses are read in two other
+    requests. The partners are imported in the same transaction.
+
+    Odoo has no multi-record ``create``: the partners and their
+    addresses are still created one by one by the record importer,
+    the bulk import saves the requests to Magento and the jobs.
+
+    A partner which cannot be imported is rolled back and its import is
+    delayed in a job of its own, so the error is reported on this
+    partner and does not prevent the import of the other ones.
+    """
+    _name = 'magento.partner.bulk.importer'
+    _inherit = 'base.magento.connector'
+    _apply_on = 'magento.res.partner'
+    _usage = 'bulk.importer'
+
+    def _read_customers(self, external_ids):
+        records = OrderedDict()
+        results = self.backend_adapter.read_many(external_ids)
+        for external_id, result in zip(external_ids, results):
+            try:
+                records[external_id] = result.result()
+            except IDMissingInBackend:
+                _logger.info('Customer %s does no longer exist in Magento.',
+                             external_id)
+        return records
+
+    def run(self, external_ids):
+        records = self._read_customers(external_ids)
+        if not records:
+            return
+        book = self.component(usage='address.book',
+                              model_name='magento.address')
+        addresses = book.read_addresses(records.keys())
+        for external_id, record in records.iteritems():
+            importer = self.component(usage='record.importer')
+            try:
+                with self.env.cr.savepoint():
+                    importer.run(external_id, data=record,
+                                 addresses=addresses[external_id])
+            except (RetryableJobError, psycopg2.OperationalError):
+                # locks and concurrent updates: the whole chunk is
+                # retried
+                raise
+            except Exception:
+                _logger.exception('Partner %s could not be imported in '
+                                  'bulk, delaying its import.', external_id)
+                # the caches may contain the records rolled back
+                self.env.invalidate_all()
+                cache = getattr(self.work, 'magento_binder_cache', None)
+                if cache is not None:
+                    cache.clear()
+                self.model.with_delay().import_record(self.backend_record,
+                                                      external_id)
 
 
 class PartnerImportMapper(Component):
@@ -122,14 +208,20 @@ class PartnerImportMapper(Component):
     @mapping
     def odoo_id(self, record):
         """ Will bind the customer on a existing partner
-        with the same email """
-        partner = self.env['res.partner'].search(
-            [('email', '=', record['email']),
-             ('customer', '=', True),
-             '|',
-             ('is_company', '=', True),
-             ('parent_id', '=', False)],
-            limit=1,
+        with the same email, compared lower-cased """
+        binder = self.binder_for(model='magento.website')
+        website = binder.to_internal(record['website_id'])
+        email = record['email']
+        binding = self.model._magento_search_by_emails(
+            [email], website
+        )[email]
+        if binding:
+            return {'odoo_id': binding.odoo_id.id}
+        normalized = self.model._normalize_email(email)
+        if not normalized:
+            return
+        partner = self.env['res.partner']._magento_search_by_email(
+            normalized
         )
         if partner:
             return {'odoo_id': partner.id}
@@ -140,6 +232,19 @@ class PartnerImporter(Component):
     _inherit = 'magento.importer'
     _apply_on = 'magento.res.partner'
 
+    def run(self, external_id, force=False, data=None, updated_at=None,
+            addresses=None):
+        """ Run the synchronization
+
+        :param addresses: addresses of the customer already read, as
+                          returned by
+                          :meth:`PartnerAddressBook.read_addresses`
+        """
+        self.addresses = addresses
+        return super(PartnerImporter, self).run(external_id, force=force,
+                                                data=data,
+                                                updated_at=updated_at)
+
     def _import_dependencies(self):
         """ Import the dependencies for the record"""
         record = self.magento_record
@@ -150,7 +255,8 @@ class PartnerImporter(Component):
         """ Import the addresses """
         book = self.component(usage='address.book',
                               model_name='magento.address')
-        book.import_addresses(self.external_id, partner_binding.id)
+        book.import_addresses(self.external_id, partner_binding.id,
+                              addresses=self.addresses)
 
 
 AddressInfos = namedtuple('AddressInfos', ['magento_record',
@@ -190,21 +296,59 @@ class PartnerAddressBook(Component):
     _apply_on = 'magento.address'
     _usage = 'address.book'
 
-    def import_addresses(self, magento_partner_id, partner_binding_id):
+    def import_addresses(self, magento_partner_id, partner_binding_id,
+                         addresses=None):
         addresses = self._get_address_infos(magento_partner_id,
-                                            partner_binding_id)
+                                            partner_binding_id,
+                                            addresses=addresses)
         for address_id, infos in addresses:
             importer = self.component(usage='record.importer')
             importer.run(address_id, address_infos=infos)
 
-    def _get_address_infos(self, magento_partner_id, partner_binding_id):
+    def read_addresses(self, magento_partner_ids):
+        """ Read the addresses of several customers
+
+        The lists of addresses of the customers are read in one request
+        and all the addresses in another one.
+
+        :returns: dict ``{customer id: [(address id, result)]}`` where
+                  the results are
+                  :class:`~.backend_adapter.MagentoDeferredResult`
+        """
         adapter = self.component(usage='backend.adapter')
-        mag_address_ids = adapter.search({'customer_id':
-                                          {'eq': magento_partner_id}})
-        if not mag_address_ids:
-            return
-        for address_id in mag_address_ids:
-            magento_record = adapter.read(address_id)
+        with adapter.call_batch():
+            searches = [
+                adapter.defer('search_read',
+                              {'customer_id': {'eq': partner_id}})
+                for partner_id in magento_partner_ids
+            ]
+        address_ids = OrderedDict(
+            (partner_id, [int(row['customer_address_id'])
+                          for row in search.result()])
+            for partner_id, search in zip(magento_partner_ids, searches)
+        )
+        all_ids = [address_id for ids in address_ids.itervalues()
+                   for address_id in ids]
+        results = {}
+        if all_ids:
+            results = dict(zip(all_ids, adapter.read_many(all_ids)))
+        return {partner_id: [(address_id, results[address_id])
+                             for address_id in ids]
+                for partner_id, ids in address_ids.iteritems()}
+
+    def _get_address_infos(self, magento_partner_id, partner_binding_id,
+                           addresses=None):
+        if addresses is None:
+            adapter = self.component(usage='backend.adapter')
+            mag_address_ids = adapter.search({'customer_id':
+                                              {'eq': magento_partner_id}})
+            if not mag_address_ids:
+                return
+            # read all the addresses in one request
+            results = adapter.read_many(mag_address_ids)
+            addresses = zip(mag_address_ids, results)
+        for address_id, result in addresses:
+            magento_record = result.result()
 
             # defines if the billing address is merged with the partner
             # or imported as a standalone contact
@@ -253,25 +397,26 @@ class BaseAddressImportMapper(AbstractComponent):
               ('company', 'company'),
               ]
 
+    def _country(self, record):
+        if not record.get('country_id'):
+            return self.env['res.country'].browse()
+        return self.env['res.country']._magento_search_by_code(
+            record['country_id']
+        )
+
     @mapping
     def state(self, record):
         if not record.get('region'):
             return
-        state = self.env['res.country.state'].search(
-            [('name', '=ilike', record['region'])],
-            limit=1,
+        state = self.env['res.country.state']._magento_search_by_region(
+            record['region'], country=self._country(record),
         )
         if state:
             return {'state_id': state.id}
 
     @mapping
     def country(self, record):
-        if not record.get('country_id'):
-            return
-        country = self.env['res.country'].search(
-            [('code', '=', record['country_id'])],
-            limit=1,
-        )
+        country = self._country(record)
         if country:
             return {'country_id': country.id}
 
@@ -294,9 +439,8 @@ class BaseAddressImportMapper(AbstractComponent):
         prefix = record['prefix']
         if not prefix:
             return
-        title = self.env['res.partner.title'].search(
-            [('shortcut', '=ilike', prefix)],
-            limit=1
+        title = self.env['res.partner.title']._magento_search_by_prefix(
+            prefix
         )
         if not title:
             title = self.env['res.partner.title'].create(
@@ -362,14 +506,16 @@ class AddressImporter(Component):
     _inherit = 'magento.importer'
     _apply_on = 'magento.address'
 
-    def run(self, external_id, address_infos=None, force=False):
+    def run(self, external_id, address_infos=None, force=False,
+            updated_at=None):
         """ Run the synchronization """
         if address_infos is None:
             # only possible for updates
             self.address_infos = AddressInfos(None, None, None)
         else:
             self.address_infos = address_infos
-        return super(AddressImporter, self).run(external_id, force=force)
+        return super(AddressImporter, self).run(external_id, force=force,
+                                                updated_at=updated_at)
 
     def _get_magento_data(self):
         """ Return the raw Magento data for ``self.external_id`` """
@@ -12,12 +12,29 @@ from odoo import models, fields, api
 from odoo.addons.connector.exception import IDMissingInBackend
 from odoo.addons.component.core import Component
 from odoo.addons.component_event import skip_if
-from odoo.addons.queue_job.job import job, related_action
+from odoo.addons.queue_job.job import (Job, job, related_action,
+                                       ENQUEUED, PENDING)
 from ...components.backend_adapter import MAGENTO_DATETIME_FORMAT
 
 _logger = logging.getLogger(__name__)
 
 
+# stock fields which can be computed with
+# MagentoProductProduct._magento_qty_sql
+SQL_STOCK_FIELDS = ('qty_available',
+                    'virtual_available',
+                    'incoming_qty',
+                    'outgoing_qty',
+                    )
+
+
+# fields exported by the inventory exports
+INVENTORY_FIELDS = ('manage_stock',
+                    'backorders',
+                    'magento_qty',
+                    )
+
+
 def chunks(items, length):
     for index in xrange(0, len(items), length):
         yield items[index:index + length]
@@ -83,6 +100,20 @@ class MagentoProductProduct(models.Model):
         help="Check this to exclude the product "
              "from stock synchronizations.",
     )
+    magento_image_file = fields.Char(
+        string='Image File (on Magento)',
+        readonly=True,
+    )
+    magento_image_hash = fields.Char(
+        string='Image Hash',
+        readonly=True,
+        help="SHA-1 of the image imported from Magento",
+    )
+    magento_image_etag = fields.Char(string='Image ETag', readonly=True)
+    magento_image_last_modified = fields.Char(
+        string='Image Last Modified',
+        readonly=True,
+    )
 
     RECOMPUTE_QTY_STEP = 1000  # products at a time
 
@@ -96,6 +127,74 @@ class MagentoProductProduct(models.Model):
             exporter = work.component(usage='product.inventory.exporter')
             return exporter.run(self, fields)
 
+    @job(default_channel='root.magento')
+    @related_action(action='related_action_unwrap_binding')
+    @api.multi
+    def import_images(self):
+        """ Import the images of a product. """
+        self.ensure_one()
+        with self.backend_id.work_on(self._name) as work:
+            importer = work.component(usage='product.image.importer')
+            return importer.run(self.external_id, self)
+
+    @api.multi
+    def delay_export_inventory(self, fields=None, priority=20):
+        """ Delay the export of the inventory of the products
+
+        When an export of the inventory of a product is already pending,
+        the fields are added to the pending job instead of creating a
+        new one. An export already sent to a worker may read the values
+        before the current transaction is committed, so a new job is
+        always created next to it.
+
+        :param fields: inventory fields to export, all of them when None
+        """
+        fields = sorted(INVENTORY_FIELDS if fields is None else fields)
+        job_model = self.env['queue.job'].sudo()
+        for record in self:
+            identity_key = '%s(%d).export_inventory' % (self._name, record.id)
+            jobs = job_model.search([('identity_key', '=', identity_key),
+                                     ('state', 'in', [PENDING, ENQUEUED])],
+                                    order='id')
+            pending = jobs.filtered(lambda job: job.state == PENDING)[:1]
+            if pending:
+                pending_fields = pending.kwargs.get('fields')
+                if pending_fields is None:
+                    pending_fields = list(INVENTORY_FIELDS)
+                merged_fields = sorted(set(pending_fields) | set(fields))
+                if merged_fields != pending_fields:
+                    kwargs = dict(pending.kwargs, fields=merged_fields)
+                    pending.write({'kwargs': kwargs})
+                continue
+            if jobs:
+                # queue_job would return the export sent to a worker
+                # for the identity key, so the new job is stored
+                # directly
+                Job(record.export_inventory,
+                    kwargs={'fields': fields},
+                    priority=priority,
+                    identity_key=identity_key).store()
+                continue
+            record.with_delay(
+                priority=priority,
+                identity_key=identity_key,
+            ).export_inventory(fields=fields)
+
+    @job(default_channel='root.magento')
+    @api.multi
+    def export_inventory_batch(self, fields=None):
+        """ Export the inventory of several products in one request.
+
+        All the products must belong to the same backend.
+        """
+        if not self:
+            return
+        backend = self.mapped('backend_id')
+        backend.ensure_one()
+        with backend.work_on(self._name) as work:
+            exporter = work.component(usage='product.inventory.batch.exporter')
+            return exporter.run(self, fields)
+
     @api.multi
     def recompute_magento_qty(self):
         """ Check if the quantity in the stock location configured
@@ -139,10 +238,35 @@ class MagentoProductProduct(models.Model):
         else:
             location = backend.warehouse_id.lot_stock_id
 
+        if (backend.sql_stock_recompute and not read_fields and
+                self._can_recompute_magento_qty_sql(stock_field)):
+            new_qties = self._magento_qty_sql(products, location,
+                                              stock_field)
+        else:
+            new_qties = self._magento_qty_orm(products, backend, location,
+                                              stock_field,
+                                              read_fields=read_fields)
+        if not new_qties:
+            return
+        if backend.bulk_stock_export:
+            self._update_magento_qty_bulk(backend, new_qties)
+        else:
+            for binding_id, new_qty in sorted(new_qties.iteritems()):
+                self.browse(binding_id).magento_qty = new_qty
+
+    @api.model
+    def _magento_qty_orm(self, products, backend, location, stock_field,
+                         read_fields=None):
+        """ Compute the new quantities using :meth:`~._magento_qty`
+
+        :returns: new quantity for each binding id whose quantity changed
+        :rtype: dict
+        """
         product_fields = ['magento_qty', stock_field]
         if read_fields:
             product_fields += read_fields
 
+        new_qties = {}
         self_with_location = self.with_context(location=location.id)
         for chunk_ids in chunks(products.ids, self.RECOMPUTE_QTY_STEP):
             records = self_with_location.browse(chunk_ids)
@@ -152,7 +276,130 @@ class MagentoProductProduct(models.Model):
                                             location,
                                             stock_field)
                 if new_qty != product['magento_qty']:
-                    self.browse(product['id']).magento_qty = new_qty
+                    new_qties[product['id']] = new_qty
+        return new_qties
+
+    @api.model
+    def _can_recompute_magento_qty_sql(self, stock_field):
+        """ Return True if the quantities can be computed in SQL
+
+        It is possible only for the standard stock fields and when
+        :meth:`~._magento_qty` is not overridden, because the SQL
+        query would then ignore the customization.
+        """
+        if stock_field not in SQL_STOCK_FIELDS:
+            return False
+        base_method = MagentoProductProduct._magento_qty.im_func
+        return type(self)._magento_qty.im_func is base_method
+
+    @api.model
+    def _magento_qty_sql(self, products, location, stock_field):
+        """ Compute the new quantities in one query
+
+        The quantities of the products in the location and its children
+        are computed from the quants and the moves like the standard
+        stock fields, rounded to the unit of measure, and compared to
+        the current ``magento_qty``.
+
+        :returns: new quantity for each binding id whose quantity changed
+        :rtype: dict
+        """
+        if not products:
+            return {}
+        # flush the pending computations of the ORM
+        self.env['stock.move'].recompute()
+        qty_expr = {
+            'qty_available': 'COALESCE(q.qty, 0)',
+            'incoming_qty': 'COALESCE(i.qty, 0)',
+            'outgoing_qty': 'COALESCE(o.qty, 0)',
+            'virtual_available': ('COALESCE(q.qty, 0) + COALESCE(i.qty, 0) '
+                                  '- COALESCE(o.qty, 0)'),
+        }[stock_field]
+        rounded_expr = ('ROUND((%s)::numeric / u.rounding) * u.rounding' %
+                        qty_expr)
+        query = """
+            WITH locations AS (
+                SELECT id FROM stock_location
+                WHERE parent_left >= %(parent_left)s
+                AND parent_left < %(parent_right)s
+            ),
+            bindings AS (
+                SELECT id, odoo_id, magento_qty
+                FROM magento_product_product
+                WHERE id = ANY(%(binding_ids)s)
+            ),
+            quants AS (
+                SELECT product_id, SUM(qty) AS qty
+                FROM stock_quant
+                WHERE location_id IN (SELECT id FROM locations)
+                AND product_id IN (SELECT odoo_id FROM bindings)
+                GROUP BY product_id
+            ),
+            incoming AS (
+                SELECT product_id, SUM(product_qty) AS qty
+                FROM stock_move
+                WHERE state IN ('waiting', 'confirmed', 'assigned')
+                AND location_dest_id IN (SELECT id FROM locations)
+                AND location_id NOT IN (SELECT id FROM locations)
+                AND product_id IN (SELECT odoo_id FROM bindings)
+                GROUP BY product_id
+            ),
+            outgoing AS (
+                SELECT product_id, SUM(product_qty) AS qty
+                FROM stock_move
+                WHERE state IN ('waiting', 'confirmed', 'assigned')
+                AND location_id IN (SELECT id FROM locations)
+                AND location_dest_id NOT IN (SELECT id FROM locations)
+                AND product_id IN (SELECT odoo_id FROM bindings)
+                GROUP BY product_id
+            ),
+            new_qty AS (
+                SELECT b.id, b.magento_qty, {qty} AS qty
+                FROM bindings b
+                JOIN product_product p ON p.id = b.odoo_id
+                JOIN product_template t ON t.id = p.product_tmpl_id
+                JOIN product_uom u ON u.id = t.uom_id
+                LEFT JOIN quants q ON q.product_id = b.odoo_id
+                LEFT JOIN incoming i ON i.product_id = b.odoo_id
+                LEFT JOIN outgoing o ON o.product_id = b.odoo_id
+            )
+            SELECT id, qty FROM new_qty
+            WHERE magento_qty IS DISTINCT FROM qty
+        """.format(qty=rounded_expr)
+        self.env.cr.execute(query, {
+            'parent_left': location.parent_left,
+            'parent_right': location.parent_right,
+            'binding_ids': products.ids,
+        })
+        return {binding_id: float(qty)
+                for binding_id, qty in self.env.cr.fetchall()}
+
+    @api.model
+    def _update_magento_qty_bulk(self, backend, new_qties):
+        """ Write the new quantities and export them by chunks
+
+        Used when the bulk stock export is activated on the backend:
+        instead of one export job per product created by the listener,
+        one job is created for each chunk of products.
+
+        :param new_qties: new quantity for each binding id
+        :type new_qties: dict
+        """
+        by_qty = defaultdict(list)
+        for binding_id, qty in new_qties.iteritems():
+            by_qty[qty].append(binding_id)
+        # the listener must not create an export job for each product
+        self_no_export = self.with_context(connector_no_export=True)
+        for qty, binding_ids in by_qty.iteritems():
+            self_no_export.browse(binding_ids).write({'magento_qty': qty})
+
+        bindings = self.browse(sorted(new_qties))
+        bindings = bindings.filtered(lambda binding: not binding.no_stock_sync)
+        chunk_size = backend.stock_export_chunk_size or 1
+        for chunk_ids in chunks(bindings.ids, chunk_size):
+            self.browse(chunk_ids).with_delay(
+                priority=20
+            ).export_inventory_batch(fields=['magento_qty'])
 
     @api.multi
     def _magento_qty(self, product, backend, location, stock_field):
@@ -168,6 +415,69 @@ class MagentoProductProduct(models.Model):
         return product[stock_field]
 
 
+class MagentoStockJournal(models.Model):
+    """ Products whose stock changed since the last stock synchronization
+
+    Filled by the stock moves for the backends using the incremental
+    stock synchronization, and emptied by the stock scheduler
+    (``magento.backend.update_product_stock_qty``).
+
+    The journal is written in SQL without unique constraint so
+    concurrent transactions can never fail on it: a product may be
+    recorded several times.
+    """
+    _name = 'magento.stock.journal'
+    _description = 'Magento Stock Changes Journal'
+    _log_access = False
+
+    backend_id = fields.Many2one(comodel_name='magento.backend',
+                                 string='Magento Backend',
+                                 required=True,
+                                 ondelete='cascade',
+                                 index=True)
+    product_id = fields.Many2one(comodel_name='product.product',
+                                 string='Product',
+                                 required=True,
+                                 ondelete='cascade')
+
+    @api.model
+    def add_products(self, product_ids):
+        """ Record a stock change for products
+
+        Only the products bound to a backend using the incremental
+        stock synchronization are recorded.
+        """
+        if not product_ids:
+            return
+        self.env.cr.execute("""
+            INSERT INTO magento_stock_journal (backend_id, product_id)
+            SELECT DISTINCT b.backend_id, b.odoo_id
+            FROM magento_product_product b
+            JOIN magento_backend mb ON mb.id = b.backend_id
+            WHERE mb.incremental_stock_sync
+            AND b.odoo_id = ANY(%s)
+            AND NOT EXISTS (
+                SELECT 1 FROM magento_stock_journal j
+                WHERE j.backend_id = b.backend_id
+                AND j.product_id = b.odoo_id
+            )
+        """, (list(product_ids),))
+
+    @api.model
+    def pop_products(self, backends):
+        """ Empty the journal of the backends
+
+        :returns: ids of the products whose stock changed
+        :rtype: list
+        """
+        self.env.cr.execute("""
+            DELETE FROM magento_stock_journal
+            WHERE backend_id IN %s
+            RETURNING product_id
+        """, (tuple(backends.ids),))
+        return list(set(row[0] for row in self.env.cr.fetchall()))
+
+
 class ProductProduct(models.Model):
     _inherit = 'product.product'
 
@@ -185,6 +495,7 @@ class ProductProductAdapter(Component):
 
     _magento_model = 'catalog_product'
     _admin_path = '/{model}/edit/id/{id}'
+    _search_id_field = 'entity_id'
 
     def _call(self, method, arguments):
         try:
@@ -201,6 +512,16 @@ class ProductProductAdapter(Component):
         """ Search records according to some criteria
         and returns a list of ids
 
+        :rtype: list
+        """
+        return [int(row['product_id']) for row
+                in self.search_read(filters, from_date=from_date,
+                                    to_date=to_date)]
+
+    def search_read(self, filters=None, from_date=None, to_date=None):
+        """ Search records according to some criteria
+        and returns their information
+
         :rtype: list
         """
         if filters is None:
@@ -213,9 +534,8 @@ class ProductProductAdapter(Component):
             filters.setdefault('updated_at', {})
             filters['updated_at']['to'] = to_date.strftime(dt_fmt)
         # TODO add a search entry point on the Magento API
-        return [int(row['product_id']) for row
-                in self._call('%s.list' % self._magento_model,
-                              [filters] if filters else [{}])]
+        return self._call('%s.list' % self._magento_model,
+                          [filters] if filters else [{}])
 
     def read(self, id, storeview_id=None, attributes=None):
         """ Returns the information of a record
@@ -244,6 +564,18 @@ class ProductProductAdapter(Component):
         return self._call('oerp_cataloginventory_stock_item.update',
                           [int(id), data])
 
+    def update_inventory_many(self, records):
+        """ Update the inventory of several products in one request
+
+        :param records: list of ``(id, data)``
+        :returns: list of deferred results in the same order than
+                  ``records``
+        """
+        with self.call_batch():
+            results = [self.defer('update_inventory', id, data)
+                       for id, data in records]
+        return results
+
 
 class MagentoBindingProductListener(Component):
     _name = 'magento.binding.product.product.listener'
@@ -252,10 +584,7 @@ class MagentoBindingProductListener(Component):
 
     # fields which should not trigger an export of the products
     # but an export of their inventory
-    INVENTORY_FIELDS = ('manage_stock',
-                        'backorders',
-                        'magento_qty',
-                        )
+    INVENTORY_FIELDS = INVENTORY_FIELDS
 
     @skip_if(lambda self, record, **kwargs: self.no_connector_export(record))
     def on_record_write(self, record, fields=None):
@@ -265,6 +594,4 @@ class MagentoBindingProductListener(Component):
             set(fields).intersection(self.INVENTORY_FIELDS)
         )
         if inventory_fields:
-            record.with_delay(priority=20).export_inventory(
-                fields=inventory_fields
-            )
+            record.delay_export_inventory(fields=inventory_fields)
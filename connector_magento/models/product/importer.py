@@ -4,15 +4,19 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
 import logging
-import urllib2
 import base64
 import sys
+import xmlrpclib
 
 from odoo import _
 from odoo.addons.component.core import Component
 from odoo.addons.connector.components.mapper import mapping
-from odoo.addons.connector.exception import MappingError, InvalidDataError
+from odoo.addons.connector.exception import (MappingError,
+                                             InvalidDataError,
+                                             IDMissingInBackend)
+from odoo.addons.queue_job.job import identity_exact
 from ...components.mapper import normalize_datetime
+from .common import INVENTORY_FIELDS
 
 _logger = logging.getLogger(__name__)
 
@@ -27,17 +31,33 @@ class ProductBatchImporter(Component):
     _inherit = 'magento.delayed.batch.importer'
     _apply_on = ['magento.product.product']
 
-    def run(self, filters=None):
-        """ Run the synchronization """
+    def __init__(self, work_context):
+        super(ProductBatchImporter, self).__init__(work_context)
+        # {external id: last update on Magento} of the products found
+        self._updated_at = {}
+
+    def _search(self, filters):
+        """ Search the ids of the products to import """
         from_date = filters.pop('from_date', None)
         to_date = filters.pop('to_date', None)
-        external_ids = self.backend_adapter.search(filters,
+        records = self.backend_adapter.search_read(filters,
                                                    from_date=from_date,
                                                    to_date=to_date)
+        external_ids = []
+        for record in records:
+            external_id = int(record['product_id'])
+            external_ids.append(external_id)
+            if record.get('updated_at'):
+                self._updated_at[external_id] = record['updated_at']
         _logger.info('search for magento products %s returned %s',
                      filters, external_ids)
-        for external_id in external_ids:
-            self._import_record(external_id)
+        return external_ids
+
+    def _import_kwargs(self, external_id):
+        kwargs = super(ProductBatchImporter, self)._import_kwargs(external_id)
+        if external_id in self._updated_at:
+            kwargs['updated_at'] = self._updated_at[external_id]
+        return kwargs
 
 
 class CatalogImageImporter(Component):
@@ -77,45 +97,82 @@ class CatalogImageImporter(Component):
             return (primary, -position)
         return sorted(images, key=priority)
 
-    def _get_binary_image(self, image_data):
-        url = image_data['url'].encode('utf8')
-        try:
-            request = urllib2.Request(url)
-            if self.backend_record.auth_basic_username \
-                    and self.backend_record.auth_basic_password:
-                base64string = base64.b64encode(
-                    '%s:%s' % (self.backend_record.auth_basic_username,
-                               self.backend_record.auth_basic_password))
-                request.add_header("Authorization", "Basic %s" % base64string)
-            binary = urllib2.urlopen(request)
-        except urllib2.HTTPError as err:
-            if err.code == 404:
-                # the image is just missing, we skip it
-                return
-            else:
-                # we don't know why we couldn't download the image
-                # so we propagate the error, the import will fail
-                # and we have to check why it couldn't be accessed
-                raise
-        else:
-            return binary.read()
+    def _image_request_headers(self, binding, image_data):
+        """ Headers of a conditional request for the image
 
-    def _write_image_data(self, binding, binary, image_data):
+        The image is downloaded again only if it has been modified
+        since the last import.
+        """
+        if image_data['file'] != binding.magento_image_file:
+            return None
+        headers = {}
+        if binding.magento_image_etag:
+            headers['If-None-Match'] = binding.magento_image_etag
+        if binding.magento_image_last_modified:
+            headers['If-Modified-Since'] = binding.magento_image_last_modified
+        return headers or None
+
+    def _get_binary_images(self, binding, images):
+        """ Download the image with the higher priority
+
+        The candidates are downloaded one after the other, until one of
+        them can be kept.
+
+        :param images: images sorted by :meth:`_sort_images`
+        :returns: tuple ``(image, image_data)`` with the
+                  :class:`MagentoImage` of the first image which could
+                  be downloaded
+        """
+        downloader = getattr(self.work, 'magento_image_downloader', None)
+        if downloader is None:
+            downloader = self.backend_record._get_image_downloader()
+        for image_data in reversed(images):
+            url = image_data['url'].encode('utf8')
+            headers = self._image_request_headers(binding, image_data)
+            # we don't know why we couldn't download the image when the
+            # error is not a 404 so we propagate the error, the import
+            # will fail and we have to check why it couldn't be accessed
+            image = downloader.download(url, headers=headers)
+            if image:
+                return image, image_data
+        return None, None
+
+    def _write_image_data(self, binding, binary, image_data, values=None):
+        values = dict(values or {}, image=base64.b64encode(binary))
         binding = binding.with_context(connector_no_export=True)
-        binding.write({'image': base64.b64encode(binary)})
+        binding.write(values)
 
     def run(self, external_id, binding):
         self.external_id = external_id
         images = self._get_images()
         images = self._sort_images(images)
-        binary = None
-        image_data = None
-        while not binary and images:
-            image_data = images.pop()
-            binary = self._get_binary_image(image_data)
-        if not binary:
+        image, image_data = self._get_binary_images(binding, images)
+        if not image:
             return
-        self._write_image_data(binding, binary, image_data)
+        try:
+            self._update_image(binding, image, image_data)
+        finally:
+            if image.file is not None:
+                image.file.close()
+
+    def _update_image(self, binding, image, image_data):
+        values = {
+            'magento_image_file': image_data['file'],
+            'magento_image_etag': image.etag,
+            'magento_image_last_modified': image.last_modified,
+        }
+        if image.file is not None:
+            if image.sha1 != binding.magento_image_hash:
+                # the content is read only when it has to be written
+                values['magento_image_hash'] = image.sha1
+                self._write_image_data(binding, image.file.read(),
+                                       image_data, values=values)
+                return
+        # the image is unchanged, do not decode and resize it again
+        values = {field: value for field, value in values.iteritems()
+                  if value and value != getattr(binding, field)}
+        if values:
+            binding.with_context(connector_no_export=True).write(values)
 
 
 # TODO: not needed, use inheritance
@@ -314,20 +371,52 @@ class ProductImporter(Component):
 
     def _after_import(self, binding):
         """ Hook called at the end of the import """
-        translation_importer = self.component(
-            usage='translation.importer',
-        )
-        translation_importer.run(
-            self.external_id,
+        self._import_translations(
             binding,
             mapper='magento.product.product.import.mapper'
         )
-        image_importer = self.component(usage='product.image.importer')
-        image_importer.run(self.external_id, binding)
+        if self.backend_record.import_images_delayed:
+            description = _('Import images of product %s') % self.external_id
+            binding.with_delay(
+                description=description,
+                identity_key=identity_exact,
+            ).import_images()
+        else:
+            image_importer = self.component(usage='product.image.importer')
+            with self._profile('images'):
+                image_importer.run(self.external_id, binding)
 
         if self.magento_record['type_id'] == 'bundle':
             bundle_importer = self.component(usage='product.bundle.importer')
-            bundle_importer.run(binding, self.magento_record)
+            with self._profile('bundle'):
+                bundle_importer.run(binding, self.magento_record)
+
+
+class ProductPlaceholderImporter(Component):
+    """ Import the main data of a product
+
+    Used for the products missing when a sales order is imported: the
+    translations, images and bundle options are imported afterwards by
+    a delayed full import of the product.
+    """
+    _name = 'magento.product.product.placeholder.importer'
+    _inherit = 'magento.product.product.importer'
+    _usage = 'record.placeholder.importer'
+
+    def _import_dependencies(self):
+        """ Import the categories, the products of a bundle are
+        imported with the full import """
+        for mag_category_id in self.magento_record['categories']:
+            self._import_dependency(mag_category_id,
+                                    'magento.product.category')
+
+    def _after_import(self, binding):
+        """ Delay the full import of the product """
+        description = _('Import product %s') % self.external_id
+        self.model.with_delay(
+            description=description,
+            identity_key=identity_exact,
+        ).import_record(self.backend_record, self.external_id, force=True)
 
 
 class ProductInventoryExporter(Component):
@@ -343,6 +432,8 @@ class ProductInventoryExporter(Component):
                        }
 
     def _get_data(self, binding, fields):
+        if fields is None:
+            fields = INVENTORY_FIELDS
         result = {}
         if 'magento_qty' in fields:
             result.update({
@@ -369,3 +460,46 @@ class ProductInventoryExporter(Component):
         external_id = self.binder.to_external(binding)
         data = self._get_data(binding, fields)
         self.backend_adapter.update_inventory(external_id, data)
+
+
+class ProductInventoryBatchExporter(Component):
+    """ Export the inventory of several products in one request
+
+    A product failing on Magento does not make the other products of
+    the batch fail: a separate export job is created for it, so the
+    error is visible and can be retried alone.
+    """
+    _name = 'magento.product.product.inventory.batch.exporter'
+    _inherit = 'magento.product.product.exporter'
+    _apply_on = ['magento.product.product']
+    _usage = 'product.inventory.batch.exporter'
+
+    def run(self, bindings, fields):
+        """ Export the inventory of the products to Magento """
+        to_export = []
+        for binding in bindings:
+            external_id = self.binder.to_external(binding)
+            if not external_id:
+                continue
+            to_export.append((binding, external_id))
+        results = self.backend_adapter.update_inventory_many(
+            [(ext_id, self._get_data(record, fields))
+             for record, ext_id in to_export]
+        )
+        errors = []
+        for (binding, external_id), result in zip(to_export, results):
+            try:
+                result.result()
+            except (xmlrpclib.Fault, IDMissingInBackend) as err:
+                _logger.warning('Inventory export of product %s (%s) '
+                                'failed: %s', binding.default_code,
+                                external_id, err)
+                errors.append(u'%s: %s' % (binding.default_code or
+                                           external_id, err))
+                binding.delay_export_inventory(fields=fields)
+        message = _('Inventory of %d products exported.') % (
+            len(to_export) - len(errors))
+        if errors:
+            message += u'\n' + _('Failed, exported in separate jobs:')
+            message += u'\n' + u'\n'.join(errors)
+        return message
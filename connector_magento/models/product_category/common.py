@@ -5,9 +5,10 @@
 
 import logging
 import xmlrpclib
-from odoo import models, fields
+from odoo import api, models, fields
 from odoo.addons.connector.exception import IDMissingInBackend
 from odoo.addons.component.core import Component
+from odoo.addons.queue_job.job import job
 from ...components.backend_adapter import MAGENTO_DATETIME_FORMAT
 
 _logger = logging.getLogger(__name__)
@@ -35,6 +36,14 @@ class MagentoProductCategory(models.Model):
         string='Magento Child Categories',
     )
 
+    @job(default_channel='root.magento')
+    @api.model
+    def import_tree(self, backend, external_ids):
+        """ Import categories sorted from the top of the tree """
+        with backend.work_on(self._name) as work:
+            importer = work.component(usage='tree.importer')
+            return importer.run(external_ids)
+
 
 class ProductCategory(models.Model):
     _inherit = 'product.category'
@@ -3,9 +3,14 @@
 # © 2016 Sodexis
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
+import logging
+
+from odoo import _
 from odoo.addons.component.core import Component
 from odoo.addons.connector.components.mapper import mapping
-from odoo.addons.connector.exception import MappingError
+from odoo.addons.connector.exception import MappingError, IDMissingInBackend
+
+_logger = logging.getLogger(__name__)
 
 
 class ProductCategoryBatchImporter(Component):
@@ -14,11 +19,19 @@ class ProductCategoryBatchImporter(Component):
     For every product category in the list, a delayed job is created.
     A priority is set on the jobs according to their level to rise the
     chance to have the top level categories imported first.
+
+    When the backend imports the categories as a tree, the top levels
+    of the tree are imported directly, then a job imports each subtree
+    below them, from the top to the bottom.
     """
     _name = 'magento.product.category.batch.importer'
     _inherit = 'magento.delayed.batch.importer'
     _apply_on = ['magento.product.category']
 
+    # number of levels of the tree imported by the batch import when
+    # the categories are imported as a tree
+    _tree_top_levels = 2
+
     def _import_record(self, external_id, job_options=None):
         """ Delay a job for the import """
         super(ProductCategoryBatchImporter, self)._import_record(
@@ -36,6 +49,11 @@ class ProductCategoryBatchImporter(Component):
         else:
             updated_ids = None
 
+        tree = self.backend_adapter.tree()
+        if self.backend_record.import_categories_tree:
+            self._import_tree(tree, updated_ids)
+            return
+
         base_priority = 10
 
         def import_nodes(tree, level=0):
@@ -51,15 +69,117 @@ class ProductCategoryBatchImporter(Component):
                     self._import_record(
                         node_id, job_options=job_options)
                 import_nodes(children, level=level + 1)
-        tree = self.backend_adapter.tree()
         import_nodes(tree)
 
+    def _import_tree(self, tree, updated_ids=None):
+        """ Import the top levels of the tree, delay the subtrees """
+        def flatten(tree):
+            # the parents are before their children
+            for node_id, children in tree.iteritems():
+                yield node_id
+                for child_id in flatten(children):
+                    yield child_id
+
+        def selected(external_ids):
+            return [external_id for external_id in external_ids
+                    if updated_ids is None or external_id in updated_ids]
+
+        top_ids = []
+        subtrees = []
+
+        def split(tree, level=0):
+            for node_id, children in tree.iteritems():
+                top_ids.append(node_id)
+                if level + 1 < self._tree_top_levels:
+                    split(children, level=level + 1)
+                else:
+                    subtrees.extend({child_id: grandchildren}
+                                    for child_id, grandchildren
+                                    in children.iteritems())
+        split(tree)
+
+        tree_importer = self.component(usage='tree.importer')
+        tree_importer.run(selected(top_ids))
+        for subtree in subtrees:
+            external_ids = selected(flatten(subtree))
+            if not external_ids:
+                continue
+            description = _('Import subtree of product category %s') % (
+                next(iter(subtree)),
+            )
+            self.model.with_delay(
+                description=description,
+            ).import_tree(self.backend_record, external_ids)
+
+
+class ProductCategoryTreeImporter(Component):
+    """ Import a list of categories, sorted from the top to the bottom
+    of the tree
+
+    The categories are read by batches and the parents are imported
+    before their children, so the importers find the parent categories
+    without importing them again.
+
+    The categories are imported in bulk mode: the parent store of the
+    categories (``parent_left`` and ``parent_right``) is not updated at
+    every creation or move of a category and the checkpoints of the new
+    categories are not added one by one, the hierarchy is rebuilt and
+    the checkpoints are added at the end of the import.
+
+    The hierarchy is rebuilt in the transaction of each import (the top
+    levels and every subtree job), so no category is committed without
+    its ``parent_left`` and ``parent_right``.
+    """
+    _name = 'magento.product.category.tree.importer'
+    _inherit = 'base.magento.connector'
+    _apply_on = ['magento.product.category']
+    _usage = 'tree.importer'
+
+    # number of categories read in one request
+    _read_size = 100
+
+    def run(self, external_ids):
+        if not external_ids:
+            return
+        collection = self.collection.with_context(
+            defer_parent_store_computation=True,
+        )
+        work = self.work.work_on(collection=collection)
+        binder = self.binder_for()
+        created = self.model.browse()
+        for start in xrange(0, len(external_ids), self._read_size):
+            chunk = external_ids[start:start + self._read_size]
+            bindings = binder.to_internal_many(chunk)
+            results = self.backend_adapter.read_many(chunk)
+            for external_id, result in zip(chunk, results):
+                try:
+                    data = result.result()
+                except IDMissingInBackend:
+                    _logger.info('Product category %s does no longer '
+                                 'exist in Magento.', external_id)
+                    continue
+                importer = work.component(usage='record.importer')
+                importer.defer_checkpoint = True
+                importer.run(external_id, data=data)
+            new_ids = [external_id for external_id, binding
+                       in bindings.iteritems() if not binding]
+            for binding in binder.to_internal_many(new_ids).itervalues():
+                created |= binding
+        self.env['product.category']._parent_store_compute()
+        self.backend_record.add_checkpoints(created)
+
 
 class ProductCategoryImporter(Component):
     _name = 'magento.product.category.importer'
     _inherit = 'magento.importer'
     _apply_on = ['magento.product.category']
 
+    def __init__(self, work_context):
+        super(ProductCategoryImporter, self).__init__(work_context)
+        # set by the tree importer, which adds the checkpoints of the
+        # new categories at the end of the import
+        self.defer_checkpoint = False
+
     def _import_dependencies(self):
         """ Import the dependencies for the record"""
         record = self.magento_record
@@ -69,13 +189,13 @@ class ProductCategoryImporter(Component):
 
     def _create(self, data):
         binding = super(ProductCategoryImporter, self)._create(data)
-        self.backend_record.add_checkpoint(binding)
+        if not self.defer_checkpoint:
+            self.backend_record.add_checkpoint(binding)
         return binding
 
     def _after_import(self, binding):
         """ Hook called at the end of the import """
-        translation_importer = self.component(usage='translation.importer')
-        translation_importer.run(self.external_id, binding)
+        self._import_translations(binding)
 
 
 class ProductCategoryImportMapper(Component):
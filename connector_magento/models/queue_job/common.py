@@ -2,13 +2,51 @@
 # Copyright 2017 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
-from odoo import _, api, exceptions, models
+from odoo import _, api, exceptions, fields, http, models
 
 
 class QueueJob(models.Model):
 
     _inherit = 'queue.job'
 
+    magento_api_stats = fields.Text(
+        string='Magento API Statistics',
+        readonly=True,
+        help="Summary of the calls done to the Magento API by the job, "
+             "when the statistics are activated on the backend.",
+    )
+    magento_profile = fields.Text(
+        string='Magento Profile',
+        readonly=True,
+        help="Measures of the phases of the synchronizations done by the "
+             "job, when the profiling is activated on the backend.",
+    )
+
+    @api.model
+    def _running_job_uuid(self):
+        """ Return the UUID of the job being run, if any
+
+        The jobs are run by the job runner through an HTTP request which
+        has the UUID of the job in its parameters, queue_job does not
+        put it in the context of the job's method.
+        """
+        job_uuid = self.env.context.get('job_uuid')
+        if not job_uuid and http.request:
+            job_uuid = http.request.params.get('job_uuid')
+        return job_uuid
+
+    @api.model
+    def _add_running_job_summary(self, field_name, lines):
+        """ Append lines to a text field of the job being run, if any """
+        job_uuid = self._running_job_uuid()
+        if not job_uuid or not lines:
+            return
+        job = self.sudo().search([('uuid', '=', job_uuid)], limit=1)
+        if job:
+            if job[field_name]:
+                lines = [job[field_name]] + lines
+            job[field_name] = u'\n'.join(lines)
+
     @api.multi
     def related_action_magento_link(self, backend_id_pos=0, external_id_pos=1):
         """ Open a Magento URL on the admin page to view/edit the record
@@ -176,9 +176,10 @@ class MagentoSaleOrderLine(models.Model):
 
     @api.model
     def create(self, vals):
-        magento_order_id = vals['magento_order_id']
-        binding = self.env['magento.sale.order'].browse(magento_order_id)
-        vals['order_id'] = binding.odoo_id.id
+        if 'order_id' not in vals:
+            magento_order_id = vals['magento_order_id']
+            binding = self.env['magento.sale.order'].browse(magento_order_id)
+            vals['order_id'] = binding.odoo_id.id
         binding = super(MagentoSaleOrderLine, self).create(vals)
         # FIXME triggers function field
         # The amounts (amount_total, ...) computed fields on 'sale.order' are
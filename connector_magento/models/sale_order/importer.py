@@ -4,6 +4,7 @@
 
 import logging
 
+from collections import OrderedDict
 from re import search as re_search
 from datetime import datetime, timedelta
 
@@ -22,18 +23,14 @@ class SaleOrderBatchImporter(Component):
     _inherit = 'magento.delayed.batch.importer'
     _apply_on = 'magento.sale.order'
 
-    def _import_record(self, external_id, job_options=None, **kwargs):
-        job_options = {
+    def _job_options(self, external_id):
+        return {
             'max_retries': 0,
             'priority': 5,
         }
-        return super(SaleOrderBatchImporter, self)._import_record(
-            external_id, job_options=job_options)
 
-    def run(self, filters=None):
-        """ Run the synchronization """
-        if filters is None:
-            filters = {}
+    def _search(self, filters):
+        """ Search the ids of the sales orders to import """
         filters['state'] = {'neq': 'canceled'}
         from_date = filters.pop('from_date', None)
         to_date = filters.pop('to_date', None)
@@ -45,8 +42,7 @@ class SaleOrderBatchImporter(Component):
             magento_storeview_ids=magento_storeview_ids)
         _logger.info('search for magento saleorders %s returned %s',
                      filters, external_ids)
-        for external_id in external_ids:
-            self._import_record(external_id)
+        return external_ids
 
 
 class SaleImportRule(Component):
@@ -107,9 +103,8 @@ class SaleImportRule(Component):
         :rtype: boolean
         """
         payment_method = record['payment']['method']
-        method = self.env['account.payment.mode'].search(
-            [('name', '=', payment_method)],
-            limit=1,
+        method = self.env['account.payment.mode']._magento_search_by_name(
+            payment_method
         )
         if not method:
             raise FailedJobError(
@@ -252,10 +247,39 @@ class SaleOrderImportMapper(Component):
             'partner_invoice_id': self.options.partner_invoice_id,
             'partner_shipping_id': self.options.partner_shipping_id,
         })
+        return self._play_onchanges(values)
+
+    def _play_onchanges(self, values):
+        """ Play the onchanges of the order and of its lines
+
+        The onchanges of the lines only fill the values missing in the
+        Magento data, which depend on the product, the quantity, the unit
+        of measure and on the order (taxes, ...). They are played once
+        for the lines having the same product, quantity, unit of measure
+        and fields, and their results are copied on the other lines.
+        """
         onchange = self.component(
             usage='ecommerce.onchange.manager.sale.order'
         )
-        return onchange.play(values, values['magento_order_line_ids'])
+        lines = values['magento_order_line_ids']
+        groups = OrderedDict()
+        for index, command in enumerate(lines):
+            line = command[2]
+            key = (line.get('product_id'),
+                   line.get('product_uom_qty'),
+                   line.get('product_uom'),
+                   tuple(sorted(line)))
+            groups.setdefault(key, []).append(index)
+        played_lines = [lines[indexes[0]] for indexes in groups.itervalues()]
+        values = onchange.play(values, played_lines)
+        for played, indexes in zip(played_lines, groups.itervalues()):
+            lines[indexes[0]] = played
+            for index in indexes[1:]:
+                line = lines[index][2]
+                for field, value in played[2].iteritems():
+                    line.setdefault(field, value)
+        values['magento_order_line_ids'] = lines
+        return values
 
     @mapping
     def name(self, record):
@@ -277,9 +301,8 @@ class SaleOrderImportMapper(Component):
     @mapping
     def payment(self, record):
         record_method = record['payment']['method']
-        method = self.env['account.payment.mode'].search(
-            [['name', '=', record_method]],
-            limit=1,
+        method = self.env['account.payment.mode']._magento_search_by_name(
+            record_method
         )
         assert method, ("method %s should exist because the import fails "
                         "in SaleOrderImporter._before_import when it is "
@@ -292,22 +315,29 @@ class SaleOrderImportMapper(Component):
         if not ifield:
             return
 
-        carrier = self.env['delivery.carrier'].search(
-            [('magento_code', '=', ifield)],
-            limit=1,
-        )
-        if carrier:
-            result = {'carrier_id': carrier.id}
-        else:
+        carrier_model = self.env['delivery.carrier']
+        carrier = carrier_model._magento_search_by_code(ifield)
+        if not carrier:
             # FIXME: a mapper should not have any side effects
+            # the orders imported concurrently with the same delivery
+            # method would create duplicate carriers, the other jobs
+            # are retried and find the carrier created by the first one
+            self.advisory_lock_or_retry(
+                'magento.delivery.carrier.create(%s)' % ifield,
+                retry_seconds=10,
+            )
+            carrier = carrier_model.search(
+                [('magento_code', '=', ifield)],
+                limit=1,
+            )
+        if not carrier:
             product = self.env.ref(
                 'connector_ecommerce.product_product_shipping')
-            carrier = self.env['delivery.carrier'].create({
+            carrier = carrier_model.create({
                 'product_id': product.id,
                 'name': ifield,
                 'magento_code': ifield})
-            result = {'carrier_id': carrier.id}
-        return result
+        return {'carrier_id': carrier.id}
 
     @mapping
     def sales_team(self, record):
@@ -468,11 +498,31 @@ class SaleOrderImporter(Component):
             current_binding = parent_binding
 
     def _create(self, data):
+        lines = data.pop('magento_order_line_ids', [])
         binding = super(SaleOrderImporter, self)._create(data)
+        self._create_lines(binding, lines)
         if binding.fiscal_position_id:
             binding.odoo_id._compute_tax_id()
         return binding
 
+    def _create_lines(self, binding, lines):
+        """ Create the lines of a new sales order
+
+        The stored computed fields of the lines and of the order
+        (amounts, taxes, ...) are computed once all the lines exist
+        rather than after the creation of each line.
+
+        :param lines: commands ``(0, 0, values)`` of the lines
+        """
+        order_id = binding.odoo_id.id
+        lines = [(0, 0, dict(values, order_id=order_id))
+                 for __, __, values in lines]
+        binding.with_context(
+            connector_no_export=True,
+            recompute=False,
+        ).write({'magento_order_line_ids': lines})
+        binding.recompute()
+
     def _after_import(self, binding):
         self._link_parent_orders(binding)
 
@@ -511,10 +561,11 @@ class SaleOrderImporter(Component):
             website_binding = website_binder.to_internal(record['website_id'])
 
             # search an existing partner with the same email
-            partner = self.env['magento.res.partner'].search(
-                [('emailid', '=', record['customer_email']),
-                 ('website_id', '=', website_binding.id)],
-                limit=1)
+            email = record['customer_email']
+            binding_model = self.env['magento.res.partner']
+            partner = binding_model._magento_search_by_emails(
+                [email], website_binding
+            )[email]
 
             # if we have found one, we "fix" the record with the magento
             # customer id
@@ -667,11 +718,13 @@ class SaleOrderImporter(Component):
 
         self._import_addresses()
 
-        for line in record.get('items', []):
-            _logger.debug('line: %s', line)
-            if 'product_id' in line:
-                self._import_dependency(line['product_id'],
-                                        'magento.product.product')
+        product_ids = [line['product_id'] for line in record.get('items', [])
+                       if 'product_id' in line]
+        usage = 'record.importer'
+        if self.backend_record.order_product_placeholder:
+            usage = 'record.placeholder.importer'
+        self._import_dependency_many(product_ids, 'magento.product.product',
+                                     usage=usage)
 
 
 class SaleOrderLineImportMapper(Component):
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import models, api
+
+# fields of the moves changing the stock quantities of the products
+STOCK_MOVE_FIELDS = frozenset(['state',
+                               'product_id',
+                               'product_uom_qty',
+                               'location_id',
+                               'location_dest_id',
+                               ])
+
+
+class StockMove(models.Model):
+    """ Record the products whose stock changed in the journal used by
+    the incremental stock synchronization.
+    """
+    _inherit = 'stock.move'
+
+    @api.model
+    def create(self, vals):
+        move = super(StockMove, self).create(vals)
+        if move.state != 'draft':
+            self.env['magento.stock.journal'].add_products(
+                move.product_id.ids
+            )
+        return move
+
+    @api.multi
+    def write(self, vals):
+        if not STOCK_MOVE_FIELDS.intersection(vals):
+            return super(StockMove, self).write(vals)
+        # the product may change, keep the previous ones
+        product_ids = set(self.mapped('product_id').ids)
+        result = super(StockMove, self).write(vals)
+        product_ids.update(self.mapped('product_id').ids)
+        self.env['magento.stock.journal'].add_products(product_ids)
+        return result
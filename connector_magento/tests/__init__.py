@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 
+from . import test_backend_adapter
+from . import test_benchmark
+from . import test_binder
 from . import test_concurrent_sync
 from . import test_export_invoice
 from . import test_export_picking
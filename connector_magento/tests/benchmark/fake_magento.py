@@ -0,0 +1,536 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+"""
+Stand-in for the XML-RPC API of Magento used by the benchmarks
+
+The records are generated from their ids with a seeded random
+generator: the same id always gives the same record and a catalog of
+one million products does not need to be held in memory.
+"""
+
+import random
+import threading
+import time
+import uuid
+import xmlrpclib
+
+from collections import Counter
+from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+from SocketServer import ThreadingMixIn
+
+from odoo.addons.connector_magento.components.backend_adapter import (
+    MAGENTO_SESSION_EXPIRED,
+)
+
+CREATED_AT = '2017-01-01 00:00:00'
+UPDATED_AT = '2017-01-02 00:00:00'
+ORDER_OFFSET = 100000000
+
+FIRSTNAMES = ['Jane', 'John', 'Tay', 'Ada', 'Linus', 'Grace', 'Alan']
+LASTNAMES = ['Doe', 'Ray', 'Lovelace', 'Turing', 'Hopper', 'Smith']
+# (region, region_id, postcode, city)
+REGIONS = [('California', '12', '90232', 'Culver City'),
+           ('Michigan', '33', '49036', 'Coldwater'),
+           ('New York', '43', '10001', 'New York'),
+           ('Texas', '57', '73301', 'Austin'),
+           ]
+
+_PRODUCT, _CUSTOMER, _ORDER = range(3)
+
+
+class FakeMagentoCatalog(object):
+    """ Synthetic data of a Magento with one website and one storeview
+
+    The public methods are the methods of the API, with the dots of
+    their name replaced by underscores.
+    """
+
+    def __init__(self, products=1000, customers=1000, orders=1000,
+                 max_order_lines=5, guest_rate=0.1, seed=42):
+        assert 0 < max_order_lines < 100
+        assert not orders or products, "orders need products"
+        self.products = products
+        self.customers = customers
+        self.orders = orders
+        self.max_order_lines = max_order_lines
+        self.guest_rate = guest_rate
+        self.seed = seed
+        self.shipments = 0
+        self.invoices = 0
+
+    def _rng(self, kind, id_):
+        return random.Random(self.seed * 10 ** 9 + int(id_) * 10 + kind)
+
+    @staticmethod
+    def _search_ids(count, filters):
+        """ Return the ids in ``1..count`` matching the filters """
+        low, high = 1, count
+        for field, condition in (filters or {}).iteritems():
+            if not isinstance(condition, dict):
+                continue
+            if field == 'entity_id':
+                for operator, value in condition.iteritems():
+                    value = int(value)
+                    if operator == 'from':
+                        low = max(low, value)
+                    elif operator == 'gt':
+                        low = max(low, value + 1)
+                    elif operator == 'to':
+                        high = min(high, value)
+                    elif operator == 'lt':
+                        high = min(high, value - 1)
+            elif field in ('created_at', 'updated_at'):
+                if condition.get('from', CREATED_AT) > UPDATED_AT:
+                    return []
+                if condition.get('to', UPDATED_AT) < CREATED_AT:
+                    return []
+            elif field in ('website_id', 'store_id') and 'in' in condition:
+                if '1' not in [str(value) for value in condition['in']]:
+                    return []
+        return xrange(low, high + 1)
+
+    # metadata
+
+    def ol_websites_search(self, filters=None):
+        return ['1']
+
+    def ol_websites_info(self, id_, attributes=None):
+        return {'code': 'base', 'default_group_id': '1', 'is_default': '1',
+                'name': 'Main Website', 'sort_order': '0',
+                'website_id': '1'}
+
+    def ol_groups_search(self, filters=None):
+        return ['1']
+
+    def ol_groups_info(self, id_, attributes=None):
+        return {'default_store_id': '1', 'group_id': '1',
+                'name': 'Main Store', 'root_category_id': '2',
+                'website_id': '1'}
+
+    def ol_storeviews_search(self, filters=None):
+        return ['1']
+
+    def ol_storeviews_info(self, id_, attributes=None):
+        return {'code': 'default', 'group_id': '1', 'is_active': '1',
+                'name': 'English', 'sort_order': '0', 'store_id': '1',
+                'website_id': '1'}
+
+    def ol_customer_groups_list(self, filters=None):
+        return [self.ol_customer_groups_info(1)]
+
+    def ol_customer_groups_info(self, id_, attributes=None):
+        return {'customer_group_code': 'General',
+                'customer_group_id': '1',
+                'tax_class_id': '3'}
+
+    # products
+
+    def _product(self, product_id):
+        if not 1 <= int(product_id) <= self.products:
+            raise xmlrpclib.Fault(101, 'Product not exists.')
+        rng = self._rng(_PRODUCT, product_id)
+        return {'product_id': str(product_id),
+                'sku': 'BENCH-%07d' % int(product_id),
+                'name': 'Product %d' % int(product_id),
+                'type': 'simple',
+                'type_id': 'simple',
+                'set': '4',
+                'status': '1',
+                'visibility': '4',
+                'price': '%.4f' % rng.uniform(5, 300),
+                'cost': None,
+                'special_price': None,
+                'weight': '1.0000',
+                'description': 'Synthetic product',
+                'short_description': 'Synthetic product',
+                'categories': [],
+                'category_ids': [],
+                'websites': ['1'],
+                'tax_class_id': '2',
+                'created_at': CREATED_AT,
+                'updated_at': UPDATED_AT,
+                }
+
+    def catalog_product_list(self, filters=None):
+        return [{'product_id': str(product_id),
+                 'sku': 'BENCH-%07d' % product_id,
+                 'type': 'simple',
+                 'set': '4',
+                 'category_ids': [],
+                 'website_ids': ['1'],
+                 'updated_at': UPDATED_AT,
+                 }
+                for product_id in self._search_ids(self.products, filters)]
+
+    def ol_catalog_product_info(self, product_id, storeview_id=None,
+                                attributes=None, identifier_type=None):
+        return self._product(product_id)
+
+    def product_media_list(self, product_id, storeview_id=None,
+                           identifier_type=None):
+        return []
+
+    def oerp_cataloginventory_stock_item_update(self, product_id, data):
+        self._product(product_id)
+        return True
+
+    # customers
+
+    def _customer_address_ids(self, customer_id):
+        rng = self._rng(_CUSTOMER, customer_id)
+        if rng.random() < 0.3:
+            return [customer_id * 2 - 1, customer_id * 2]
+        return [customer_id * 2 - 1]
+
+    def _customer(self, customer_id):
+        customer_id = int(customer_id)
+        if not 1 <= customer_id <= self.customers:
+            raise xmlrpclib.Fault(102, 'Customer not exists.')
+        rng = self._rng(_CUSTOMER, customer_id)
+        address_ids = self._customer_address_ids(customer_id)
+        return {'customer_id': str(customer_id),
+                'email': 'customer%d@example.com' % customer_id,
+                'firstname': rng.choice(FIRSTNAMES),
+                'lastname': rng.choice(LASTNAMES),
+                'middlename': None,
+                'prefix': None,
+                'suffix': None,
+                'dob': None,
+                'gender': None,
+                'taxvat': None,
+                'group_id': '1',
+                'website_id': '1',
+                'store_id': '1',
+                'created_in': 'English',
+                'default_billing': str(address_ids[0]),
+                'default_shipping': str(address_ids[-1]),
+                'created_at': CREATED_AT,
+                'updated_at': UPDATED_AT,
+                }
+
+    def _customer_address(self, address_id):
+        address_id = int(address_id)
+        customer_id = (address_id + 1) // 2
+        customer = self._customer(customer_id)
+        address_ids = self._customer_address_ids(customer_id)
+        if address_id not in address_ids:
+            raise xmlrpclib.Fault(102, 'Address not exists.')
+        region, region_id, postcode, city = self._rng(
+            _CUSTOMER, address_id
+        ).choice(REGIONS)
+        return {'customer_address_id': str(address_id),
+                'firstname': customer['firstname'],
+                'lastname': customer['lastname'],
+                'middlename': None,
+                'prefix': None,
+                'suffix': None,
+                'company': None,
+                'street': '%d Main Street' % address_id,
+                'city': city,
+                'postcode': postcode,
+                'region': region,
+                'region_id': region_id,
+                'country_id': 'US',
+                'telephone': '555-%07d' % address_id,
+                'fax': None,
+                'vat_id': None,
+                'is_default_billing': address_id == address_ids[0],
+                'is_default_shipping': address_id == address_ids[-1],
+                'created_at': CREATED_AT,
+                'updated_at': UPDATED_AT,
+                }
+
+    def ol_customer_search(self, filters=None):
+        return [str(customer_id) for customer_id
+                in self._search_ids(self.customers, filters)]
+
+    def customer_info(self, customer_id, attributes=None):
+        return self._customer(customer_id)
+
+    def customer_address_list(self, filters=None):
+        customer_id = int(filters['customer_id']['eq'])
+        self._customer(customer_id)
+        return [self._customer_address(address_id) for address_id
+                in self._customer_address_ids(customer_id)]
+
+    def customer_address_info(self, address_id, attributes=None):
+        return self._customer_address(address_id)
+
+    # sales orders
+
+    def _order_address(self, order, address_type, customer_address):
+        values = dict(customer_address)
+        values.update({
+            'address_id': str(int(order['order_id']) * 2 +
+                              (address_type == 'shipping')),
+            'address_type': address_type,
+            'customer_address_id': (customer_address['customer_address_id']
+                                    if order['customer_id'] else None),
+            'customer_id': order['customer_id'],
+            'email': order['customer_email'],
+            'parent_id': order['order_id'],
+        })
+        return values
+
+    def _order(self, increment_id):
+        entity_id = int(increment_id) - ORDER_OFFSET
+        if not 1 <= entity_id <= self.orders:
+            raise xmlrpclib.Fault(100, 'Requested order not exists.')
+        rng = self._rng(_ORDER, entity_id)
+        order = {'order_id': str(entity_id),
+                 'increment_id': str(increment_id),
+                 'store_id': '1',
+                 'state': 'new',
+                 'status': 'pending',
+                 'created_at': CREATED_AT,
+                 'updated_at': UPDATED_AT,
+                 'customer_group_id': '1',
+                 'shipping_method': 'flatrate_flatrate',
+                 'shipping_description': 'Flat Rate - Fixed',
+                 'order_currency_code': 'USD',
+                 'status_history': [],
+                 }
+        if not self.customers or rng.random() < self.guest_rate:
+            address = self._customer_address(1) if self.customers else {
+                'customer_address_id': None, 'company': None,
+                'street': '1 Main Street', 'city': 'Austin',
+                'postcode': '73301', 'region': 'Texas', 'region_id': '57',
+                'country_id': 'US', 'telephone': '555-0000000',
+                'fax': None, 'middlename': None, 'prefix': None,
+                'suffix': None, 'vat_id': None,
+            }
+            address = dict(address, firstname='Guest',
+                           lastname='Order %d' % entity_id)
+            order.update({
+                'customer_id': None,
+                'customer_is_guest': '1',
+                'customer_email': 'guest%d@example.com' % entity_id,
+                'customer_firstname': address['firstname'],
+                'customer_lastname': address['lastname'],
+            })
+            billing = shipping = address
+        else:
+            customer = self._customer(rng.randint(1, self.customers))
+            order.update({
+                'customer_id': customer['customer_id'],
+                'customer_is_guest': '0',
+                'customer_email': customer['email'],
+                'customer_firstname': customer['firstname'],
+                'customer_lastname': customer['lastname'],
+            })
+            billing = self._customer_address(customer['default_billing'])
+            shipping = self._customer_address(customer['default_shipping'])
+        order['billing_address'] = self._order_address(order, 'billing',
+                                                       billing)
+        order['shipping_address'] = self._order_address(order, 'shipping',
+                                                        shipping)
+        items = []
+        subtotal = 0.
+        for position in range(rng.randint(1, self.max_order_lines)):
+            product = self._product(rng.randint(1, self.products))
+            qty = rng.randint(1, 3)
+            row_total = float(product['price']) * qty
+            subtotal += row_total
+            items.append({
+                'item_id': str(entity_id * 100 + position),
+                'order_id': str(entity_id),
+                'parent_item_id': None,
+                'product_id': product['product_id'],
+                'product_type': 'simple',
+                'product_options': None,
+                'sku': product['sku'],
+                'name': product['name'],
+                'qty_ordered': '%.4f' % qty,
+                'price': product['price'],
+                'base_price': product['price'],
+                'original_price': product['price'],
+                'row_total': '%.4f' % row_total,
+                'base_row_total': '%.4f' % row_total,
+                'row_total_incl_tax': '%.4f' % row_total,
+                'base_row_total_incl_tax': '%.4f' % row_total,
+                'tax_percent': '0.0000',
+                'tax_amount': '0.0000',
+                'discount_amount': '0.0000',
+                'weight': '1.0000',
+            })
+        shipping_amount = 5.
+        grand_total = subtotal + shipping_amount
+        order.update({
+            'items': items,
+            'subtotal': '%.4f' % subtotal,
+            'base_subtotal': '%.4f' % subtotal,
+            'shipping_amount': '%.4f' % shipping_amount,
+            'base_shipping_amount': '%.4f' % shipping_amount,
+            'shipping_incl_tax': '%.4f' % shipping_amount,
+            'base_shipping_incl_tax': '%.4f' % shipping_amount,
+            'discount_amount': '0.0000',
+            'tax_amount': '0.0000',
+            'grand_total': '%.4f' % grand_total,
+            'base_grand_total': '%.4f' % grand_total,
+            'payment': {'method': 'checkmo',
+                        'payment_id': str(entity_id),
+                        'parent_id': str(entity_id),
+                        'amount_ordered': '%.4f' % grand_total,
+                        'base_amount_ordered': '%.4f' % grand_total,
+                        'amount_paid': None,
+                        'base_amount_paid': None,
+                        'shipping_amount': '%.4f' % shipping_amount,
+                        },
+        })
+        return order
+
+    def sales_order_search(self, arguments=None):
+        filters = (arguments or {}).get('filters', {})
+        return [str(ORDER_OFFSET + entity_id) for entity_id
+                in self._search_ids(self.orders, filters)]
+
+    def sales_order_info(self, increment_id, attributes=None):
+        return self._order(increment_id)
+
+    def sales_order_get_parent(self, increment_id):
+        return False
+
+    def sales_order_addComment(self, increment_id, status, comment=None,
+                               notify=False):
+        self._order(increment_id)
+        return True
+
+    def sales_order_shipment_create(self, increment_id, items=None,
+                                    comment=None, email=False,
+                                    include_comment=False):
+        self._order(increment_id)
+        self.shipments += 1
+        return str(ORDER_OFFSET + self.shipments)
+
+    def sales_order_shipment_addTrack(self, shipment_id, carrier_code,
+                                      title, tracking_number):
+        return True
+
+    def sales_order_shipment_getCarriers(self, increment_id):
+        return {'custom': 'Custom Value', 'ups': 'United Parcel Service'}
+
+    def sales_order_invoice_create(self, increment_id, items=None,
+                                   comment=None, email=False,
+                                   include_comment=False):
+        self._order(increment_id)
+        self.invoices += 1
+        return str(ORDER_OFFSET + self.invoices)
+
+
+class _ThreadingXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+class _RequestHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ('/index.php/api/xmlrpc',)
+
+
+class FakeMagentoServer(object):
+    """ XML-RPC server answering with the data of a
+    :class:`FakeMagentoCatalog`
+
+    :param latency: seconds waited before answering each request
+                    (except the logins)
+    :param fault_rate: probability for a request to fail with an
+                       expired session, the client has to login again
+    :param error_rate: probability for a request to fail with an
+                       internal error of Magento
+    """
+
+    def __init__(self, catalog, latency=0., fault_rate=0., error_rate=0.,
+                 seed=42):
+        self.catalog = catalog
+        self.latency = latency
+        self.fault_rate = fault_rate
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.reset_counters()
+
+    @property
+    def location(self):
+        return 'http://%s:%d' % self._server.server_address
+
+    def reset_counters(self):
+        with self._lock:
+            self.request_count = 0
+            self.fault_count = 0
+            self.calls = Counter()
+
+    @property
+    def call_count(self):
+        return sum(self.calls.itervalues())
+
+    def start(self):
+        self._server = _ThreadingXMLRPCServer(
+            ('127.0.0.1', 0),
+            requestHandler=_RequestHandler,
+            logRequests=False,
+            allow_none=True,
+        )
+        self._server.register_instance(self)
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='fake-magento')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    def _inject_faults(self):
+        with self._lock:
+            draw = self._random.random()
+            if draw < self.fault_rate:
+                self.fault_count += 1
+                raise xmlrpclib.Fault(MAGENTO_SESSION_EXPIRED,
+                                      'Session expired. Try to relogin.')
+            if draw < self.fault_rate + self.error_rate:
+                self.fault_count += 1
+                raise xmlrpclib.Fault(
+                    1, 'Internal Error. Please see log for details.'
+                )
+
+    def _call(self, method, arguments):
+        with self._lock:
+            self.calls[method] += 1
+        handler = getattr(self.catalog, method.replace('.', '_'), None)
+        if handler is None:
+            raise xmlrpclib.Fault(3, 'Invalid api path.')
+        return handler(*arguments)
+
+    def _dispatch(self, method, params):
+        with self._lock:
+            self.request_count += 1
+        if method == 'login':
+            return uuid.uuid4().hex
+        elif method == 'endSession':
+            return True
+        if self.latency:
+            time.sleep(self.latency)
+        self._inject_faults()
+        if method == 'call':
+            arguments = params[2] if len(params) > 2 else []
+            return self._call(params[1], arguments or [])
+        elif method == 'multiCall':
+            results = []
+            for api_method, arguments in params[1]:
+                try:
+                    results.append(self._call(api_method, arguments or []))
+                except xmlrpclib.Fault as err:
+                    results.append({'isFault': True,
+                                    'faultCode': err.faultCode,
+                                    'faultMessage': err.faultString})
+            return results
+        raise xmlrpclib.Fault(3, 'Invalid api path.')
@@ -0,0 +1,456 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+"""
+Benchmark the synchronizations against a local stand-in of Magento
+
+The database must have ``connector_magento`` installed. The data
+created by the benchmark are rolled back at the end of the run, and
+the commits of the connector are disabled (as when the tests run), so
+every run starts from the same state and its results can be compared
+with a stored baseline.
+
+Usage::
+
+    python connector_magento/tests/benchmark/runner.py \\
+        -c /etc/odoo.cfg -d benchmark --scale 10000 --latency 0.005
+
+    # store the results as the baseline of this scale...
+    python ... --scale 10000 --save-baseline baselines.json
+    # ... and fail when a later run is slower
+    python ... --scale 10000 --baseline baselines.json
+
+The options not listed by ``--help`` are passed to Odoo. The throughput
+depends on the machine: the baselines have to be recorded on the
+machine running the comparisons, with the same options.
+"""
+
+import argparse
+import json
+import logging
+import resource
+import sys
+import time
+import traceback
+
+from collections import OrderedDict
+
+import odoo
+
+_logger = logging.getLogger('connector_magento.benchmark')
+
+# metrics compared with the baseline, and whether a higher value is
+# an improvement
+COMPARED_METRICS = [('records_per_second', True),
+                    ('sql_per_record', False),
+                    ('api_calls_per_record', False),
+                    ('rss_growth_mb', False),
+                    ]
+
+
+class RssMeter(object):
+    """ Measure the memory used by a flow
+
+    The growth is the peak of the resident memory during the flow minus
+    the resident memory at its start. On Linux, the peak of the process
+    is reset at the start (``/proc/self/clear_refs``), so each flow has
+    its own peak. Elsewhere, the growth is the one of the peak of the
+    process, which stays at 0 while it is below the peak of a previous
+    flow.
+    """
+
+    def __init__(self):
+        self.start_rss = None
+        self.start_maxrss = None
+
+    @staticmethod
+    def _status_kb(field):
+        """ Memory field of /proc/self/status in kilobytes """
+        try:
+            with open('/proc/self/status') as status:
+                for line in status:
+                    if line.startswith(field + ':'):
+                        return int(line.split()[1])
+        except IOError:
+            pass
+        return None
+
+    @staticmethod
+    def _maxrss_kb():
+        # kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def start(self):
+        self.start_rss = self._status_kb('VmRSS')
+        self.start_maxrss = self._maxrss_kb()
+        if self.start_rss is not None:
+            try:
+                with open('/proc/self/clear_refs', 'w') as clear_refs:
+                    clear_refs.write('5')  # reset the peak (VmHWM)
+            except IOError:
+                self.start_rss = None
+
+    def growth_kb(self):
+        if self.start_rss is not None:
+            return max(self._status_kb('VmHWM') - self.start_rss, 0)
+        return self._maxrss_kb() - self.start_maxrss
+
+
+class Benchmark(object):
+    """ Run the flows of the connector and measure them """
+
+    def __init__(self, env, server, options):
+        self.env = env
+        self.server = server
+        self.options = options
+        self.backend = None
+        self.failed_jobs = 0
+
+    def setup_backend(self):
+        env = self.env
+        workflow = env.ref('sale_automatic_workflow.manual_validation')
+        journal = env['account.journal'].create(
+            {'name': 'Benchmark', 'type': 'cash', 'code': 'BNCH'}
+        )
+        env['account.payment.mode'].create({
+            'name': 'checkmo',
+            'workflow_process_id': workflow.id,
+            'import_rule': 'always',
+            'days_before_cancel': 0,
+            'bank_account_link': 'fixed',
+            'payment_method_id': env.ref(
+                'account.account_payment_method_manual_in').id,
+            'fixed_journal_id': journal.id,
+        })
+        self.backend = env['magento.backend'].create({
+            'name': 'Benchmark',
+            'version': '1.7',
+            'location': self.server.location,
+            'username': 'odoo',
+            'password': 'odoo',
+            'warehouse_id': env.ref('stock.warehouse0').id,
+            'import_page_size': self.options.page_size,
+            'profile_jobs': self.options.profile,
+        })
+        self.backend.synchronize_metadata()
+
+    def run_jobs(self):
+        """ Execute the pending jobs as the jobrunner would """
+        # imported here because the addons path is only known once the
+        # configuration of Odoo is loaded
+        from odoo.addons.queue_job.job import Job
+        job_model = self.env['queue.job']
+        while True:
+            job_records = job_model.search(
+                [('state', '=', 'pending')],
+                order='priority, date_created, id',
+            )
+            if not job_records:
+                break
+            for job_record in job_records:
+                job = Job.load(self.env, job_record.uuid)
+                try:
+                    with self.env.cr.savepoint():
+                        job.set_started()
+                        job.store()
+                        job.set_done(result=job.perform())
+                        job.store()
+                except Exception:
+                    self.env.invalidate_all()
+                    if not self.failed_jobs:
+                        _logger.warning('job %s failed', job.uuid,
+                                        exc_info=True)
+                    self.failed_jobs += 1
+                    job.set_failed(exc_info=traceback.format_exc())
+                    job.store()
+
+    def count(self, model_name):
+        return self.env[model_name].search_count(
+            [('backend_id', '=', self.backend.id)]
+        )
+
+    def measure(self, name, setup, run):
+        if setup is not None:
+            setup(self)
+        self.env.invalidate_all()
+        self.server.reset_counters()
+        cr = self.env.cr
+        sql_count = cr.sql_log_count
+        failed_jobs = self.failed_jobs
+        rss_meter = RssMeter()
+        rss_meter.start()
+        start = time.time()
+        records = run(self)
+        elapsed = time.time() - start
+        rss_growth = rss_meter.growth_kb()
+        sql_count = cr.sql_log_count - sql_count
+        per_record = float(max(records, 1))
+        return OrderedDict([
+            ('records', records),
+            ('seconds', round(elapsed, 3)),
+            ('records_per_second', round(records / max(elapsed, 1e-6), 2)),
+            ('sql_per_record', round(sql_count / per_record, 2)),
+            ('api_calls_per_record',
+             round(self.server.call_count / per_record, 2)),
+            ('api_requests_per_record',
+             round(self.server.request_count / per_record, 2)),
+            ('api_faults', self.server.fault_count),
+            ('failed_jobs', self.failed_jobs - failed_jobs),
+            ('rss_growth_mb', round(rss_growth / 1024., 1)),
+        ])
+
+    def profile_summary(self, since, limit=10):
+        """ Slowest phases measured by the profiling of the jobs """
+        self.env.cr.execute("""
+            SELECT model, phase, sum(count), sum(wall_time),
+                   sum(sql_count), sum(api_time)
+            FROM magento_job_profile
+            WHERE backend_id = %s AND date >= %s
+            GROUP BY model, phase
+            ORDER BY sum(wall_time) DESC
+            LIMIT %s
+        """, (self.backend.id, since, limit))
+        return self.env.cr.fetchall()
+
+
+def _import_batch(model_name, filters=None):
+    def run(bench):
+        before = bench.count(model_name)
+        bench.env[model_name].import_batch(bench.backend,
+                                           filters=dict(filters or {}))
+        bench.run_jobs()
+        return bench.count(model_name) - before
+    return run
+
+
+def _run_export_jobs(model_name):
+    def run(bench):
+        before = bench.env['queue.job'].search_count(
+            [('model_name', '=', model_name), ('state', '=', 'done')]
+        )
+        bench.run_jobs()
+        return bench.env['queue.job'].search_count(
+            [('model_name', '=', model_name), ('state', '=', 'done')]
+        ) - before
+    return run
+
+
+def _sale_orders(bench):
+    return bench.env['magento.sale.order'].search(
+        [('backend_id', '=', bench.backend.id)]
+    )
+
+
+def _setup_stock(bench):
+    """ Put quantities in stock so the products have to be exported """
+    env = bench.env
+    location = bench.backend.warehouse_id.lot_stock_id
+    bindings = env['magento.product.product'].search(
+        [('backend_id', '=', bench.backend.id)]
+    )
+    for index, binding in enumerate(bindings):
+        env['stock.quant'].create({'product_id': binding.odoo_id.id,
+                                   'location_id': location.id,
+                                   'qty': 10 + index % 7})
+
+
+def _run_stock(bench):
+    bench.backend.update_product_stock_qty()
+    return _run_export_jobs('magento.product.product')(bench)
+
+
+def _confirm_orders(bench):
+    for binding in _sale_orders(bench):
+        binding.ignore_exception = True
+        if binding.state in ('draft', 'sent'):
+            binding.odoo_id.action_confirm()
+
+
+def _setup_pickings(bench):
+    """ Deliver the orders, the exports of the pickings are delayed """
+    _confirm_orders(bench)
+    for binding in _sale_orders(bench):
+        for picking in binding.picking_ids:
+            if picking.state == 'done':
+                continue
+            picking.force_assign()
+            picking.do_transfer()
+
+
+def _setup_invoices(bench):
+    """ Validate invoices, the exports of the invoices are delayed """
+    _confirm_orders(bench)
+    bench.backend.mapped('website_ids.store_ids').write(
+        {'create_invoice_on': 'open'}
+    )
+    invoice_model = bench.env['account.invoice']
+    for binding in _sale_orders(bench):
+        if binding.invoice_status != 'to invoice':
+            continue
+        invoice_ids = binding.odoo_id.action_invoice_create()
+        invoice_model.browse(invoice_ids).action_invoice_open()
+
+
+# name: (setup, measured run)
+FLOWS = OrderedDict([
+    ('products', (None, _import_batch('magento.product.product'))),
+    ('partners', (None, _import_batch('magento.res.partner',
+                                      {'magento_website_id': '1'}))),
+    ('orders', (None, _import_batch('magento.sale.order',
+                                    {'magento_storeview_id': '1'}))),
+    ('stock', (_setup_stock, _run_stock)),
+    ('pickings', (_setup_pickings,
+                  _run_export_jobs('magento.stock.picking'))),
+    ('invoices', (_setup_invoices,
+                  _run_export_jobs('magento.account.invoice'))),
+])
+
+
+def compare(results, baseline, tolerance):
+    """ Return the metrics worse than the baseline by more than the
+    tolerance (a ratio) """
+    regressions = []
+    for flow, values in results.iteritems():
+        reference = baseline.get(flow, {})
+        for metric, higher_is_better in COMPARED_METRICS:
+            if metric not in reference:
+                continue
+            expected = reference[metric]
+            value = values[metric]
+            if higher_is_better:
+                worse = value < expected * (1 - tolerance)
+            else:
+                worse = value > expected * (1 + tolerance)
+            if worse:
+                regressions.append((flow, metric, expected, value))
+    return regressions
+
+
+def print_results(results, out=sys.stdout):
+    columns = ['records', 'records_per_second', 'sql_per_record',
+               'api_calls_per_record', 'api_requests_per_record',
+               'api_faults', 'failed_jobs', 'rss_growth_mb']
+    headers = ['records', 'rec/s', 'sql/rec', 'calls/rec', 'req/rec',
+               'faults', 'failed', '+rss MB']
+    out.write('%-10s' % 'flow' + ''.join('%11s' % h for h in headers) +
+              '\n')
+    for flow, values in results.iteritems():
+        out.write('%-10s' % flow +
+                  ''.join('%11s' % values[c] for c in columns) + '\n')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Magento connector against a local "
+                    "stand-in of the Magento API. Other options are "
+                    "passed to Odoo (-c, -d, --addons-path, ...)."
+    )
+    parser.add_argument('--scale', type=int, default=1000,
+                        help="number of products, customers and orders")
+    parser.add_argument('--products', type=int)
+    parser.add_argument('--customers', type=int)
+    parser.add_argument('--orders', type=int)
+    parser.add_argument('--flows', default=','.join(FLOWS),
+                        help="comma separated flows among: %s" %
+                             ', '.join(FLOWS))
+    parser.add_argument('--latency', type=float, default=0.,
+                        help="seconds added to each API request")
+    parser.add_argument('--fault-rate', type=float, default=0.,
+                        help="ratio of requests failing with an expired "
+                             "session")
+    parser.add_argument('--error-rate', type=float, default=0.,
+                        help="ratio of requests failing with an internal "
+                             "error")
+    parser.add_argument('--page-size', type=int, default=1000,
+                        help="size of the pages of the batch imports")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--profile', action='store_true',
+                        help="profile the jobs and show the slowest phases")
+    parser.add_argument('--baseline',
+                        help="JSON file of baselines to compare with")
+    parser.add_argument('--save-baseline', metavar='BASELINE',
+                        help="store the results in this JSON file")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="accepted degradation ratio (default 0.2)")
+    return parser.parse_known_args(argv)
+
+
+def main(argv=None):
+    options, odoo_args = parse_args(argv)
+    flows = options.flows.split(',')
+    unknown = set(flows) - set(FLOWS)
+    if unknown:
+        sys.exit('unknown flows: %s' % ', '.join(sorted(unknown)))
+
+    odoo.tools.config.parse_config(odoo_args)
+    # disable the commits done by the exporters, the run is rolled back
+    odoo.tools.config['test_enable'] = True
+    # imported here because the addons path is only known once the
+    # configuration of Odoo is loaded
+    from odoo.addons.connector_magento.tests.benchmark.fake_magento import (
+        FakeMagentoCatalog,
+        FakeMagentoServer,
+    )
+
+    scale = options.scale
+    catalog = FakeMagentoCatalog(
+        products=scale if options.products is None else options.products,
+        customers=scale if options.customers is None else options.customers,
+        orders=scale if options.orders is None else options.orders,
+        seed=options.seed,
+    )
+    server = FakeMagentoServer(catalog,
+                               latency=options.latency,
+                               fault_rate=options.fault_rate,
+                               error_rate=options.error_rate,
+                               seed=options.seed)
+    dbname = odoo.tools.config['db_name']
+    results = OrderedDict()
+    with server, odoo.api.Environment.manage():
+        registry = odoo.registry(dbname)
+        with registry.cursor() as cr:
+            # the chunks of the batch imports are not committed either
+            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID,
+                                       {'magento_commit_chunks': False})
+            try:
+                bench = Benchmark(env, server, options)
+                bench.setup_backend()
+                for name in flows:
+                    since = odoo.fields.Datetime.now()
+                    setup, run = FLOWS[name]
+                    _logger.info('running the %s flow', name)
+                    results[name] = bench.measure(name, setup, run)
+                    if options.profile:
+                        for row in bench.profile_summary(since):
+                            sys.stdout.write(
+                                '  %s %s: %d x, %d ms, %d queries, '
+                                'API %d ms\n' % row
+                            )
+            finally:
+                cr.rollback()
+
+    print_results(results)
+    key = str(scale)
+    if options.save_baseline:
+        try:
+            with open(options.save_baseline) as baseline_file:
+                baselines = json.load(baseline_file)
+        except IOError:
+            baselines = {}
+        baselines.setdefault(key, {}).update(results)
+        with open(options.save_baseline, 'w') as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+    if options.baseline:
+        with open(options.baseline) as baseline_file:
+            baseline = json.load(baseline_file).get(key, {})
+        regressions = compare(results, baseline, options.tolerance)
+        for flow, metric, expected, value in regressions:
+            sys.stdout.write('REGRESSION %s %s: %s (baseline %s)\n' %
+                             (flow, metric, value, expected))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -15,11 +15,15 @@ import logging
 
 import mock
 import odoo
+import requests
 
 from os.path import dirname, join
 from contextlib import contextmanager
 from odoo import models
 from odoo.addons.component.tests.common import SavepointComponentCase
+from odoo.addons.connector_magento.components.backend_adapter import (
+    MagentoAPI,
+)
 
 from vcr import VCR
 
@@ -37,24 +41,61 @@ class MockResponseImage(object):
 
     def __init__(self, resp_data, code=200, msg='OK'):
         self.resp_data = resp_data
-        self.code = code
-        self.msg = msg
+        self.status_code = code
+        self.reason = msg
         self.headers = {'content-type': 'image/jpeg'}
 
-    def read(self):
-        return self.resp_data
+    def iter_content(self, chunk_size=1):
+        for index in range(0, len(self.resp_data), chunk_size):
+            yield self.resp_data[index:index + chunk_size]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError('%s %s' % (self.status_code,
+                                                self.reason),
+                                     response=self)
 
-    def getcode(self):
-        return self.code
+    def close(self):
+        pass
 
 
 @contextmanager
 def mock_urlopen_image():
-    with mock.patch('urllib2.urlopen') as urlopen:
-        urlopen.return_value = MockResponseImage('')
+    with mock.patch.object(requests.Session, 'get') as get:
+        get.return_value = MockResponseImage('')
         yield
 
 
+def _single_calls(magento_api, calls):
+    """ Replacement of :meth:`MagentoAPI.multi_call` doing one call
+    per item, a failed call gives the fault like ``multiCall`` does
+    """
+    results = []
+    for method, arguments in calls:
+        try:
+            results.append(magento_api.call(method, arguments))
+        except xmlrpclib.Fault as err:
+            results.append({'isFault': True,
+                            'faultCode': err.faultCode,
+                            'faultMessage': err.faultString})
+    return results
+
+
+@contextmanager
+def use_cassette_single_calls(cassette_name):
+    """ Use a cassette recorded before the calls were batched
+
+    The calls of the ``multiCall`` requests are sent one by one, as they
+    have been recorded. The requests are matched on their body because
+    the batched calls are not sent in the recorded order.
+    """
+    with mock.patch.object(MagentoAPI, 'multi_call', _single_calls):
+        with recorder.use_cassette(
+                cassette_name,
+                match_on=['method', 'uri', 'body']) as cassette:
+            yield cassette
+
+
 class MagentoHelper(object):
 
     def __init__(self, cr, registry, model_name):
@@ -82,6 +123,8 @@ class MagentoTestCase(SavepointComponentCase):
         super(MagentoTestCase, self).setUp()
         # disable commits when run from pytest/nosetest
         odoo.tools.config['test_enable'] = True
+        self.env = self.env(context=dict(self.env.context,
+                                         magento_commit_chunks=False))
 
         self.backend_model = self.env['magento.backend']
         warehouse = self.env.ref('stock.warehouse0')
@@ -156,7 +199,7 @@ class MagentoTestCase(SavepointComponentCase):
                 self.env[model_name].import_record(self.backend, magento_id)
 
         if cassette:
-            with recorder.use_cassette(filename):
+            with use_cassette_single_calls(filename):
                 run_import()
         else:
             run_import()
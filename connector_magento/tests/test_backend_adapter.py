@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+import unittest
+import xmlrpclib
+
+import mock
+
+from odoo import http
+from odoo.addons.component.core import WorkContext
+from odoo.addons.connector.exception import IDMissingInBackend
+from odoo.addons.queue_job.exception import RetryableJobError
+from odoo.addons.queue_job.job import Job
+from odoo.addons.connector_magento.components.backend_adapter import (
+    MAGENTO_SESSION_EXPIRED,
+    MagentoAPI,
+    MagentoCallStats,
+    MagentoLocation,
+    MagentoThrottle,
+    MagentoTransport,
+    magento_session_pool,
+)
+from odoo.addons.connector_magento.components.core import MagentoProfiler
+from .common import MagentoTestCase, recorder
+
+MAGENTOLIB = ('odoo.addons.connector_magento.components.backend_adapter'
+              '.magentolib')
+
+
+class TestMagentoAPI(unittest.TestCase):
+    """ Test the sessions of the Magento API client """
+
+    def setUp(self):
+        super(TestMagentoAPI, self).setUp()
+        self.location = MagentoLocation('http://magento', 'odoo', 'odoo42')
+        self.addCleanup(magento_session_pool.clear)
+
+    def test_no_pool(self):
+        with mock.patch(MAGENTOLIB) as magentolib:
+            with MagentoAPI(self.location) as magento_api:
+                magento_api.call('sales_order.info', [1])
+            with MagentoAPI(self.location) as magento_api:
+                magento_api.call('sales_order.info', [1])
+        self.assertEqual(2, magentolib.API.call_count)
+        client = magentolib.API.return_value
+        self.assertEqual(2, client.__enter__.call_count)
+        self.assertEqual(2, client.__exit__.call_count)
+
+    def test_pool_reuse_session(self):
+        self.location.use_session_pool = True
+        with mock.patch(MAGENTOLIB) as magentolib:
+            with MagentoAPI(self.location) as magento_api:
+                magento_api.call('sales_order.info', [1])
+            with MagentoAPI(self.location) as magento_api:
+                magento_api.call('sales_order.info', [2])
+        # logged in once, the session is kept open
+        self.assertEqual(1, magentolib.API.call_count)
+        client = magentolib.API.return_value
+        self.assertEqual(1, client.__enter__.call_count)
+        self.assertFalse(client.__exit__.called)
+        self.assertEqual(2, client.call.call_count)
+
+    def test_pool_idle_timeout(self):
+        self.location.use_session_pool = True
+        self.location.session_idle_timeout = 60
+        with mock.patch(MAGENTOLIB) as magentolib:
+            with mock.patch('time.time') as time:
+                time.return_value = 1000
+                with MagentoAPI(self.location) as magento_api:
+                    magento_api.call('sales_order.info', [1])
+                time.return_value = 1100
+                with MagentoAPI(self.location) as magento_api:
+                    magento_api.call('sales_order.info', [2])
+        # the idle session has been closed and a new one opened
+        self.assertEqual(2, magentolib.API.call_count)
+        client = magentolib.API.return_value
+        self.assertEqual(1, client.__exit__.call_count)
+
+    def test_relogin_session_expired(self):
+        fault = xmlrpclib.Fault(MAGENTO_SESSION_EXPIRED,
+                                'Session expired. Try to relogin.')
+        with mock.patch(MAGENTOLIB) as magentolib:
+            client = magentolib.API.return_value
+            client.call.side_effect = [fault, {'increment_id': '100000001'}]
+            with MagentoAPI(self.location) as magento_api:
+                result = magento_api.call('sales_order.info', [1])
+        self.assertEqual({'increment_id': '100000001'}, result)
+        self.assertEqual(2, client.__enter__.call_count)
+        self.assertEqual(2, client.call.call_count)
+
+    def test_throttle_failure(self):
+        """ A throttled call leases a slot and lowers the rate on errors """
+        self.location.throttle = MagentoThrottle(
+            'db', 1, rate_limit=10, max_concurrency=2, target_latency=5,
+        )
+        error = xmlrpclib.ProtocolError('http://magento', 503,
+                                        'Service Unavailable', {})
+        closed_during_call = []
+        with mock.patch(MAGENTOLIB) as magentolib, \
+                mock.patch('odoo.sql_db.db_connect') as db_connect, \
+                mock.patch.object(MagentoThrottle, '_created', set()):
+            cr = db_connect.return_value.cursor.return_value
+            # slot, tokens and rate factor
+            cr.fetchone.return_value = (0, 5., 1.)
+
+            def api_call(*args):
+                closed_during_call.append(cr.close.call_count)
+                raise error
+            magentolib.API.return_value.call.side_effect = api_call
+            with self.assertRaises(RetryableJobError):
+                with MagentoAPI(self.location) as magento_api:
+                    magento_api.call('sales_order.info', [1])
+        queries = [call_args[0][0] for call_args in cr.execute.call_args_list]
+        # creation of the state, then one statement before and one
+        # after the call
+        self.assertEqual(4, len(queries))
+        self.assertIn('INSERT INTO magento_backend_throttle ', queries[0])
+        self.assertIn('INSERT INTO magento_backend_throttle_slot', queries[1])
+        self.assertIn('FOR UPDATE SKIP LOCKED', queries[2])
+        self.assertIn('SET tokens', queries[2])
+        self.assertIn('SET leased_until = NULL', queries[3])
+        self.assertIn('SET call_count', queries[3])
+        params = cr.execute.call_args_list[3][0][1]
+        self.assertTrue(params['failed'])
+        self.assertEqual(0, params['slot'])
+        # the connection is given back to the pool during the call
+        self.assertEqual([1], closed_during_call)
+        self.assertEqual(2, cr.close.call_count)
+
+    def test_call_stats(self):
+        """ The calls are recorded in the statistics """
+        fault = xmlrpclib.Fault(101, 'Product not exists.')
+        transport = MagentoTransport()
+
+        def api_call(method, arguments):
+            transport.request_size += 100
+            transport.response_size += 1000
+            if arguments == [2]:
+                raise fault
+            return {'sku': 'A'}
+
+        with mock.patch(MAGENTOLIB) as magentolib:
+            client = magentolib.API.return_value
+            client.transport = transport
+            client.call.side_effect = api_call
+            with MagentoAPI(self.location) as magento_api:
+                magento_api.stats = MagentoCallStats()
+                magento_api.call('catalog_product.info', [1])
+                with self.assertRaises(xmlrpclib.Fault):
+                    magento_api.call('catalog_product.info', [2])
+        stats = magento_api.stats.methods['catalog_product.info']
+        self.assertEqual(2, stats['count'])
+        self.assertEqual({'101': 1}, stats['faults'])
+        self.assertEqual(2, sum(stats['histogram']))
+        self.assertEqual(200, stats['request_size'])
+        self.assertEqual(2000, stats['response_size'])
+
+    def test_transport_sizes(self):
+        """ The transport counts the bytes of the HTTP bodies """
+        transport = MagentoTransport()
+        connection = mock.Mock(name='HTTPConnection')
+        transport.send_content(connection, '<methodCall/>')
+        response = mock.Mock(name='HTTPResponse')
+        response.getheader.return_value = ''
+        body = xmlrpclib.dumps(({'sku': 'A'},), methodresponse=True)
+        response.read.side_effect = [body, '']
+        result = transport.parse_response(response)
+        self.assertEqual(({'sku': 'A'},), result)
+        self.assertEqual(len('<methodCall/>'), transport.request_size)
+        self.assertEqual(len(body), transport.response_size)
+
+
+class TestMagentoApiStat(MagentoTestCase):
+    """ Test the storage of the statistics of the API calls """
+
+    def test_record_stats(self):
+        stats = MagentoCallStats()
+        stats.record('sales_order.info', 30, request_size=100,
+                     response_size=2000)
+        stats.record('sales_order.info', 3000, fault=100)
+        job = self.env['magento.sale.order'].with_delay().import_record(
+            self.backend, '100000001'
+        )
+        stat_model = self.env['magento.api.stat'].with_context(
+            job_uuid=job.uuid
+        )
+        stat_model._record_stats(self.backend, stats)
+
+        stat = self.env['magento.api.stat'].search(
+            [('job_uuid', '=', job.uuid)]
+        )
+        self.assertEqual(2, stat.call_count)
+        self.assertEqual(1, stat.fault_count)
+        self.assertEqual(1515, stat.average_time)
+        self.assertEqual('100: 1', stat.fault_codes)
+        self.assertEqual(
+            'sales_order.info: 2 calls, 3030 ms (max 3000 ms), '
+            '1 faults, 0 retries',
+            job.db_record().magento_api_stats
+        )
+
+        metrics = stat_model.prometheus_metrics(
+            [('job_uuid', '=', job.uuid)]
+        )
+        labels = 'backend="%d",method="sales_order.info"' % self.backend.id
+        self.assertIn('magento_api_calls_total{%s} 2' % labels, metrics)
+        self.assertIn(
+            'magento_api_faults_total{%s,code="100"} 1' % labels, metrics
+        )
+        self.assertIn(
+            'magento_api_call_duration_milliseconds_bucket{%s,le="50"} 1'
+            % labels, metrics
+        )
+        self.assertIn(
+            'magento_api_call_duration_milliseconds_bucket{%s,le="+Inf"} 2'
+            % labels, metrics
+        )
+
+    def test_record_stats_job(self):
+        """ The statistics of a job are summarized on the job """
+        self.backend.api_statistics = True
+        delayed = self.env['magento.res.partner.category'].with_delay(
+        ).import_record(self.backend, 2)
+        job = Job.load(self.env, delayed.uuid)
+        # the job runner runs the jobs through a HTTP request
+        request = mock.Mock(name='request',
+                            params={'db': self.env.cr.dbname,
+                                    'job_uuid': job.uuid})
+        with mock.patch.object(http, 'request', request), \
+                recorder.use_cassette('test_import_partner_category'):
+            job.perform()
+        stat = self.env['magento.api.stat'].search(
+            [('job_uuid', '=', job.uuid)]
+        )
+        self.assertEqual(['ol_customer_groups.info'], stat.mapped('method'))
+        self.assertEqual(1, stat.call_count)
+        self.assertTrue(stat.request_size)
+        self.assertTrue(stat.response_size)
+        self.assertIn('ol_customer_groups.info: 1 calls',
+                      job.db_record().magento_api_stats)
+
+
+class TestMagentoJobProfile(MagentoTestCase):
+    """ Test the profiling of the synchronizations """
+
+    def test_record_profile(self):
+        magento_api = mock.Mock(name='Magento API', call_time=0.)
+        profiler = MagentoProfiler(self.env.cr, magento_api)
+        with profiler.time_queries():
+            self.assertIs(profiler, MagentoProfiler.active(self.env.cr))
+            with profiler.measure('magento.product.product', 'read'):
+                magento_api.call_time += 120
+            with profiler.measure('magento.product.product', 'mapping'):
+                self.env.cr.execute('SELECT 1')
+            with profiler.measure('magento.product.product', 'mapping'):
+                pass
+        self.assertIsNone(MagentoProfiler.active(self.env.cr))
+        read = profiler.phases[('magento.product.product', 'read')]
+        self.assertEqual(120, read['api_time'])
+        self.assertEqual(0, read['sql_count'])
+        mapping = profiler.phases[('magento.product.product', 'mapping')]
+        self.assertEqual(2, mapping['count'])
+        self.assertEqual(1, mapping['sql_count'])
+
+        job = self.env['magento.sale.order'].with_delay().import_record(
+            self.backend, '100000001'
+        )
+        profile_model = self.env['magento.job.profile'].with_context(
+            job_uuid=job.uuid
+        )
+        profile_model._record_profile(self.backend, profiler)
+        profiles = profile_model.search([('job_uuid', '=', job.uuid)])
+        self.assertEqual(['mapping', 'read'], sorted(profiles.mapped('phase')))
+        self.assertIn('magento.product.product read: ',
+                      job.db_record().magento_profile)
+
+    def test_profile_nested_sessions(self):
+        """ A nested session reuses the profiler of the outer session """
+        self.backend.profile_jobs = True
+        with self.backend.work_on('magento.product.product') as work:
+            profiler = work.magento_profiler
+            with self.backend.work_on('magento.product.category') as nested:
+                self.assertIs(profiler, nested.magento_profiler)
+                self.assertIn(nested.magento_api, profiler.magento_apis)
+                with profiler.measure('magento.product.category', 'read'):
+                    self.env.cr.execute('SELECT 1')
+            # the queries are still measured once
+            self.assertIs(profiler, MagentoProfiler.active(self.env.cr))
+        self.assertIsNone(MagentoProfiler.active(self.env.cr))
+        read = profiler.phases[('magento.product.category', 'read')]
+        self.assertEqual(1, read['sql_count'])
+        profiles = self.env['magento.job.profile'].search(
+            [('backend_id', '=', self.backend.id)]
+        )
+        self.assertEqual(['read'], profiles.mapped('phase'))
+
+    def test_profile_session_failure(self):
+        """ The cursor is restored when the session fails """
+        self.backend.profile_jobs = True
+        cursor = self.env.cr._obj
+        with self.assertRaises(ZeroDivisionError):
+            with self.backend.work_on('magento.product.product'):
+                self.assertIsNot(cursor, self.env.cr._obj)
+                1 / 0
+        self.assertIs(cursor, self.env.cr._obj)
+
+
+class TestMagentoCallBatch(MagentoTestCase):
+    """ Test the calls sent with multiCall """
+
+    def setUp(self):
+        super(TestMagentoCallBatch, self).setUp()
+        self.api_client = mock.MagicMock(name='Magento API')
+        work = WorkContext(model_name='magento.product.product',
+                           collection=self.backend,
+                           magento_api=self.api_client)
+        self.adapter = work.component(usage='backend.adapter')
+
+    def test_read_many(self):
+        self.api_client.multi_call.return_value = [
+            {'product_id': '1', 'sku': 'A'},
+            {'isFault': True,
+             'faultCode': '101',
+             'faultMessage': 'Product not exists.'},
+            {'product_id': '3', 'sku': 'C'},
+        ]
+        results = self.adapter.read_many([1, 2, 3])
+
+        self.api_client.multi_call.assert_called_once_with([
+            ('ol_catalog_product.info', [1, None, None, 'id']),
+            ('ol_catalog_product.info', [2, None, None, 'id']),
+            ('ol_catalog_product.info', [3, None, None, 'id']),
+        ])
+        self.assertFalse(self.api_client.call.called)
+        self.assertEqual({'product_id': '1', 'sku': 'A'}, results[0].result())
+        # the fault of the product adapter is converted as usual
+        with self.assertRaises(IDMissingInBackend):
+            results[1].result()
+        self.assertEqual({'product_id': '3', 'sku': 'C'}, results[2].result())
+
+    def test_defer_result_used(self):
+        """ A method using the result of the call cannot be deferred """
+        adapter = self.adapter
+
+        def skus(filters):
+            return [row['sku'] for row
+                    in adapter._call('catalog_product.list', [filters])]
+
+        def first(filters):
+            return [adapter._call('catalog_product.list', [filters])]
+
+        adapter.skus = skus
+        adapter.first = first
+        for method in ('skus', 'first'):
+            with self.assertRaises(TypeError):
+                with adapter.call_batch():
+                    adapter.defer(method, {})
+        self.assertFalse(self.api_client.multi_call.called)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+import unittest
+import xmlrpclib
+
+from .benchmark.fake_magento import FakeMagentoCatalog, FakeMagentoServer
+from .benchmark.runner import RssMeter, compare
+
+
+class TestBenchmark(unittest.TestCase):
+    """ Test the tools of the benchmarks """
+
+    def test_catalog(self):
+        catalog = FakeMagentoCatalog(products=10, customers=5, orders=3)
+        self.assertEqual(
+            ['4', '5', '6'],
+            [row['product_id'] for row in catalog.catalog_product_list(
+                {'entity_id': {'from': 4, 'to': 6}}
+            )]
+        )
+        self.assertEqual(['5'], catalog.ol_customer_search(
+            {'entity_id': {'gt': 4}, 'website_id': {'in': ['1']}}
+        ))
+        # the same id always gives the same record
+        self.assertEqual(catalog.sales_order_info('100000002'),
+                         catalog.sales_order_info('100000002'))
+        with self.assertRaises(xmlrpclib.Fault):
+            catalog.sales_order_info('100000004')
+
+    def test_server(self):
+        catalog = FakeMagentoCatalog(products=10, customers=5, orders=3)
+        with FakeMagentoServer(catalog) as server:
+            proxy = xmlrpclib.ServerProxy(
+                server.location + '/index.php/api/xmlrpc', allow_none=True
+            )
+            session = proxy.login('odoo', 'odoo')
+            results = proxy.multiCall(session, [
+                ['customer.info', [1]],
+                ['customer.info', [6]],
+            ])
+        self.assertEqual('1', results[0]['customer_id'])
+        self.assertEqual(102, results[1]['faultCode'])
+        self.assertEqual(2, server.request_count)
+        self.assertEqual(2, server.call_count)
+
+    def test_compare(self):
+        baseline = {'products': {'records_per_second': 100.,
+                                 'sql_per_record': 20.,
+                                 'api_calls_per_record': 2.}}
+        results = {'products': {'records_per_second': 90.,
+                                'sql_per_record': 30.,
+                                'api_calls_per_record': 2.,
+                                'rss_growth_mb': 200.}}
+        self.assertEqual(
+            [('products', 'sql_per_record', 20., 30.)],
+            compare(results, baseline, 0.2)
+        )
+
+    def test_rss_growth(self):
+        meter = RssMeter()
+        meter.start()
+        if meter.start_rss is None:
+            self.skipTest('the peak of the memory cannot be reset')
+        data = 'x' * (32 * 1024 * 1024)
+        self.assertGreaterEqual(meter.growth_kb(), 30 * 1024)
+        del data
+        # a new flow does not see the peak of the previous one
+        meter.start()
+        self.assertLess(meter.growth_kb(), 30 * 1024)
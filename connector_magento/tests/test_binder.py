@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+from .common import MagentoTestCase
+
+
+class TestBinderCache(MagentoTestCase):
+    """ Test the cache of the binders """
+
+    def setUp(self):
+        super(TestBinderCache, self).setUp()
+        category = self.env['product.category'].create({'name': 'Cat'})
+        self.binding = self.create_binding_no_export(
+            'magento.product.category', category, '10'
+        )
+
+    def test_preloaded_model(self):
+        """ The bindings of the small models are loaded at once """
+        with self.backend.work_on('magento.product.category') as work:
+            binder = work.component(usage='binder')
+            self.assertEqual(self.binding, binder.to_internal(10))
+            self.assertEqual(self.binding.odoo_id,
+                             binder.to_internal('10', unwrap=True))
+            self.assertFalse(binder.to_internal('11'))
+            self.assertEqual(
+                '10', binder.to_external(self.binding.odoo_id, wrap=True)
+            )
+            cache = work.magento_binder_cache
+            self.assertIn('magento.product.category', cache.loaded)
+
+            # a new binding is added in the cache
+            category = self.env['product.category'].create({'name': 'New'})
+            binding = self.create_binding_no_export(
+                'magento.product.category', category
+            )
+            binder.bind('11', binding)
+            by_external, by_odoo = cache.loaded['magento.product.category']
+            self.assertEqual(binding.id, by_external[u'11'])
+            self.assertEqual([u'11'], by_odoo[category.id])
+            self.assertEqual(binding, binder.to_internal('11'))
+
+            # the cache is shared by the binders of the session
+            other = work.component(usage='binder',
+                                   model_name='magento.product.category')
+            self.assertEqual(binding, other.to_internal('11'))
+
+    def test_clear(self):
+        """ The bindings rolled back are forgotten once cleared """
+        with self.backend.work_on('magento.product.category') as work:
+            binder = work.component(usage='binder')
+            with self.assertRaises(ZeroDivisionError):
+                with self.env.cr.savepoint():
+                    category = self.env['product.category'].create(
+                        {'name': 'New'}
+                    )
+                    binding = self.create_binding_no_export(
+                        'magento.product.category', category
+                    )
+                    binder.bind('11', binding)
+                    1 / 0
+            self.env.invalidate_all()
+            work.magento_binder_cache.clear()
+            self.assertFalse(binder.to_internal('11'))
+            self.assertEqual(self.binding, binder.to_internal('10'))
+
+    def test_recent_lookups(self):
+        """ The lookups of the other models are kept in a LRU cache """
+        product = self.env['product.product'].create({'name': 'Product'})
+        binding = self.create_binding_no_export(
+            'magento.product.product', product, '20'
+        )
+        with self.backend.work_on('magento.product.product') as work:
+            cache = work.magento_binder_cache
+            cache.size = 1
+            binder = work.component(usage='binder')
+            self.assertEqual(binding, binder.to_internal('20'))
+            self.assertFalse(binder.to_internal('21'))
+            self.assertEqual(
+                {'20': binding.id},
+                cache.recent['magento.product.product']
+            )
+            cache.put('magento.product.product', '22', 1)
+            self.assertEqual(
+                ['22'], cache.recent['magento.product.product'].keys()
+            )
+
+    def test_to_internal_many(self):
+        """ The bindings of several external ids are searched at once """
+        product = self.env['product.product'].create({'name': 'Product'})
+        binding = self.create_binding_no_export(
+            'magento.product.product', product, '20'
+        )
+        with self.backend.work_on('magento.product.product') as work:
+            binder = work.component(usage='binder')
+            bindings = binder.to_internal_many([20, '21'])
+            self.assertEqual(binding, bindings[u'20'])
+            self.assertFalse(bindings[u'21'])
+            products = binder.to_internal_many(['20'], unwrap=True)
+            self.assertEqual(product, products[u'20'])
+            self.assertEqual(
+                binding.id,
+                work.magento_binder_cache.get('magento.product.product', '20')
+            )
@@ -2,6 +2,12 @@
 # Copyright 2015-2017 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
+import mock
+
+from odoo import fields
+from odoo.addons.connector_magento.components.backend_adapter import (
+    MagentoAPI,
+)
 from .common import MagentoSyncTestCase, recorder
 
 
@@ -216,3 +222,155 @@ class TestUpdateStockQty(MagentoSyncTestCase):
             delayable.export_inventory.assert_called_with(
                 fields=['magento_qty'],
             )
+
+    def test_compute_new_qty_bulk(self):
+        self.backend.bulk_stock_export = True
+        product = self.binding_product.odoo_id
+        binding = self.binding_product
+        self._product_change_qty(product, 30)
+
+        with self.mock_with_delay() as (delayable_cls, delayable):
+            binding.recompute_magento_qty()
+            self.assertEqual(binding.magento_qty, 30.0)
+
+            # one job for the chunk instead of one job per product
+            self.assertEqual(1, delayable_cls.call_count)
+            delay_args, delay_kwargs = delayable_cls.call_args
+            self.assertEqual((binding,), delay_args)
+            self.assertEqual(20, delay_kwargs.get('priority'))
+
+            self.assertFalse(delayable.export_inventory.called)
+            delayable.export_inventory_batch.assert_called_with(
+                fields=['magento_qty'],
+            )
+
+    def test_export_qty_batch_failure(self):
+        binding = self.binding_product
+        with self.mock_with_delay():
+            binding.magento_qty = 30
+
+        fault = {'isFault': True,
+                 'faultCode': '101',
+                 'faultMessage': 'Product not exists.'}
+        with mock.patch.object(MagentoAPI, 'multi_call') as multi_call, \
+                self.mock_with_delay() as (delayable_cls, delayable):
+            multi_call.return_value = [fault]
+            binding.export_inventory_batch(fields=['magento_qty'])
+
+            multi_call.assert_called_once_with([
+                ('oerp_cataloginventory_stock_item.update',
+                 [879, {'qty': 30., 'is_in_stock': 1}]),
+            ])
+            # the failed product is exported in a separate job
+            self.assertEqual(1, delayable_cls.call_count)
+            delay_args, __ = delayable_cls.call_args
+            self.assertEqual((binding,), delay_args)
+            delayable.export_inventory.assert_called_with(
+                fields=['magento_qty'],
+            )
+
+    def test_compute_new_qty_sql(self):
+        self.backend.sql_stock_recompute = True
+        product = self.binding_product.odoo_id
+        binding = self.binding_product
+        self._product_change_qty(product, 30)
+
+        # create an outgoing move
+        customer_location = self.env.ref('stock.stock_location_customers')
+        outgoing = self.env['stock.move'].create({
+            'name': product.name,
+            'product_id': product.id,
+            'product_uom_qty': 11,
+            'product_uom': product.uom_id.id,
+            'location_id': self.env.ref('stock.stock_location_stock').id,
+            'location_dest_id': customer_location.id,
+        })
+        outgoing.action_confirm()
+        self.assertEqual(product.virtual_available, 19.0)
+
+        with self.mock_with_delay() as (delayable_cls, delayable):
+            binding.recompute_magento_qty()
+            self.assertEqual(binding.magento_qty, 19.0)
+
+            self.assertEqual(1, delayable_cls.call_count)
+            delayable.export_inventory.assert_called_with(
+                fields=['magento_qty'],
+            )
+
+        # nothing changed, no new job
+        with self.mock_with_delay() as (delayable_cls, delayable):
+            binding.recompute_magento_qty()
+            self.assertEqual(0, delayable_cls.call_count)
+
+    def test_update_stock_qty_incremental(self):
+        self.backend.write({
+            'incremental_stock_sync': True,
+            'last_full_stock_sync': fields.Datetime.now(),
+        })
+        product = self.binding_product.odoo_id
+        binding = self.binding_product
+        self._product_change_qty(product, 30)
+        journal = self.env['magento.stock.journal'].search(
+            [('backend_id', '=', self.backend.id)]
+        )
+        self.assertEqual(product, journal.mapped('product_id'))
+
+        with self.mock_with_delay() as (delayable_cls, delayable):
+            self.backend.update_product_stock_qty()
+            self.assertEqual(binding.magento_qty, 30.0)
+            self.assertEqual(1, delayable_cls.call_count)
+
+        # the journal has been emptied
+        journal = self.env['magento.stock.journal'].search(
+            [('backend_id', '=', self.backend.id)]
+        )
+        self.assertFalse(journal)
+
+        # the quantity changes without any stock move, it is not
+        # recomputed until the next full synchronization
+        with self.mock_with_delay():
+            binding.magento_qty = 10
+        with self.mock_with_delay() as (delayable_cls, delayable):
+            self.backend.update_product_stock_qty()
+            self.assertEqual(binding.magento_qty, 10.0)
+            self.assertEqual(0, delayable_cls.call_count)
+
+        self.backend.last_full_stock_sync = '2000-01-01 00:00:00'
+        with self.mock_with_delay() as (delayable_cls, delayable):
+            self.backend.update_product_stock_qty()
+            self.assertEqual(binding.magento_qty, 30.0)
+            self.assertEqual(1, delayable_cls.call_count)
+
+    def test_export_product_inventory_merge(self):
+        """ The fields are added to the pending inventory export """
+        self.binding_product.write({'magento_qty': 333})
+        self.binding_product.write({'backorders': 'yes-and-notification'})
+        jobs = self.env['queue.job'].search(
+            [('model_name', '=', 'magento.product.product'),
+             ('method_name', '=', 'export_inventory')]
+        ).filtered(
+            lambda job: job.record_ids == [self.binding_product.id]
+        )
+        self.assertEqual(1, len(jobs))
+        self.assertEqual({'fields': ['backorders', 'magento_qty']},
+                         jobs.kwargs)
+
+    def test_export_product_inventory_enqueued(self):
+        """ An export sent to a worker is not extended """
+        binding = self.binding_product
+        binding.delay_export_inventory(fields=['magento_qty'])
+        domain = [('model_name', '=', 'magento.product.product'),
+                  ('method_name', '=', 'export_inventory')]
+        job = self.env['queue.job'].search(domain)
+        job.state = 'enqueued'
+        # the enqueued job may read the quantity before it is
+        # committed, a new job exports it again, the next changes are
+        # added to the new job
+        binding.delay_export_inventory(fields=['magento_qty'])
+        binding.delay_export_inventory(fields=['backorders'])
+        new_job = self.env['queue.job'].search(domain) - job
+        self.assertEqual(1, len(new_job))
+        self.assertEqual('pending', new_job.state)
+        self.assertEqual(job.identity_key, new_job.identity_key)
+        self.assertEqual({'fields': ['backorders', 'magento_qty']},
+                         new_job.kwargs)
@@ -2,7 +2,17 @@
 # Copyright 2015-2017 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
-from .common import MagentoSyncTestCase, recorder
+import mock
+
+from odoo.addons.connector_magento.components.backend_adapter import (
+    MagentoAPI,
+)
+
+from .common import (
+    MagentoSyncTestCase,
+    recorder,
+    use_cassette_single_calls,
+)
 
 
 class TestImportPartner(MagentoSyncTestCase):
@@ -31,14 +41,16 @@ class TestImportPartner(MagentoSyncTestCase):
         self.assertEqual(partner.type, 'contact')
         self.assertEqual(len(partner.child_ids), 0)
 
-    @recorder.use_cassette
     def test_import_partner_individual_1_address(self):
         """ Import an individual (b2c) with 1 billing address
 
         A magento customer is considered an individual if its billing
         address has an empty 'company' field
         """
-        self.env['magento.res.partner'].import_record(self.backend, '136')
+        with use_cassette_single_calls(
+                'test_import_partner_individual_1_address'):
+            self.env['magento.res.partner'].import_record(self.backend,
+                                                          '136')
         partner = self.model.search([('external_id', '=', '136'),
                                      ('backend_id', '=', self.backend.id)])
         self.assertEqual(len(partner), 1)
@@ -56,14 +68,16 @@ class TestImportPartner(MagentoSyncTestCase):
         self.assertEqual(partner.company_id.id,
                          self.backend.warehouse_id.company_id.id)
 
-    @recorder.use_cassette
     def test_import_partner_individual_2_addresses(self):
         """ Import an individual (b2c) with 2 addresses
 
         A magento customer is considered an individual if its billing
         address has an empty 'company' field
         """
-        self.env['magento.res.partner'].import_record(self.backend, '65')
+        with use_cassette_single_calls(
+                'test_import_partner_individual_2_addresses'):
+            self.env['magento.res.partner'].import_record(self.backend,
+                                                          '65')
 
         partner = self.model.search([('external_id', '=', '65'),
                                      ('backend_id', '=', self.backend.id)])
@@ -88,14 +102,16 @@ class TestImportPartner(MagentoSyncTestCase):
         self.assertEqual(partner.child_ids[0].company_id.id,
                          self.backend.company_id.id)
 
-    @recorder.use_cassette
     def test_import_partner_company_1_address(self):
         """ Import an company (b2b) with 1 address
 
         A magento customer is considered a company if its billing
         address contains something in the 'company' field
         """
-        self.env['magento.res.partner'].import_record(self.backend, '104')
+        with use_cassette_single_calls(
+                'test_import_partner_company_1_address'):
+            self.env['magento.res.partner'].import_record(self.backend,
+                                                          '104')
 
         partner = self.model.search([('external_id', '=', '104'),
                                      ('backend_id', '=', self.backend.id)])
@@ -111,14 +127,16 @@ class TestImportPartner(MagentoSyncTestCase):
                          msg="The billing address should be of "
                              "type 'invoice'")
 
-    @recorder.use_cassette
     def test_import_partner_company_2_addresses(self):
         """ Import an company (b2b) with 2 addresses
 
         A magento customer is considered a company if its billing
         address contains something in the 'company' field
         """
-        self.env['magento.res.partner'].import_record(self.backend, '99')
+        with use_cassette_single_calls(
+                'test_import_partner_company_2_addresses'):
+            self.env['magento.res.partner'].import_record(self.backend,
+                                                          '99')
 
         partner = self.model.search([('external_id', '=', '99'),
                                      ('backend_id', '=', self.backend.id)])
@@ -148,11 +166,13 @@ class TestImportPartner(MagentoSyncTestCase):
                          msg="The shipping address should be of "
                              "type 'delivery'")
 
-    @recorder.use_cassette('test_import_partner_individual_2_addresses')
     def test_import_partner_individual_2_addresses_multi_company(self):
         """Import an invidual on multi backend company"""
         self.backend.is_multi_company = True
-        self.env['magento.res.partner'].import_record(self.backend, '65')
+        with use_cassette_single_calls(
+                'test_import_partner_individual_2_addresses'):
+            self.env['magento.res.partner'].import_record(self.backend,
+                                                          '65')
 
         partner = self.model.search([('external_id', '=', '65'),
                                      ('backend_id', '=', self.backend.id)])
@@ -174,3 +194,138 @@ class TestImportPartner(MagentoSyncTestCase):
                              "type 'delivery'")
         self.assertFalse(partner.company_id.id)
         self.assertFalse(partner.child_ids[0].company_id.id)
+
+    def test_import_partner_bulk(self):
+        """ Import a chunk of partners with their addresses """
+        customer = {'customer_id': '201',
+                    'email': 'john@example.com',
+                    'dob': None,
+                    'created_at': '2017-01-01 10:00:00',
+                    'updated_at': '2017-01-01 10:00:00',
+                    'taxvat': None,
+                    'group_id': '1',
+                    'firstname': 'John',
+                    'middlename': None,
+                    'lastname': 'Doe',
+                    'website_id': '1',
+                    'store_id': '1'}
+        # the missing name makes the import of this partner fail
+        broken = dict(customer, customer_id='202', email='jim@example.com')
+        del broken['firstname']
+        address = {'customer_address_id': '301',
+                   'customer_id': '201',
+                   'created_at': '2017-01-01 10:00:00',
+                   'updated_at': '2017-01-01 10:00:00',
+                   'firstname': 'John',
+                   'middlename': None,
+                   'lastname': 'Doe',
+                   'prefix': None,
+                   'company': None,
+                   'street': 'Main Street 1',
+                   'postcode': '1000',
+                   'city': 'Lausanne',
+                   'region': None,
+                   'country_id': 'CH',
+                   'telephone': None,
+                   'fax': None,
+                   'is_default_billing': True,
+                   'is_default_shipping': True}
+        customers = {'201': customer, '202': broken}
+
+        def multi_call(calls):
+            results = []
+            for method, arguments in calls:
+                if method == 'customer.info':
+                    results.append(customers[str(arguments[0])])
+                elif method == 'customer_address.list':
+                    customer_id = arguments[0]['customer_id']['eq']
+                    results.append(
+                        [{'customer_address_id': '301'}]
+                        if customer_id == '201' else []
+                    )
+                else:
+                    self.assertEqual('customer_address.info', method)
+                    results.append(address)
+            return results
+
+        with mock.patch.object(MagentoAPI, 'multi_call',
+                               side_effect=multi_call) as multi:
+            self.model.import_bulk(self.backend, ['201', '202'])
+        # customers, lists of addresses and addresses
+        self.assertEqual(3, multi.call_count)
+
+        partner = self.model.search([('external_id', '=', '201'),
+                                     ('backend_id', '=', self.backend.id)])
+        self.assertEqual('John Doe', partner.name)
+        self.assertEqual('Lausanne', partner.city)
+        self.assertEqual(['301'],
+                         partner.magento_address_bind_ids.mapped(
+                             'external_id'))
+
+        # the partner which failed is imported in a job of its own
+        self.assertFalse(self.model.search([('external_id', '=', '202')]))
+        jobs = self.env['queue.job'].search(
+            [('model_name', '=', 'magento.res.partner'),
+             ('method_name', '=', 'import_record')]
+        )
+        self.assertEqual(['202'], [job.args[1] for job in jobs])
+
+    def test_address_reference_data(self):
+        """ Countries, states and titles of the addresses are cached """
+        country_model = self.env['res.country']
+        state_model = self.env['res.country.state']
+        switzerland = country_model._magento_search_by_code(' ch')
+        self.assertEqual(self.env.ref('base.ch'), switzerland)
+        state_ch = state_model.create({'name': 'Magentoland',
+                                       'code': 'MGL',
+                                       'country_id': switzerland.id})
+        france = self.env.ref('base.fr')
+        state_fr = state_model.create({'name': 'Magentoland',
+                                       'code': 'MGL',
+                                       'country_id': france.id})
+        # the region is matched in the country of the address first
+        self.assertEqual(state_fr, state_model._magento_search_by_region(
+            'magentoland', country=france
+        ))
+        self.assertEqual(state_ch, state_model._magento_search_by_region(
+            'MagentoLand ', country=switzerland
+        ))
+        # a modified state is found again
+        state_ch.name = 'Magentoshire'
+        self.assertEqual(state_ch, state_model._magento_search_by_region(
+            'magentoshire', country=switzerland
+        ))
+
+        with self.backend.work_on('magento.address') as work:
+            mapper = work.component(usage='import.mapper')
+            title = mapper.title({'prefix': 'Dr.'})['title']
+            self.assertEqual(title, mapper.title({'prefix': 'dr.'})['title'])
+
+    def test_search_by_emails(self):
+        """ Search of the customers by email """
+        with recorder.use_cassette('test_import_partner_no_address'):
+            self.model.import_record(self.backend, '139')
+        partner = self.model.search([('external_id', '=', '139'),
+                                     ('backend_id', '=', self.backend.id)])
+        self.assertEqual('benjamin@example.com', partner.email_normalized)
+        result = self.model._magento_search_by_emails(
+            [' Benjamin@Example.com', 'unknown@example.com', None],
+            partner.website_id,
+        )
+        self.assertEqual({' Benjamin@Example.com': partner,
+                          'unknown@example.com': self.model.browse(),
+                          None: self.model.browse()},
+                         result)
+
+    def test_import_partner_existing_email(self):
+        """ Bind a customer on a partner with the same email in any case """
+        existing = self.env['res.partner'].create({
+            'name': 'Benjamin',
+            'email': 'Benjamin@Example.com',
+            'customer': True,
+        })
+        with recorder.use_cassette('test_import_partner_no_address'):
+            self.model.import_record(self.backend, '139')
+        partner = self.model.search([('external_id', '=', '139'),
+                                     ('backend_id', '=', self.backend.id)])
+        self.assertEqual(existing, partner.odoo_id)
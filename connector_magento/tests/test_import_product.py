@@ -2,7 +2,13 @@
 # Copyright 2013-2017 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
+import mock
+
 from openerp.addons.connector.exception import InvalidDataError
+from odoo.addons.queue_job.job import identity_exact
+from odoo.addons.connector_magento.components.backend_adapter import (
+    MagentoAPI,
+)
 from .common import MagentoSyncTestCase, recorder, mock_urlopen_image
 
 
@@ -107,3 +113,114 @@ class TestImportProduct(MagentoSyncTestCase):
         product = product_model.search([('backend_id', '=', backend_id),
                                         ('external_id', '=', '563')])
         self.assertEqual(product.type, 'service')
+
+    def _mock_product_list(self, product_ids):
+        """ Fake 'catalog_product.list' filtering on ranges of ids """
+        def call(method, arguments):
+            self.assertEqual('catalog_product.list', method)
+            condition = arguments[0].get('entity_id', {})
+            return [{'product_id': str(product_id)}
+                    for product_id in product_ids
+                    if condition.get('from', 0) <= product_id and
+                    product_id <= condition.get('to', product_id) and
+                    product_id > condition.get('gt', 0)]
+        return mock.patch.object(MagentoAPI, 'call', side_effect=call)
+
+    def _import_jobs(self):
+        """ External ids of the pending product import jobs """
+        jobs = self.env['queue.job'].search(
+            [('model_name', '=', 'magento.product.product'),
+             ('method_name', '=', 'import_record'),
+             ('state', '=', 'pending')],
+            order='id',
+        )
+        return [job.args[1] for job in jobs]
+
+    def test_import_product_batch_paged(self):
+        """ Batch import of the products page by page """
+        self.backend.import_page_size = 100
+        product_ids = [1, 2, 3, 250, 900]
+        with self._mock_product_list(product_ids), \
+                self.mock_with_delay() as (delayable_cls, delayable):
+            self.env['magento.product.product'].import_batch(
+                self.backend, filters={}
+            )
+            self.assertEqual([1, 2, 3], self._import_jobs())
+            # the next page is imported by a new job
+            delayable.import_batch.assert_called_once_with(
+                self.backend, filters={'page_from_id': 100}
+            )
+
+            delayable.reset_mock()
+            # empty ranges are skipped
+            self.env['magento.product.product'].import_batch(
+                self.backend, filters={'page_from_id': 100}
+            )
+            self.assertEqual([1, 2, 3, 250], self._import_jobs())
+            delayable.import_batch.assert_called_once_with(
+                self.backend, filters={'page_from_id': 400}
+            )
+
+    def test_import_product_batch_page_after_gap(self):
+        """ A page found after a gap has at most a page of products """
+        self.backend.import_page_size = 100
+        product_ids = range(1000, 1300)
+        with self._mock_product_list(product_ids), \
+                self.mock_with_delay() as (delayable_cls, delayable):
+            self.env['magento.product.product'].import_batch(
+                self.backend, filters={'page_from_id': 100}
+            )
+            self.assertEqual(range(1000, 1100), self._import_jobs())
+            delayable.import_batch.assert_called_once_with(
+                self.backend, filters={'page_from_id': 1099}
+            )
+
+    def test_import_product_batch_last_page(self):
+        """ The batch import stops after the last product """
+        self.backend.import_page_size = 100
+        with self._mock_product_list([50]), \
+                self.mock_with_delay() as (delayable_cls, delayable):
+            self.env['magento.product.product'].import_batch(
+                self.backend, filters={'page_from_id': 100}
+            )
+            self.assertEqual([], self._import_jobs())
+            self.assertFalse(delayable.import_batch.called)
+
+    def test_import_product_batch_pending(self):
+        """ No new job when the import of a product is already pending """
+        self.env['magento.product.product'].with_delay(
+            identity_key=identity_exact
+        ).import_record(self.backend, 2)
+        with self._mock_product_list([1, 2, 3]):
+            self.env['magento.product.product'].import_batch(
+                self.backend, filters={}
+            )
+        self.assertEqual([2, 1, 3], self._import_jobs())
+
+    def test_import_product_uptodate_not_read(self):
+        """ A product not modified since its last import is not read """
+        def call(method, arguments):
+            self.assertEqual('catalog_product.list', method)
+            return [{'product_id': '1',
+                     'updated_at': '2017-01-01 10:00:00'}]
+        with mock.patch.object(MagentoAPI, 'call', side_effect=call):
+            self.env['magento.product.product'].import_batch(
+                self.backend, filters={}
+            )
+        job = self.env['queue.job'].search(
+            [('model_name', '=', 'magento.product.product'),
+             ('method_name', '=', 'import_record')],
+        )
+        self.assertEqual({'updated_at': '2017-01-01 10:00:00'}, job.kwargs)
+
+        product = self.env['product.product'].create({'name': 'Product'})
+        self.create_binding_no_export(
+            'magento.product.product', product, '1',
+            sync_date='2017-01-02 10:00:00',
+        )
+        with mock.patch.object(MagentoAPI, 'call') as call:
+            result = self.env['magento.product.product'].import_record(
+                self.backend, '1', **job.kwargs
+            )
+        self.assertEqual('Already up-to-date.', result)
+        self.assertFalse(call.called)
@@ -2,6 +2,13 @@
 # Copyright 2013-2017 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
+import mock
+
+from odoo.addons.component.core import WorkContext
+from odoo.addons.connector_magento.components.backend_adapter import (
+    MagentoAPI,
+)
+
 from .common import MagentoSyncTestCase, recorder
 
 
@@ -29,3 +36,115 @@ class TestImportProductCategory(MagentoSyncTestCase):
         categories = category_model.search([('backend_id', '=', backend_id)])
         # tree: Women > Sale > Default Category > Test Magento (hidden)
         self.assertEqual(len(categories), 4)
+
+    def test_import_translations(self):
+        """ The translations are read at once and written when changed """
+        self.env['res.lang'].load_lang('fr_FR')
+        lang = self.env['res.lang'].search([('code', '=', 'fr_FR')])
+        storeviews = self.env['magento.storeview'].search(
+            [('backend_id', '=', self.backend.id)]
+        )
+        storeviews.write({'lang_id': lang.id})
+        category = self.env['product.category'].create({'name': 'Shoes'})
+        binding = self.create_binding_no_export(
+            'magento.product.category', category, '10'
+        )
+
+        magento_api = mock.MagicMock(name='Magento API')
+        magento_api.multi_call.return_value = [
+            {'category_id': '10', 'level': '1', 'name': 'Chaussures',
+             'description': None},
+        ]
+        work = WorkContext(model_name='magento.product.category',
+                           collection=self.backend,
+                           magento_api=magento_api)
+        importer = work.component(usage='translation.importer')
+        importer.run('10', binding)
+        # the storeviews of a language are read once, in one request
+        self.assertEqual(1, magento_api.multi_call.call_count)
+        self.assertFalse(magento_api.call.called)
+        self.assertEqual('Chaussures', binding.with_context(lang='fr_FR').name)
+        self.assertEqual('Shoes', binding.with_context(lang='en_US').name)
+
+        with mock.patch.object(type(binding), 'write') as write:
+            importer.run('10', binding)
+        self.assertFalse(write.called)
+
+    def test_import_product_category_tree(self):
+        """ Import of the categories as a tree """
+        self.backend.import_categories_tree = True
+        tree = {'category_id': '1', 'children': [
+            {'category_id': '2', 'children': [
+                {'category_id': '3', 'children': [
+                    {'category_id': '5', 'children': []},
+                ]},
+                {'category_id': '4', 'children': []},
+            ]},
+        ]}
+        parents = {'1': 0, '2': '1', '3': '2', '4': '2', '5': '3'}
+
+        def call(method, arguments):
+            self.assertEqual('catalog_category.tree', method)
+            return tree
+
+        def multi_call(calls):
+            return [{'category_id': str(arguments[0]),
+                     'level': '0' if arguments[0] == 1 else '1',
+                     'name': 'Category %s' % arguments[0],
+                     'parent_id': parents[str(arguments[0])],
+                     'description': None,
+                     'updated_at': '2017-01-01 10:00:00'}
+                    for method, arguments in calls]
+
+        with mock.patch.object(MagentoAPI, 'call', side_effect=call), \
+                mock.patch.object(MagentoAPI, 'multi_call',
+                                  side_effect=multi_call) as multi:
+            self.env['magento.product.category'].import_batch(
+                self.backend, filters={}
+            )
+            # the top levels are read at once and imported directly
+            self.assertEqual(1, multi.call_count)
+            bindings = self.env['magento.product.category'].search(
+                [('backend_id', '=', self.backend.id)]
+            )
+            self.assertEqual(['1', '2'],
+                             sorted(bindings.mapped('external_id')))
+            # the hierarchy is not left to be rebuilt later
+            self.assertTrue(all(bindings.mapped('parent_left')))
+
+            # one job per subtree
+            jobs = self.env['queue.job'].search(
+                [('model_name', '=', 'magento.product.category'),
+                 ('method_name', '=', 'import_tree')],
+                order='id',
+            )
+            self.assertEqual([['3', '5'], ['4']],
+                             sorted(job.args[1] for job in jobs))
+
+            self.env['magento.product.category'].import_tree(
+                self.backend, ['3', '5']
+            )
+        bindings = self.env['magento.product.category'].search(
+            [('backend_id', '=', self.backend.id)]
+        )
+        category_5 = bindings.filtered(lambda b: b.external_id == '5')
+        self.assertEqual('3', category_5.magento_parent_id.external_id)
+        self.assertEqual('2', category_5.magento_parent_id
+                         .magento_parent_id.external_id)
+
+        # the hierarchy is rebuilt at the end of the bulk import
+        category_2 = bindings.filtered(lambda b: b.external_id == '2')
+        children = self.env['product.category'].search(
+            [('id', 'child_of', category_2.odoo_id.id)]
+        )
+        self.assertIn(category_5.odoo_id, children)
+        # and a checkpoint is added for each new category
+        checkpoints = self.env['connector.checkpoint'].search(
+            [('model_id.model', '=', 'magento.product.category'),
+             ('record_id', 'in', bindings.ids)]
+        )
+        self.assertEqual(sorted(bindings.ids),
+                         sorted(checkpoints.mapped('record_id')))
+        self.assertEqual({'need_review'}, set(checkpoints.mapped('state')))
+        self.assertEqual([self.backend] * len(checkpoints),
+                         checkpoints.mapped('backend_id'))
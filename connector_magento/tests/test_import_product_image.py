@@ -2,8 +2,9 @@
 # Copyright 2015-2017 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
-import urllib2
+import hashlib
 import mock
+import requests
 from base64 import b64encode
 
 from odoo import models
@@ -12,6 +13,9 @@ from odoo.addons.component.tests.common import (
     TransactionComponentRegistryCase,
 )
 from odoo.addons.connector_magento import components
+from odoo.addons.connector_magento.components.backend_adapter import (
+    MagentoImageDownloader,
+)
 from odoo.addons.connector_magento.models.product.importer import (
     CatalogImageImporter,
 )
@@ -29,6 +33,7 @@ PNG_IMG_4PX_GREEN = ("\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x04"
                      "\x0c\x0c\xc4p\x002\xd2\x01\x07\xce\xee\xd0\xcf\x00\x00"
                      "\x00\x00IEND\xaeB`\x82")
 B64_PNG_IMG_4PX_GREEN = b64encode(PNG_IMG_4PX_GREEN)
+SHA1_PNG_IMG_4PX_GREEN = hashlib.sha1(PNG_IMG_4PX_GREEN).hexdigest()
 
 
 class TestImportProductImage(TransactionComponentRegistryCase):
@@ -137,19 +142,23 @@ class TestImportProductImage(TransactionComponentRegistryCase):
         )
         binding.with_context.return_value = binding_no_export
 
-        with mock.patch('urllib2.urlopen') as urlopen:
-            def image_url_response(url):
-                if url._Request__original in (url_tee1, url_tee2):
-                    raise urllib2.HTTPError(url, 404, '404', None, None)
+        with mock.patch.object(requests.Session, 'get') as get:
+            def image_url_response(url, **kwargs):
+                if url in (url_tee1, url_tee2):
+                    return MockResponseImage('', code=404)
                 else:
                     return MockResponseImage(PNG_IMG_4PX_GREEN)
-            urlopen.side_effect = image_url_response
+            get.side_effect = image_url_response
 
             self.image_importer.run(111, binding)
 
         binding.with_context.assert_called_with(connector_no_export=True)
         binding_no_export.write.assert_called_with(
-            {'image': B64_PNG_IMG_4PX_GREEN}
+            {'image': B64_PNG_IMG_4PX_GREEN,
+             'magento_image_file': '/m/a/connector_magento_1.png',
+             'magento_image_hash': SHA1_PNG_IMG_4PX_GREEN,
+             'magento_image_etag': None,
+             'magento_image_last_modified': None}
         )
 
     def test_import_images_403(self):
@@ -162,16 +171,115 @@ class TestImportProductImage(TransactionComponentRegistryCase):
                     '/i/n/ink-eater-krylon-bombear-destroyed-tee-1.jpg')
         url_tee2 = ('http://localhost:9100/media/catalog/product/'
                     'i/n/ink-eater-krylon-bombear-destroyed-tee-2.jpg')
-        with mock.patch('urllib2.urlopen') as urlopen:
-            def image_url_response(url):
-                url = url.get_full_url()
+        with mock.patch.object(requests.Session, 'get') as get:
+            def image_url_response(url, **kwargs):
                 if url == url_tee2:
-                    raise urllib2.HTTPError(url, 404, '404', None, None)
+                    return MockResponseImage('', code=404)
                 elif url == url_tee1:
-                    raise urllib2.HTTPError(url, 403, '403', None, None)
+                    return MockResponseImage('', code=403)
                 else:
                     return MockResponseImage(PNG_IMG_4PX_GREEN)
 
-            urlopen.side_effect = image_url_response
-            with self.assertRaises(urllib2.HTTPError):
+            get.side_effect = image_url_response
+            with self.assertRaises(requests.HTTPError):
                 self.image_importer.run(122, binding)
+
+    def test_import_images_too_large(self):
+        """ An image larger than the limit is skipped """
+        url_tee2 = ('http://localhost:9100/media/catalog/product/'
+                    'i/n/ink-eater-krylon-bombear-destroyed-tee-2.jpg')
+
+        binding = mock.Mock(name='magento.product.product,999')
+        binding.id = 999
+        binding_no_export = mock.MagicMock(
+            name='magento.product.product,999:no_export'
+        )
+        binding.with_context.return_value = binding_no_export
+
+        downloader = MagentoImageDownloader(
+            max_size=len(PNG_IMG_4PX_GREEN)
+        )
+        self.work.magento_image_downloader = downloader
+        with mock.patch.object(requests.Session, 'get') as get:
+            def image_url_response(url, **kwargs):
+                if url == url_tee2:
+                    return MockResponseImage(PNG_IMG_4PX_GREEN * 2)
+                else:
+                    return MockResponseImage(PNG_IMG_4PX_GREEN)
+
+            get.side_effect = image_url_response
+            self.image_importer.run(111, binding)
+
+        binding_no_export.write.assert_called_with(
+            {'image': B64_PNG_IMG_4PX_GREEN,
+             'magento_image_file':
+             '/i/n/ink-eater-krylon-bombear-destroyed-tee-1.jpg',
+             'magento_image_hash': SHA1_PNG_IMG_4PX_GREEN,
+             'magento_image_etag': None,
+             'magento_image_last_modified': None}
+        )
+        # the download stops at the first image kept
+        self.assertEqual(2, get.call_count)
+        for call in get.call_args_list:
+            self.assertEqual(30, call[1]['timeout'])
+
+    def test_image_downloader_shared(self):
+        """ The downloader and its connections are shared by the jobs """
+        downloader = self.backend._get_image_downloader()
+        self.assertIs(downloader, self.backend._get_image_downloader())
+        with self.backend.work_on('magento.product.product') as work:
+            self.assertIs(downloader, work.magento_image_downloader)
+        other = self.backend_model.create(
+            {'name': 'Other Magento',
+             'version': '1.7',
+             'location': 'http://magento2',
+             'username': 'odoo',
+             'warehouse_id': self.backend.warehouse_id.id,
+             'password': 'odoo42',
+             'auth_basic_username': 'user',
+             'auth_basic_password': 'secret'}
+        )
+        self.assertIsNot(downloader, other._get_image_downloader())
+
+    def test_image_download_spooled(self):
+        """ The content of an image is spooled to a temporary file """
+        downloader = MagentoImageDownloader(spool_size=10)
+        with mock.patch.object(requests.Session, 'get') as get:
+            get.return_value = MockResponseImage(PNG_IMG_4PX_GREEN)
+            image = downloader.download('http://magento/image.png')
+        try:
+            self.assertEqual(SHA1_PNG_IMG_4PX_GREEN, image.sha1)
+            # larger than the spool size, written on the disk
+            self.assertTrue(image.file._rolled)
+            self.assertEqual(PNG_IMG_4PX_GREEN, image.file.read())
+        finally:
+            image.file.close()
+
+    def test_import_images_not_modified(self):
+        """ An image not modified since the last import is not written """
+        binding = mock.Mock(name='magento.product.product,999')
+        binding.id = 999
+        binding.magento_image_file = (
+            '/i/n/ink-eater-krylon-bombear-destroyed-tee-2.jpg'
+        )
+        binding.magento_image_hash = SHA1_PNG_IMG_4PX_GREEN
+        binding.magento_image_etag = '"4px-green"'
+        binding.magento_image_last_modified = None
+
+        with mock.patch.object(requests.Session, 'get') as get:
+            response = MockResponseImage('', code=304)
+            response.headers['etag'] = '"4px-green"'
+            get.return_value = response
+            self.image_importer.run(111, binding)
+
+        # only the current image is requested
+        self.assertEqual(1, get.call_count)
+        self.assertEqual({'If-None-Match': '"4px-green"'},
+                         get.call_args[1]['headers'])
+        self.assertFalse(binding.with_context.called)
+
+        # the same content downloaded again is not written either
+        with mock.patch.object(requests.Session, 'get') as get:
+            get.return_value = MockResponseImage(PNG_IMG_4PX_GREEN)
+            self.image_importer.run(111, binding)
+        self.assertFalse(binding.with_context.called)
@@ -3,7 +3,14 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
 from collections import namedtuple
-from .common import MagentoSyncTestCase, recorder
+
+import mock
+
+from .common import (
+    MagentoSyncTestCase,
+    recorder,
+    use_cassette_single_calls,
+)
 
 ExpectedOrderLine = namedtuple(
     'ExpectedOrderLine',
@@ -68,6 +75,57 @@ class TestSaleOrder(MagentoSyncTestCase):
 
         self.assert_records(expected, binding.order_line)
 
+    def test_import_sale_order_amounts(self):
+        """ The amounts are computed once all the lines are created """
+        binding = self._import_sale_order(100000201)
+        self.assertEqual(3, len(binding.order_line))
+        self.assertEqual(2, len(binding.magento_order_line_ids))
+        self.assertAlmostEqual(
+            sum(binding.order_line.mapped('price_subtotal')),
+            binding.amount_untaxed
+        )
+        self.assertAlmostEqual(
+            binding.amount_untaxed + binding.amount_tax,
+            binding.amount_total
+        )
+
+    def test_onchange_lines_grouped(self):
+        """ Onchanges are played once per product and quantity """
+        lines = [(0, 0, {'product_id': 1, 'product_uom_qty': 1,
+                         'name': 'A'}),
+                 (0, 0, {'product_id': 2, 'product_uom_qty': 1,
+                         'name': 'B'}),
+                 (0, 0, {'product_id': 1, 'product_uom_qty': 1,
+                         'name': 'C'}),
+                 (0, 0, {'product_id': 1, 'product_uom_qty': 5,
+                         'name': 'D'}),
+                 ]
+
+        def play(order, order_lines):
+            for command in order_lines:
+                line = command[2]
+                line['price_unit'] = (line['product_id'] * 10 -
+                                      line['product_uom_qty'])
+            return order
+
+        with self.backend.work_on('magento.sale.order') as work:
+            mapper = work.component(usage='import.mapper')
+            onchange = work.component(
+                usage='ecommerce.onchange.manager.sale.order'
+            )
+            with mock.patch.object(type(onchange), 'play',
+                                   side_effect=play) as play_mock:
+                values = mapper._play_onchanges(
+                    {'magento_order_line_ids': lines}
+                )
+        self.assertEqual(1, play_mock.call_count)
+        self.assertEqual(3, len(play_mock.call_args[0][1]))
+        self.assertEqual(
+            [('A', 9), ('B', 19), ('C', 9), ('D', 5)],
+            [(line['name'], line['price_unit'])
+             for __, __, line in values['magento_order_line_ids']]
+        )
+
     def test_import_sale_order_copy_quotation(self):
         """ Copy a sales order with copy_quotation move bindings """
         binding = self._import_sale_order(100000201)
@@ -81,9 +139,9 @@ class TestSaleOrder(MagentoSyncTestCase):
 
     def test_import_sale_order_edited(self):
         """ Import of an edited sale order links to its parent """
-        with recorder.use_cassette('import_sale_order_edited_1'):
+        with use_cassette_single_calls('import_sale_order_edited_1'):
             binding = self._import_sale_order(100000200, cassette=False)
-        with recorder.use_cassette('import_sale_order_edited_2'):
+        with use_cassette_single_calls('import_sale_order_edited_2'):
             new_binding = self._import_sale_order('100000200-1',
                                                   cassette=False)
         self.assertEqual(new_binding.magento_parent_id, binding)
@@ -133,6 +191,42 @@ class TestSaleOrder(MagentoSyncTestCase):
                                        for line
                                        in binding.order_line),))
 
+    def test_lookup_payment_mode_and_carrier(self):
+        """ The cached lookups see the changes of the records """
+        carrier_model = self.env['delivery.carrier']
+        self.assertFalse(carrier_model._magento_search_by_code('ups_GND'))
+        binding = self._import_sale_order(100000201)
+        carrier = carrier_model._magento_search_by_code('ups_GND')
+        self.assertEqual(carrier, binding.carrier_id)
+        self.assertEqual(
+            1, carrier_model.search_count([('magento_code', '=', 'ups_GND')])
+        )
+
+        mode_model = self.env['account.payment.mode']
+        mode = mode_model._magento_search_by_name('checkmo')
+        self.assertTrue(mode)
+        mode.name = 'banktransfer'
+        self.assertFalse(mode_model._magento_search_by_name('checkmo'))
+        self.assertEqual(mode,
+                         mode_model._magento_search_by_name('banktransfer'))
+
+        # the carriers without Magento code do not clear the caches
+        with mock.patch.object(type(carrier_model),
+                               'clear_caches') as clear_caches:
+            other = carrier_model.create({
+                'name': 'Pickup',
+                'product_id': carrier.product_id.id,
+            })
+            other.name = 'Pickup in store'
+            other.unlink()
+            self.assertFalse(clear_caches.called)
+            carrier_model.create({
+                'name': 'UPS Express',
+                'product_id': carrier.product_id.id,
+                'magento_code': 'ups_XPR',
+            })
+            self.assertTrue(clear_caches.called)
+
     def test_import_sale_order_options(self):
         """Test import options such as the account_analytic_account and
         the fiscal_position that can be specified at different level of the
@@ -232,7 +326,7 @@ class TestSaleOrder(MagentoSyncTestCase):
 
     def test_copy_quotation_delay_export_state(self):
         """ Delay a state export on new copy from canceled order """
-        with recorder.use_cassette('import_sale_order_edited_1'):
+        with use_cassette_single_calls('import_sale_order_edited_1'):
             binding = self._import_sale_order(100000200, cassette=False)
 
         order = binding.odoo_id
@@ -257,7 +351,7 @@ class TestSaleOrder(MagentoSyncTestCase):
 
     def test_copy_quotation_export_state(self):
         """ Export a new state on new copy from canceled order """
-        with recorder.use_cassette('import_sale_order_edited_1'):
+        with use_cassette_single_calls('import_sale_order_edited_1'):
             binding = self._import_sale_order(100000200, cassette=False)
 
         # cancel the order
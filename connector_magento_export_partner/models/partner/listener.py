@@ -4,6 +4,7 @@
 
 from odoo.addons.component.core import Component
 from odoo.addons.component_event import skip_if
+from odoo.addons.queue_job.job import identity_exact
 
 
 class MagentoPartnerBindingExportListener(Component):
@@ -13,11 +14,11 @@ class MagentoPartnerBindingExportListener(Component):
 
     @skip_if(lambda self, record, **kwargs: self.no_connector_export(record))
     def on_record_create(self, record, fields=None):
-        record.with_delay().export_record()
+        record.with_delay(identity_key=identity_exact).export_record()
 
     @skip_if(lambda self, record, **kwargs: self.no_connector_export(record))
     def on_record_write(self, record, fields=None):
-        record.with_delay().export_record()
+        record.with_delay(identity_key=identity_exact).export_record()
 
     def on_record_unlink(self, record):
         with record.backend_id.work_on(record._name) as work:
@@ -36,6 +37,6 @@ class MagentoPartnerExportListener(Component):
     @skip_if(lambda self, record, **kwargs: self.no_connector_export(record))
     def on_record_write(self, record, fields=None):
         for binding in record.magento_bind_ids:
-            binding.with_delay().export_record()
+            binding.with_delay(identity_key=identity_exact).export_record()
         for binding in record.magento_address_bind_ids:
-            binding.with_delay().export_record()
+            binding.with_delay(identity_key=identity_exact).export_record()